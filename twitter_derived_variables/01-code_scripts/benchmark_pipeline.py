@@ -0,0 +1,291 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import zlib
+
+import derive_social_media_variables as dsmv
+from synthetic_data import make_tweets, make_profiles
+from geocoding import normalise_token, set_geocoder, lookup_location
+from language_id import identify_languages
+from grammar_service import set_grammar_client
+from feature_cache import set_feature_cache
+from resources import set_resource_cache, warm_resources
+from scheduler import AdaptiveScheduler
+from text_analysis_functions import strip_text, grammar_scores
+from url_bias_checker import url_bias_check
+from real_name_checker import check_names
+from get_tweet_metadata import get_tweet_metadata, get_tweet_metadata_batch
+from get_profile_metadata import get_profile_metadata, get_profile_metadata_batch
+from get_tweet_text_features import (get_language_features, add_batch_text_features, format_tnlp_outputs,
+                                     load_tnlp_models, run_tnlp_models)
+
+#### ---- BENCHMARK SUITE: PIPELINE STAGES AND END-TO-END BATCHES ---- ###
+
+# Times each stage and the whole of process_batch on synthetic data (see synthetic_data), with local
+# stand-ins for the network geocoder, LanguageTool and (optionally) the TweetNLP models, so results
+# are reproducible offline. Results can be saved and compared with a previous run to catch regressions.
+
+#### ---- LOCAL STAND-INS ---- ###
+
+# In place of Nominatim: a fixed table of places, with an optional delay per lookup
+class LocalGeocoder:
+
+    PLACES = {"london": "city", "manchester": "city", "glasgow": "city", "cardiff": "city", "paris": "city",
+              "new york": "city", "uk": "country", "usa": "country", "france": "country",
+              "england": "state", "scotland": "state"}
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def lookup(self, token):
+        if self.latency:
+            time.sleep(self.latency)
+        address_type = self.PLACES.get(normalise_token(token))
+        return {"name": token, "addresstype": address_type} if address_type else None
+
+# In place of the LanguageTool servers (same interface as grammar_service.GrammarClient): flags a few
+# misspellings and sentences not starting with a capital, with an optional delay per request
+class LocalGrammarClient:
+
+    MISSPELLINGS = {"teh", "recieve", "definately", "alot", "wierd"}
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def count_errors(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        counts = []
+        for text in texts:
+            words = text.lower().split()
+            sentences = [sentence.strip() for sentence in text.replace("!", ".").replace("?", ".").split(".")]
+            counts.append(sum(word in self.MISSPELLINGS for word in words) +
+                          sum(1 for sentence in sentences if sentence and sentence[0].islower()))
+        return counts
+
+# In place of the TweetNLP models (same interface as tnlp_server.TNLPClient): outputs derived from a hash
+# of the text, with an optional delay per text
+class LocalTNLPModels:
+
+    TOPICS = ["news_&_social_concern", "sports", "diaries_&_daily_life", "celebrity_&_pop_culture"]
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def run(self, texts, batch_size=None):
+        if self.latency:
+            time.sleep(self.latency * len(texts))
+        return [self.predict(text) for text in texts]
+
+    def predict(self, text):
+        h = zlib.crc32(text.encode("utf-8"))
+        p = (h % 1000) / 1000
+
+        def classify(labels):
+            label = labels[h % len(labels)]
+            return {"label": label, "probability": {other: (p if other == label else (1 - p) / (len(labels) - 1))
+                                                    for other in labels}}
+
+        topic = self.TOPICS[h % len(self.TOPICS)]
+        topics = {"label": [topic], "probability": {label: (p if label == topic else 0.1) for label in self.TOPICS}}
+        entities = [{"type": "person", "probability": p}] * (h % 3)
+        return format_tnlp_outputs(topics, classify(["negative", "neutral", "positive"]), classify(["non_irony", "irony"]),
+                                   classify(["non-offensive", "offensive"]), classify(["joy", "anger", "sadness", "optimism"]),
+                                   classify(["NOT-HATE", "HATE"]), entities)
+
+# Install the stand-ins in this process (also the pool initializer for end-to-end benchmarks)
+def init_benchmark_worker(function_type, geocode_latency=0.0, grammar_latency=0.0, tnlp_latency=0.0,
+                          models="local", resource_cache=None):
+    dsmv.tnlp_models = LocalTNLPModels(tnlp_latency) if models == "local" else load_tnlp_models()
+    set_geocoder(LocalGeocoder(geocode_latency))
+    set_grammar_client(LocalGrammarClient(grammar_latency))
+    set_feature_cache(None)  # Repeated runs would otherwise only measure cache hits
+    set_resource_cache(resource_cache)
+    warm_resources(function_type, grammar=False)
+
+#### ---- TIMING ---- ###
+
+# Best and median of repeated runs, after one warm-up run
+def measure(function, repeat):
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), statistics.median(timings)
+
+def result(suite, name, rows, timings):
+    best, median = timings
+    return {"suite": suite, "name": name, "rows": rows, "best_s": round(best, 4), "median_s": round(median, 4),
+            "rows_per_second": round(rows / best, 1) if best else None}
+
+#### ---- SUITES ---- ###
+
+# Each stage on its own, in this process
+def stage_benchmarks(tweets, profiles, inference_batch_size, repeat):
+    tnlp_models = dsmv.tnlp_models
+    texts = tweets["tweet_text"].tolist()
+    stripped = [text for text in map(strip_text, texts) if text]
+    descriptions = [text for text in profiles["description"].tolist() if text]
+    display_names = profiles["display_name"].tolist()
+    url_lists = [expanded_urls(value) for value in tweets["entities_urls"].tolist()]
+    location_tokens = [token.strip() for location in profiles["location"].tolist() if location
+                       for token in location.replace("/", ",").split(",") if token.strip()]
+
+    # Rows with deferred text features, copied for each run (the batch stage consumes them)
+    deferred_tweets = tweets.apply(get_tweet_metadata, axis=1, args=(None,)).tolist()
+    deferred_profiles = profiles.apply(get_profile_metadata, axis=1, args=(None,)).tolist()
+
+    stages = {
+        "strip_text": (len(texts), lambda: [strip_text(text) for text in texts]),
+        "textstat": (len(stripped), lambda: [get_language_features(text) for text in stripped]),
+        "grammar_scores": (len(stripped), lambda: grammar_scores(stripped)),
+        "tnlp_models": (len(stripped), lambda: run_tnlp_models(stripped, tnlp_models, batch_size=inference_batch_size)),
+        "url_bias_check": (len(url_lists), lambda: [url_bias_check(urls) for urls in url_lists]),
+        "check_names": (len(display_names), lambda: [check_names(name) for name in display_names]),
+        "language_id": (len(descriptions), lambda: identify_languages(descriptions)),
+        "geocode": (len(location_tokens), lambda: [lookup_location(token) for token in location_tokens]),
+        "tweet_metadata (deferred)": (len(tweets), lambda: tweets.apply(get_tweet_metadata, axis=1, args=(None,))),
+        "tweet_metadata_batch (deferred)": (len(tweets), lambda: get_tweet_metadata_batch(tweets, None)),
+        "profile_metadata (deferred)": (len(profiles), lambda: profiles.apply(get_profile_metadata, axis=1, args=(None,))),
+        "profile_metadata_batch (deferred)": (len(profiles), lambda: get_profile_metadata_batch(profiles, None)),
+        "batch_text_features (tweets)": (len(tweets), lambda: add_batch_text_features(
+            [dict(row) for row in deferred_tweets if row], tnlp_models)),
+        "batch_text_features (profiles)": (len(profiles), lambda: add_batch_text_features(
+            [dict(row) for row in deferred_profiles if row], tnlp_models)),
+    }
+
+    results = []
+    for name, (rows, function) in stages.items():
+        results.append(result("stage", name, rows, measure(function, repeat)))
+        print_result(results[-1])
+    return results
+
+# Expanded URLs as extracted in get_tweet_metadata
+def expanded_urls(entities_urls):
+    return re.findall(r"'expanded_url': '([^']+)'", entities_urls) if entities_urls else []
+
+# process_batch over the whole dataset, for each batch size and number of processes (and with batches
+# cut by the adaptive scheduler, if target_seconds is given)
+def end_to_end_benchmarks(function_type, df, batch_sizes, nprocs, inference_batch_size, worker_args, repeat,
+                          target_seconds=None):
+    results = []
+    for nproc in nprocs:
+        # Pool start-up (model loading) is excluded: the workers are warmed by a first run
+        with multiprocessing.Pool(processes=nproc, initializer=init_benchmark_worker,
+                                  initargs=(function_type, *worker_args)) as pool:
+            for batch_size in batch_sizes:
+                batches = [(df.iloc[start:start + batch_size], function_type, None, False, inference_batch_size,
+                            (start, min(start + batch_size, len(df)) - 1)) for start in range(0, len(df), batch_size)]
+
+                def run():
+                    for batch_result in pool.imap_unordered(dsmv.process_batch, batches):
+                        if batch_result["status"] == dsmv.FAILED:
+                            raise RuntimeError(f"Batch {batch_result['batch_range']} failed: {batch_result['error']}")
+
+                results.append(result(f"end_to_end_{function_type}", f"batch_size={batch_size} nproc={nproc}",
+                                      len(df), measure(run, repeat)))
+                print_result(results[-1])
+
+            if target_seconds:
+                # The scheduler keeps learning across the warm-up and timed runs, as it would over a long run
+                scheduler = AdaptiveScheduler(function_type, target_seconds)
+
+                def run_adaptive():
+                    batches = [(df.iloc[first:last + 1], function_type, None, False, inference_batch_size, (first, last))
+                               for first, last in scheduler.split(df, 0)]
+                    for batch_result in pool.imap_unordered(dsmv.process_batch, batches):
+                        if batch_result["status"] == dsmv.FAILED:
+                            raise RuntimeError(f"Batch {batch_result['batch_range']} failed: {batch_result['error']}")
+                        scheduler.observe(batch_result["batch_range"], batch_result["seconds"])
+
+                results.append(result(f"end_to_end_{function_type}", f"target={target_seconds}s nproc={nproc}",
+                                      len(df), measure(run_adaptive, repeat)))
+                print_result(results[-1])
+    return results
+
+#### ---- REPORTING ---- ###
+
+def print_result(row):
+    rows_per_second = "n/a" if row["rows_per_second"] is None else row["rows_per_second"]  # None when too fast to time
+    print(f"{row['suite']:<20}{row['name']:<34}{row['rows']:>8}{row['best_s'] * 1000:>12.1f} ms"
+          f"{row['median_s'] * 1000:>12.1f} ms{rows_per_second:>12} rows/s")
+
+def environment():
+    return {"python": sys.version.split()[0], "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+# Benchmarks slower than the baseline by more than threshold (e.g. 0.1 for 10%)
+def find_regressions(results, baseline, threshold):
+    previous = {(row["suite"], row["name"], row["rows"]): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        before = previous.get((row["suite"], row["name"], row["rows"]))
+        if before and row["best_s"] > before["best_s"] * (1 + threshold):
+            regressions.append((row, before))
+    return regressions
+
+# MAIN ENTRY POINT
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages and process_batch on synthetic data.")
+    parser.add_argument('--suite', type=str, default="all", choices=["all", "stages", "end_to_end"], help='Benchmarks to run')
+    parser.add_argument('--type', type=str, default="both", choices=["both", "profile", "tweet"], help='Data type for end-to-end runs')
+    parser.add_argument('--rows', type=int, default=1000, help='Synthetic rows of each type')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+    parser.add_argument('--batch_sizes', type=str, default="10,100,1000", help='Comma-separated batch sizes')
+    parser.add_argument('--nproc', type=str, default="1,2,4", help='Comma-separated numbers of processes')
+    parser.add_argument('--inference_batch_size', type=int, default=32, help='Batched inference size (0: per row)')
+    parser.add_argument('--target_batch_seconds', type=float, default=None,
+                        help='Also run end-to-end with batches cut by the adaptive scheduler to this many seconds')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per benchmark (best and median reported)')
+    parser.add_argument('--models', type=str, default="local", choices=["local", "tweetnlp"],
+                        help='Stand-in models, or the real TweetNLP models')
+    parser.add_argument('--tnlp_ms', type=float, default=0.0, help='Simulated stand-in model time per text (ms)')
+    parser.add_argument('--grammar_ms', type=float, default=0.0, help='Simulated LanguageTool time per request (ms)')
+    parser.add_argument('--geocode_ms', type=float, default=0.0, help='Simulated geocoder time per lookup (ms)')
+    parser.add_argument('--resource_cache', type=str, default=None, help='Directory of prebuilt serialized resources')
+    parser.add_argument('--output', type=str, default=None, help='Save results as JSON')
+    parser.add_argument('--compare', type=str, default=None, help='Previous results JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Slowdown counted as a regression (0.1 = 10%%)')
+
+    args = parser.parse_args()
+
+    worker_args = (args.geocode_ms / 1000, args.grammar_ms / 1000, args.tnlp_ms / 1000, args.models, args.resource_cache)
+    types = ["tweet", "profile"] if args.type == "both" else [args.type]
+    data = {"tweet": make_tweets(args.rows, seed=args.seed), "profile": make_profiles(args.rows, seed=args.seed)}
+
+    print(f"[INFO] {args.rows} synthetic rows per type, {args.repeat} runs per benchmark")
+    results = []
+    if args.suite in ("all", "stages"):
+        init_benchmark_worker("profile", *worker_args)
+        warm_resources("tweet", grammar=False)
+        results += stage_benchmarks(data["tweet"], data["profile"], args.inference_batch_size or None, args.repeat)
+
+    if args.suite in ("all", "end_to_end"):
+        batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+        nprocs = [int(nproc) for nproc in args.nproc.split(",")]
+        for function_type in types:
+            results += end_to_end_benchmarks(function_type, data[function_type], batch_sizes, nprocs,
+                                             args.inference_batch_size or None, worker_args, args.repeat,
+                                             target_seconds=args.target_batch_seconds)
+
+    report = {"environment": environment(), "arguments": vars(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = find_regressions(results, json.load(f), args.threshold)
+        for row, before in regressions:
+            print(f"[REGRESSION] {row['suite']} {row['name']}: {before['best_s']}s -> {row['best_s']}s")
+        if regressions:
+            sys.exit(1)
+        print(f"[INFO] No regressions beyond {args.threshold:.0%} of {args.compare}")
@@ -0,0 +1,50 @@
+import argparse
+import random
+import timeit
+import tldextract as tlde
+
+from url_bias_checker import get_mbfc, url_bias_check, url_bias_check_batch, extract_domain
+
+#### ---- MICROBENCHMARK: MBFC URL BIAS LOOKUP ---- ###
+
+# Previous implementation: scan the MBFC table for every tweet (matches in table order, repeats lost)
+def url_bias_check_scan(urls):
+    mbfc = get_mbfc()["table"]
+    domains = [tlde.extract(url).domain for url in urls]
+    matches = mbfc[mbfc['domain'].isin(domains)]
+    return {'bias': matches['bias_mean'].tolist(), 'credibility': matches['factual_reporting_mean'].tolist()}
+
+# Synthetic expanded_urls lists: a mix of MBFC and unrated domains, with repeated links
+def make_url_lists(n_lists, max_urls, seed=0):
+    rng = random.Random(seed)
+    rated = get_mbfc()["table"]['url'].tolist()
+    unrated = [f"https://www.example{i}.com/" for i in range(200)]
+    pool = [f"{url.rstrip('/')}/article/{rng.randrange(50)}" for url in rated * 2 + unrated * 4]
+    return [rng.sample(pool, rng.randint(0, max_urls)) for _ in range(n_lists)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Microbenchmark of the MBFC URL bias lookup.")
+    parser.add_argument('--lists', type=int, default=5000, help='Number of tweets (URL lists)')
+    parser.add_argument('--max_urls', type=int, default=3, help='Maximum URLs per tweet')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repeats (best is reported)')
+
+    args = parser.parse_args()
+
+    url_lists = make_url_lists(args.lists, args.max_urls)
+
+    # Per-URL semantics: the batch API agrees with the per-tweet function
+    assert url_bias_check_batch(url_lists) == [url_bias_check(urls) for urls in url_lists]
+
+    timings = {
+        "table scan (previous)": lambda: [url_bias_check_scan(urls) for urls in url_lists],
+        "per tweet, cold cache": lambda: (extract_domain.cache_clear(), [url_bias_check(urls) for urls in url_lists]),
+        "per tweet, warm cache": lambda: [url_bias_check(urls) for urls in url_lists],
+        "batch, cold cache": lambda: (extract_domain.cache_clear(), url_bias_check_batch(url_lists)),
+        "batch, warm cache": lambda: url_bias_check_batch(url_lists),
+    }
+
+    print(f"{args.lists} tweets, up to {args.max_urls} URLs each")
+    for name, function in timings.items():
+        function()  # Warm up
+        best = min(timeit.repeat(function, number=1, repeat=args.repeat))
+        print(f"{name:<28}{best * 1000:>10.1f} ms{best / args.lists * 1e6:>10.1f} us/tweet")
@@ -0,0 +1,64 @@
+import argparse
+import sys
+import time
+import pandas as pd
+
+from input_readers import read_input_columns
+from text_analysis_functions import strip_text, score_grammar_errors
+from grammar_service import GrammarClient, start_grammar_servers, grammar_server_urls, stop_grammar_servers
+
+#### ---- REPORT: BATCHED LANGUAGETOOL REQUESTS vs ONE TEXT PER REQUEST ---- ###
+
+# Scores the same stripped texts against one real LanguageTool server, once per text through
+# language_tool_python (as the per-process LanguageTool does) and with texts concatenated into requests of
+# up to --batch_chars characters (as GrammarClient does with --grammar_batch_chars), and lists the texts
+# whose grammar_score differs.
+# Run it before setting --grammar_batch_chars: rules that look across paragraphs can see neighbouring texts.
+
+# Text column of each data type
+TEXT_COLUMNS = {
+    "tweet": "tweet_text",
+    "profile": "description"
+}
+
+# Grammar scores of the texts from their error counts, and the seconds taken to count them
+def timed_scores(count_errors, texts):
+    start = time.perf_counter()
+    counts = count_errors(texts)
+    return [score_grammar_errors(text, count) for text, count in zip(texts, counts)], time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check that batched LanguageTool requests give the same grammar scores as one text per request.")
+    parser.add_argument('--input', type=str, required=True, help='Path to input file (.pkl, .parquet, .arrow/.feather or .jsonl)')
+    parser.add_argument('--type', type=str, required=True, choices=["profile", "tweet"], help='Data type')
+    parser.add_argument('--rows', type=int, default=2000, help='Number of input rows whose distinct texts are scored')
+    parser.add_argument('--batch_chars', type=int, default=20000, help='Characters of text per batched request')
+    parser.add_argument('--report', type=str, default="grammar_parity_report.csv", help='Texts whose scores differ')
+
+    args = parser.parse_args()
+
+    # The distinct stripped texts the pipeline would score
+    column = TEXT_COLUMNS[args.type]
+    values = read_input_columns(args.input, [column])[column].iloc[:args.rows].tolist()
+    texts = list(dict.fromkeys(text for text in (strip_text(value) for value in values if isinstance(value, str))
+                               if text.strip()))
+
+    tools = start_grammar_servers(1)
+    try:
+        url = grammar_server_urls(tools)[0]
+        # As the per-process LanguageTool checks each text (see text_analysis_functions.count_grammar_errors)
+        per_text, per_text_seconds = timed_scores(lambda texts: [len(tools[0].check(text)) for text in texts], texts)
+        batched, batched_seconds = timed_scores(GrammarClient([url], batch_chars=args.batch_chars).count_errors, texts)
+    finally:
+        stop_grammar_servers(tools)
+
+    differences = pd.DataFrame([{"text": text, "per_text_score": expected, "batched_score": actual}
+                                for text, expected, actual in zip(texts, per_text, batched) if expected != actual])
+    differences.to_csv(args.report, index=False)
+
+    print(f"[INFO] {len(texts)} texts: {per_text_seconds:.1f}s one per request, {batched_seconds:.1f}s in requests "
+          f"of up to {args.batch_chars} characters ({per_text_seconds / batched_seconds:.2f}x)")
+    if len(differences):
+        print(f"[ERROR] {len(differences)} texts scored differently (see {args.report}); keep --grammar_batch_chars 0")
+        sys.exit(1)
+    print(f"[INFO] Every grammar_score matches; --grammar_batch_chars {args.batch_chars} is safe for this data")
\ No newline at end of file
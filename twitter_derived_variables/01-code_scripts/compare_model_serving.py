@@ -0,0 +1,83 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import pandas as pd
+
+import derive_social_media_variables as dsmv
+from tnlp_server import start_model_server, stop_model_server
+from instrumentation import get_rss_mb
+
+#### ---- REPORT: PER-PROCESS MODELS vs SHARED MODEL SERVER ---- ###
+
+# Sample the total RSS of all child processes (pool workers and model server) until stopped
+def sample_rss(samples, stop_event, interval=0.5):
+    while not stop_event.is_set():
+        samples.append(sum(get_rss_mb(child.pid) for child in multiprocessing.active_children()))
+        time.sleep(interval)
+
+# Run the pipeline in one mode and return memory/throughput figures
+def run_mode(mode, batches, num_processes, inference_batch_size):
+    server = None
+    init_args = ()
+    if mode == "server":
+        server = start_model_server(batch_size=inference_batch_size)
+        init_args = (server[1:],)
+
+    samples = []
+    stop_event = threading.Event()
+    sampler = threading.Thread(target=sample_rss, args=(samples, stop_event), daemon=True)
+
+    try:
+        start = time.perf_counter()
+        with multiprocessing.Pool(processes=num_processes, initializer=dsmv.init_models, initargs=init_args) as pool:
+            sampler.start()
+            list(pool.imap_unordered(dsmv.process_batch, batches))
+            elapsed = time.perf_counter() - start
+    finally:
+        stop_event.set()
+        if server is not None:
+            stop_model_server(*server)
+
+    rows = sum(len(batch[0]) for batch in batches)
+    return {
+        "mode": mode,
+        "processes": num_processes,
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(rows / elapsed, 2),
+        "peak_rss_mb": round(max(samples, default=0.0), 1),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare memory and throughput of per-process TweetNLP models against the shared model server.")
+    parser.add_argument('--input', type=str, required=True, help='Path to input .pkl file')
+    parser.add_argument('--type', type=str, required=True, choices=["profile", "tweet"], help='Data type')
+    parser.add_argument('--rows', type=int, default=500, help='Number of rows to process in each mode')
+    parser.add_argument('--batch_size', type=int, default=10, help='Rows per batch')
+    parser.add_argument('--inference_batch_size', type=int, default=32, help='TweetNLP inference batch size')
+    parser.add_argument('--nproc', type=int, default=None, help='Number of processes to use')
+    parser.add_argument('--report', type=str, default="model_serving_report.csv", help='Output report path')
+
+    args = parser.parse_args()
+
+    df = pd.read_pickle(args.input).iloc[:args.rows]
+    num_processes = args.nproc or max(1, multiprocessing.cpu_count() - 1)
+
+    report = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        batches = []
+        for batch_start in range(0, len(df), args.batch_size):
+            batch_df = df.iloc[batch_start:batch_start + args.batch_size].copy()
+            file_path = os.path.join(output_dir, f"rows_{batch_start}.csv")
+            batch_range = (batch_start, batch_start + len(batch_df) - 1)
+            batches.append((batch_df, args.type, file_path, False, args.inference_batch_size, batch_range))
+
+        for mode in ["per_process", "server"]:
+            report.append(run_mode(mode, batches, num_processes, args.inference_batch_size))
+
+    report = pd.DataFrame(report)
+    report.to_csv(args.report, index=False)
+    print(report.to_string(index=False))
@@ -0,0 +1,114 @@
+import argparse
+import multiprocessing
+import time
+import numpy as np
+import pandas as pd
+
+from input_readers import read_input_columns
+from text_analysis_functions import strip_text
+from get_tweet_text_features import load_tnlp_models, run_tnlp_models
+from tnlp_backends import TNLP_BACKENDS, make_tnlp_backend
+
+#### ---- REPORT: TWEETNLP BACKEND THROUGHPUT AND AGREEMENT ---- ###
+
+# Runs the TweetNLP models over the same stripped texts with each backend, and compares each backend's
+# labels and probabilities with those of the PyTorch models (the outputs so far). Probabilities are only
+# compared where the labels agree, as they are the probability of the label.
+
+# Single-label variables, each with a "_prob" probability
+LABEL_VARIABLES = ["sentiment", "irony", "offensive", "emotion", "hate"]
+
+# Text column of each data type
+TEXT_COLUMNS = {
+    "tweet": "tweet_text",
+    "profile": "description"
+}
+
+# Load one backend's models and run them over the texts; returns (outputs, timings)
+def run_backend(backend_name, texts, batch_size, model_dir, threads):
+    backend = make_tnlp_backend(backend_name, model_dir=model_dir, threads=threads)
+    if backend is not None:
+        backend.export()  # Not timed: once per model directory
+
+    start = time.perf_counter()
+    tnlp_models = load_tnlp_models(backend)
+    loaded = time.perf_counter()
+    outputs = run_tnlp_models(texts, tnlp_models, batch_size=batch_size)
+    elapsed = time.perf_counter() - loaded
+
+    return outputs, {
+        "backend": backend_name,
+        "load_seconds": round(loaded - start, 2),
+        "seconds": round(elapsed, 2),
+        "texts_per_second": round(len(texts) / elapsed, 2),
+    }
+
+# Label agreement and probability differences of one variable, from (labels agree, [probability differences])
+# for each text
+def summarise(variable, comparisons):
+    agreed = [agree for agree, _ in comparisons]
+    differences = [difference for agree, row_differences in comparisons if agree for difference in row_differences]
+    return {
+        "variable": variable,
+        "label_agreement": round(float(np.mean(agreed)), 4) if agreed else None,
+        "mean_abs_prob_diff": round(float(np.mean(differences)), 5) if differences else None,
+        "max_abs_prob_diff": round(float(np.max(differences)), 5) if differences else None,
+    }
+
+# Agreement of a backend's outputs with the reference outputs, per variable
+def agreement(reference, outputs):
+    report = []
+    for variable in LABEL_VARIABLES:
+        report.append(summarise(variable, [
+            (expected[variable] == actual[variable], [abs(expected[f"{variable}_prob"] - actual[f"{variable}_prob"])])
+            for expected, actual in zip(reference, outputs)]))
+
+    # Topics: the same set of topics, with the probability of each
+    report.append(summarise("topics", [
+        (set(expected["topics"]) == set(actual["topics"]),
+         [abs(expected["topic_prob"][topic] - actual["topic_prob"][topic]) for topic in expected["topics"]
+          if topic in actual["topic_prob"]])
+        for expected, actual in zip(reference, outputs)]))
+
+    # Named entities: the same entity types in the same order, with the probability of each
+    report.append(summarise("entity_types", [
+        (expected["entity_types"] == actual["entity_types"],
+         [abs(p - q) for p, q in zip(expected["entity_prob"], actual["entity_prob"])])
+        for expected, actual in zip(reference, outputs)]))
+
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare throughput and label agreement of the TweetNLP backends against the PyTorch models.")
+    parser.add_argument('--input', type=str, required=True, help='Path to input file (.pkl, .parquet, .arrow/.feather or .jsonl)')
+    parser.add_argument('--type', type=str, required=True, choices=["profile", "tweet"], help='Data type')
+    parser.add_argument('--rows', type=int, default=2000, help='Number of input rows whose distinct texts are scored')
+    parser.add_argument('--inference_batch_size', type=int, default=32, help='TweetNLP inference batch size')
+    parser.add_argument('--backends', type=str, nargs='+', default=["onnx", "onnx_int8"],
+                        choices=[backend for backend in TNLP_BACKENDS if backend != "torch"], help='Backends to compare with PyTorch')
+    parser.add_argument('--onnx_dir', type=str, default="tnlp_onnx", help='Directory of the exported ONNX models')
+    parser.add_argument('--onnx_threads', type=int, default=None, help='ONNX Runtime intra-op threads (default: all cores)')
+    parser.add_argument('--report', type=str, default="tnlp_backend_report.csv", help='Output report path')
+
+    args = parser.parse_args()
+
+    # The distinct stripped texts the pipeline would score
+    column = TEXT_COLUMNS[args.type]
+    values = read_input_columns(args.input, [column])[column].iloc[:args.rows].tolist()
+    texts = list(dict.fromkeys(text for text in (strip_text(value) for value in values if isinstance(value, str)) if text))
+    threads = args.onnx_threads or multiprocessing.cpu_count()
+
+    reference, torch_timings = run_backend("torch", texts, args.inference_batch_size, args.onnx_dir, threads)
+    print(f"[INFO] torch: {torch_timings['texts_per_second']} texts/s over {len(texts)} texts")
+
+    report = []
+    for backend_name in args.backends:
+        outputs, timings = run_backend(backend_name, texts, args.inference_batch_size, args.onnx_dir, threads)
+        speedup = round(timings["texts_per_second"] / torch_timings["texts_per_second"], 2)
+        print(f"[INFO] {backend_name}: {timings['texts_per_second']} texts/s ({speedup}x torch)")
+        for row in agreement(reference, outputs):
+            report.append({**timings, "speedup": speedup, "texts": len(texts), **row})
+
+    report = pd.DataFrame(report)
+    report.to_csv(args.report, index=False)
+    print(report.to_string(index=False))
\ No newline at end of file
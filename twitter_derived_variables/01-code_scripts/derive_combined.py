@@ -0,0 +1,244 @@
+import argparse
+import itertools
+import multiprocessing
+import threading
+import pandas as pd
+from tqdm import tqdm
+
+import derive_social_media_variables as dsmv
+from tnlp_server import start_model_server, stop_model_server
+from tnlp_backends import TNLP_BACKENDS, make_tnlp_backend
+from input_readers import open_input_batches, bounded
+from geocoding import make_geocoder, set_geocoder, start_geocode_broker, stop_geocode_broker
+from language_id import make_language_identifier, set_language_identifier
+from resources import set_resource_cache, warm_resources
+from run_manifest import RunManifest, manifest_path, DONE, FAILED
+from feature_cache import FeatureCache
+from get_tweet_text_features import language_feature_version
+from grammar_service import GrammarClient, start_grammar_servers, grammar_server_urls, stop_grammar_servers
+from instrumentation import stage
+from user_aggregates import UserAggregates, write_summary
+
+#### ---- COMBINED PROFILE AND TWEET RUN ---- ###
+
+# Streams a profile input and a tweet input through one worker pool, so that the models and resources
+# are loaded once for both, and aggregates the rows of each ID as the batches complete (see
+# user_aggregates). Writes the row-level variables under {file_path}_profiles and {file_path}_tweets,
+# as derive_social_media_variables.py would with those prefixes (each with its own run manifest), and
+# the user-level summary to {file_path}_users.csv (.parquet with columnar outputs), with the
+# accumulators in {file_path}_users.pkl to merge with those of other runs.
+
+# Output prefix of each data type
+def type_prefix(file_path, function_type):
+    return f"{file_path}_{function_type}s"
+
+# INITIALIZER: the models and the resources of both pipelines, ONCE per process
+def init_combined(init_kwargs):
+    dsmv.init_models(function_type="profile", **init_kwargs)
+    warm_resources("tweet", grammar=False, tweet_language=init_kwargs["detect_tweet_language"])
+
+# process_batch, also aggregating the batch's rows by ID (before they are written, or sent back to the
+# main process for a columnar output)
+def process_combined_batch(batch_args):
+    batch_df, function_type, file_path, *rest = batch_args
+    result = dsmv.process_batch((batch_df, function_type, None, *rest))
+    result.update(type=function_type, aggregates=None)
+    if result["status"] == FAILED:
+        return result
+
+    row_start, row_end = result["batch_range"]
+    try:
+        with stage("aggregate"):
+            result["aggregates"] = UserAggregates.from_rows(function_type, result["rows"])
+        if file_path is not None:
+            with stage("write_csv"):
+                pd.DataFrame(result["rows"]).to_csv(file_path, index=False)
+            result.update(status=DONE, output=file_path, rows=None)
+    except Exception as e:
+        print(f"[ERROR] Failed on rows {row_start} to {row_end}: {e}")
+        result.update(status=FAILED, error=f"{type(e).__name__}: {str(e)}", rows=None, aggregates=None)
+    return result
+
+# Alternate between the batches of several inputs, so that both progress together
+def interleave(*iterators):
+    for items in itertools.zip_longest(*iterators):
+        yield from (item for item in items if item is not None)
+
+# MAIN ENTRY POINT
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Profile and tweet feature extraction in one run, with a user-level summary.")
+    parser.add_argument('--profile_input', type=str, required=True, help='Profile input file (.pkl, .parquet, .arrow/.feather or .jsonl)')
+    parser.add_argument('--tweet_input', type=str, required=True, help='Tweet input file (.pkl, .parquet, .arrow/.feather or .jsonl)')
+    parser.add_argument('--file_path', type=str, required=True, help='Output file path prefix (no extension)')
+    parser.add_argument('--batch_size', type=int, default=10, help='Rows per batch')
+    parser.add_argument('--verbose', action='store_true', help='Enable verbose output')
+    parser.add_argument('--nproc', type=int, default=None, help='Number of processes to use')
+    parser.add_argument('--inference_batch_size', type=int, default=None,
+                        help='Run TweetNLP once per batch with this inference batch size (default: per row)')
+    parser.add_argument('--model_server', action='store_true',
+                        help='Load TweetNLP models once in a server process shared by all workers')
+    parser.add_argument('--tnlp_backend', type=str, default="torch", choices=TNLP_BACKENDS,
+                        help='Run TweetNLP as PyTorch models, or through ONNX Runtime (full precision, or with int8 quantised weights)')
+    parser.add_argument('--onnx_dir', type=str, default="tnlp_onnx", help='Directory of the exported ONNX models')
+    parser.add_argument('--onnx_threads', type=int, default=None, help='ONNX Runtime intra-op threads per process')
+    parser.add_argument('--output_format', type=str, default="csv", choices=["csv", "parquet", "arrow"],
+                        help='One CSV per batch, or a single Parquet dataset / Arrow file with a manifest, for each type')
+    parser.add_argument('--geocoder', type=str, default="nominatim", choices=["nominatim", "gazetteer"],
+                        help='Location lookups from the live Nominatim service or an offline gazetteer')
+    parser.add_argument('--gazetteer', type=str, default=None,
+                        help='Gazetteer index (.pkl from gazetteer.py) or GeoNames dump, for --geocoder gazetteer')
+    parser.add_argument('--geocode_cache', type=str, default="geocode_cache.sqlite",
+                        help='SQLite cache of location lookups shared across workers and runs ("" to disable)')
+    parser.add_argument('--language_id', type=str, default="langdetect", choices=["langdetect", "langid", "fasttext"],
+                        help='Language identification of descriptions (and tweets)')
+    parser.add_argument('--language_model', type=str, default=None,
+                        help='fastText language identification model (e.g. lid.176.ftz), for --language_id fasttext')
+    parser.add_argument('--tweet_language', action='store_true',
+                        help='Also identify the language of each tweet text (post_language_detected)')
+    parser.add_argument('--resource_cache', type=str, default=None,
+                        help='Directory of prebuilt serialized resources (name index, MBFC table), built on first use')
+    parser.add_argument('--grammar_servers', type=int, default=0,
+                        help='Shared LanguageTool servers for all workers (default 0: one per worker)')
+    parser.add_argument('--grammar_batch_chars', type=int, default=0,
+                        help='Characters of text sent per LanguageTool request in grammar server mode '
+                             '(default 0: one text per request; see compare_grammar_service.py)')
+    parser.add_argument('--feature_cache', type=str, default=None,
+                        help='SQLite cache of text features keyed on the stripped text, shared across workers and runs '
+                             '(e.g. {file_path}_features.sqlite; default: no cache)')
+    parser.add_argument('--feature_cache_mb', type=int, default=2048,
+                        help='Size of the feature cache before least recently used entries are evicted')
+    parser.add_argument('--max_pending_batches', type=int, default=None,
+                        help='Maximum batches read ahead of the workers (default: 2 x nproc)')
+
+    args = parser.parse_args()
+
+    if args.geocoder == "gazetteer" and not args.gazetteer:
+        parser.error("--geocoder gazetteer requires --gazetteer")
+    if args.language_id == "fasttext" and not args.language_model:
+        parser.error("--language_id fasttext requires --language_model")
+
+    num_processes = args.nproc or max(1, multiprocessing.cpu_count() - 1)
+    max_pending = args.max_pending_batches or 2 * num_processes
+    inputs = {"profile": args.profile_input, "tweet": args.tweet_input}
+    prefixes = {function_type: type_prefix(args.file_path, function_type) for function_type in inputs}
+
+    # A run manifest for each type's outputs
+    manifests = {function_type: RunManifest(manifest_path(prefix)) for function_type, prefix in prefixes.items()}
+    for manifest in manifests.values():
+        manifest.start_run(vars(args))
+
+    # Read both inputs lazily, alternating between their batches
+    streams = []
+    total_batches = 0
+    for function_type, path in inputs.items():
+        input_batches, type_batches = open_input_batches(path, args.batch_size)
+        total_batches = None if type_batches is None or total_batches is None else total_batches + type_batches
+
+        def make_batches(function_type=function_type, input_batches=input_batches):
+            for batch_start, batch_df in input_batches:
+                batch_range = (batch_start, batch_start + len(batch_df) - 1)
+                file_path = None
+                if args.output_format == "csv":
+                    file_path = f"{prefixes[function_type]}_rows_{batch_range[0]}_to_{batch_range[1]}.csv"
+                yield (batch_df, function_type, file_path, args.verbose, args.inference_batch_size, batch_range)
+
+        streams.append(make_batches())
+
+    pending = threading.BoundedSemaphore(max_pending)
+    batches = bounded(interleave(*streams), pending)
+
+    if args.verbose:
+        print(f"[INFO] Using {num_processes} processes to handle {total_batches or 'streamed'} profile and tweet batches...")
+
+    # The same models, servers and caches as derive_social_media_variables.py, shared by both types
+    tnlp_backend = make_tnlp_backend(args.tnlp_backend, model_dir=args.onnx_dir,
+                                     threads=args.onnx_threads or max(1, multiprocessing.cpu_count() //
+                                                                      (1 if args.model_server else num_processes)))
+    if tnlp_backend is not None:
+        tnlp_backend.export()
+
+    server = None
+    if args.model_server:
+        server = start_model_server(batch_size=args.inference_batch_size, tnlp_backend=tnlp_backend)
+
+    broker = None
+    if args.geocoder == "nominatim":
+        broker = start_geocode_broker(cache_path=args.geocode_cache)
+
+    geocoder = make_geocoder(args.geocoder, cache_path=args.geocode_cache,
+                             broker=broker[1:] if broker else None, gazetteer_path=args.gazetteer)
+    language_identifier = make_language_identifier(args.language_id, model_path=args.language_model)
+
+    set_geocoder(geocoder)
+    set_language_identifier(language_identifier)
+    set_resource_cache(args.resource_cache)
+    warm_resources("profile", grammar=False)
+    warm_resources("tweet", grammar=False, tweet_language=args.tweet_language)
+
+    grammar_tools = []
+    grammar_client = None
+    if args.grammar_servers:
+        grammar_tools = start_grammar_servers(args.grammar_servers)
+        grammar_client = GrammarClient(grammar_server_urls(grammar_tools), batch_chars=args.grammar_batch_chars)
+
+    feature_cache = None
+    if args.feature_cache:
+        feature_cache = FeatureCache(args.feature_cache, language_feature_version(tnlp_backend, args.grammar_servers, args.grammar_batch_chars),
+                                     max_mb=args.feature_cache_mb)
+
+    init_kwargs = {"model_server": server[1:] if server else None, "geocoder": geocoder,
+                   "resource_cache": args.resource_cache, "grammar_client": grammar_client, "feature_cache": feature_cache,
+                   "language_identifier": language_identifier, "detect_tweet_language": args.tweet_language,
+                   "tnlp_backend": tnlp_backend}
+
+    # A single consolidated output for each type, written by this process
+    writers = {}
+    if args.output_format != "csv":
+        from output_writers import open_output_writer
+        for function_type, prefix in prefixes.items():
+            writers[function_type] = open_output_writer(args.output_format, prefix, function_type)
+            writers[function_type].on_flush = manifests[function_type].mark_done
+
+    aggregates = UserAggregates()
+    failed_batches = {function_type: 0 for function_type in inputs}
+    all_returned = False  # Every batch returned (not interrupted or crashed)
+    try:
+        with multiprocessing.Pool(processes=num_processes, initializer=init_combined, initargs=(init_kwargs,)) as pool:
+            for result in tqdm(pool.imap_unordered(process_combined_batch, batches), total=total_batches, desc="Processing Batches"):
+                pending.release()
+                function_type = result["type"]
+                failed_batches[function_type] += result["status"] == FAILED
+                writer = writers.get(function_type)
+                manifests[function_type].record(*result["batch_range"], result["status"], seconds=result["seconds"],
+                                                output=result["output"] or (writer.path if writer else None),
+                                                error=result["error"])
+                if writer is not None and result["rows"] is not None:
+                    with stage("write_output"):
+                        writer.write_rows(result["rows"], key=result["batch_range"])
+                if result["aggregates"] is not None:
+                    aggregates.merge(result["aggregates"])
+        all_returned = True
+    finally:
+        if server is not None:
+            stop_model_server(*server)
+        if broker is not None:
+            stop_geocode_broker(*broker)
+        stop_grammar_servers(grammar_tools)
+        for function_type, writer in writers.items():
+            output_manifest = writer.close(completed=all_returned and not failed_batches[function_type])
+            if args.verbose:
+                print(f"[INFO] Wrote {output_manifest['rows_written']} {function_type} rows to {writer.path}")
+        for function_type, manifest in manifests.items():
+            if args.verbose:
+                print(f"[INFO] Run manifest {manifest.path}: {manifest.summary()}")
+            manifest.close()
+
+    # User-level summary, once every batch has completed (a partial one would undercount users' posts)
+    failed = [f"{count} {function_type}" for function_type, count in failed_batches.items() if count]
+    if failed:
+        print(f"[ERROR] Batches failed ({', '.join(failed)}); user summary not written (see the run manifests and rerun)")
+    else:
+        summary_path = f"{args.file_path}_users.{'csv' if args.output_format == 'csv' else 'parquet'}"
+        write_summary(aggregates, summary_path)
+        aggregates.save(f"{args.file_path}_users.pkl")
+        print(f"[INFO] Wrote the summary of {len(aggregates)} IDs to {summary_path}")
\ No newline at end of file
@@ -1,77 +1,467 @@
 import argparse
 import multiprocessing
+import shutil
+import threading
+import time
 import pandas as pd
 from tqdm import tqdm
-import tweetnlp as tnlp
 
 # Load metadata extraction functions
-from get_profile_metadata import get_profile_metadata
-from get_tweet_metadata import get_tweet_metadata
+from get_profile_metadata import get_profile_metadata_batch, location_tokens, add_location_levels
+from get_tweet_metadata import get_tweet_metadata_batch, add_tweet_languages
+from get_tweet_text_features import add_batch_text_features, load_tnlp_models, language_feature_version
+from tnlp_server import TNLPClient, start_model_server, stop_model_server
+from tnlp_backends import TNLP_BACKENDS, make_tnlp_backend
+from input_readers import open_input_batches, read_pickle_input, bounded
+from geocoding import make_geocoder, set_geocoder, start_geocode_broker, stop_geocode_broker
+from geocode_lane import GeocodeLane
+from language_id import make_language_identifier, set_language_identifier
+from resources import set_resource_cache, warm_resources
+from run_manifest import RunManifest, CompletedRanges, manifest_path, DONE, PROCESSED, FAILED
+from feature_cache import FeatureCache, set_feature_cache
+from scheduler import AdaptiveScheduler
+from shard import SHARD_BY, parse_shard, shard_path, in_shard, shard_row_range, input_identity
+from incremental import PIPELINE_REVISION, ROW_KEY, RowIndex, read_row_keys, row_index_path, has_row_keys, merge_update
+from instrumentation import ProfileReport, enable_profiling, get_profiler, stage
+from grammar_service import GrammarClient, set_grammar_client, start_grammar_servers, grammar_server_urls, stop_grammar_servers
 
-# GLOBAL VARIABLE shared in each process (but not across them)
+# GLOBAL VARIABLES shared in each process (but not across them)
 tnlp_models = None
+tweet_language = False  # Identify the language of each tweet's text (--tweet_language)
+defer_locations = False  # Leave location lookups to the I/O lane in the main process (--io_lane)
 
-# INITIALIZER to load models ONCE per process
-def init_models():
-    global tnlp_models
-    model_names = ['topic_classification', 'sentiment', 'irony',
-                   'offensive', 'emotion', 'hate', 'ner']
-    tnlp_models = [tnlp.load_model(name) for name in model_names]
+# INITIALIZER to load models ONCE per process (or connect to a shared model server)
+# model_server is an (address, authkey) pair, or None; geocoder is from geocoding.make_geocoder
+# language_identifier from language_id.make_language_identifier and tnlp_backend from tnlp_backends.make_tnlp_backend
+def init_models(model_server=None, geocoder=None, function_type=None, resource_cache=None, grammar_client=None,
+                feature_cache=None, profile_events=None, language_identifier=None, detect_tweet_language=False,
+                io_lane=False, tnlp_backend=None):
+    global tnlp_models, tweet_language, defer_locations
+    if profile_events is not None:
+        enable_profiling(max_events=profile_events)
+    if model_server is not None:
+        tnlp_models = TNLPClient(*model_server)
+    else:
+        tnlp_models = load_tnlp_models(tnlp_backend)
+    if geocoder is not None:
+        set_geocoder(geocoder)
+    if grammar_client is not None:
+        set_grammar_client(grammar_client)
+    if feature_cache is not None:
+        set_feature_cache(feature_cache)
+    if language_identifier is not None:
+        set_language_identifier(language_identifier)
+    tweet_language = detect_tweet_language
+    defer_locations = io_lane
+
+    # Load only the resources the selected pipeline needs
+    set_resource_cache(resource_cache)
+    if function_type is not None:
+        warm_resources(function_type, tweet_language=tweet_language)
+
+# Metadata dictionaries for each row of a batch (None for skipped rows)
+def get_batch_metadata(batch_df, function_type, tnlp_models):
+
+    # Tweet variables are computed column-wise for the whole batch (see get_tweet_metadata_batch)
+    if function_type == "tweet":
+        return get_tweet_metadata_batch(batch_df, tnlp_models)
+
+    # Profile descriptions are language-identified for the whole batch (see get_profile_metadata_batch)
+    return get_profile_metadata_batch(batch_df, tnlp_models, defer_locations=defer_locations)
 
 # MAIN BATCH FUNCTION
+# batch_range is the (first, last) input row position; returns the batch status for the run manifest
 def process_batch(batch_args):
-    batch_df, function_type, file_path, verbose = batch_args
+    batch_df, function_type, file_path, verbose, inference_batch_size, batch_range = batch_args
 
     row_start = batch_df.index[0]
     row_end = batch_df.index[-1]
 
-    try:
-        if verbose:
-            print(f"[INFO] Processing rows {row_start} to {row_end}...")
+    result = {"batch_range": batch_range, "status": DONE, "output": file_path, "error": None, "rows": None}
+    start_time = time.perf_counter()
+
+    with stage("batch"):
+        try:
+            if verbose:
+                print(f"[INFO] Processing rows {row_start} to {row_end}...")
+
+            if inference_batch_size:
+                # Defer TweetNLP inference, then run each model once over the whole batch
+                rows = get_batch_metadata(batch_df, function_type, None)
+                rows = add_batch_text_features(rows, tnlp_models, batch_size=inference_batch_size)
+            else:
+                rows = get_batch_metadata(batch_df, function_type, tnlp_models)
+
+            if function_type == "tweet" and tweet_language:
+                rows = add_tweet_languages(rows, batch_df)
+
+            # Key of each input row, with --incremental
+            if ROW_KEY in batch_df:
+                for row, key in zip(rows, batch_df[ROW_KEY].tolist()):
+                    if row:
+                        row[ROW_KEY] = key
 
-        function_map = {
-            "profile": get_profile_metadata,
-            "tweet": get_tweet_metadata
-        }
+            # Columnar outputs are written by the main process (see output_writers)
+            if file_path is None:
+                result["status"] = PROCESSED
+                result["rows"] = rows
+            else:
+                with stage("write_csv"):
+                    processed_batch = pd.DataFrame(rows)
+                    processed_batch.to_csv(file_path, index=False)
 
-        function = function_map[function_type]
+        except Exception as e:
+            print(f"[ERROR] Failed on rows {row_start} to {row_end}: {e}")
+            with open("processing_errors.log", "a") as f:
+                f.write(f"{row_start}-{row_end}, {type(e).__name__}: {str(e)}\n")
+            result.update(status=FAILED, error=f"{type(e).__name__}: {str(e)}")
 
-        var_dict = batch_df.apply(function, axis=1, args=(tnlp_models,))
-        processed_batch = pd.DataFrame(var_dict.tolist())
-        processed_batch.to_csv(file_path, index=False)
+    result["seconds"] = round(time.perf_counter() - start_time, 3)
 
-    except Exception as e:
-        print(f"[ERROR] Failed on rows {row_start} to {row_end}: {e}")
-        with open("processing_errors.log", "a") as f:
-            f.write(f"{row_start}-{row_end}, {type(e).__name__}: {str(e)}\n")
+    # Stage timings recorded while processing this batch (with --profile)
+    profiler = get_profiler()
+    result["profile"] = profiler.collect() if profiler is not None else None
+    return result
 
 # MAIN ENTRY POINT
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Batch processor for TweetNLP-based feature extraction.")
-    parser.add_argument('--input', type=str, required=True, help='Path to input .pkl file')
+    parser.add_argument('--input', type=str, required=True, help='Path to input file (.pkl, .parquet, .arrow/.feather or .jsonl)')
     parser.add_argument('--type', type=str, required=True, choices=["profile", "tweet"], help='Data type')
     parser.add_argument('--file_path', type=str, required=True, help='Output file path prefix (no extension)')
-    parser.add_argument('--batch_size', type=int, default=10, help='Rows per batch')
+    parser.add_argument('--batch_size', type=int, default=10,
+                        help='Rows per batch (with --target_batch_seconds: rows read at a time and cut into batches)')
     parser.add_argument('--start_row', type=int, default=0, help='Row to start from')
     parser.add_argument('--verbose', action='store_true', help='Enable verbose output')
     parser.add_argument('--nproc', type=int, default=None, help='Number of processes to use')
+    parser.add_argument('--inference_batch_size', type=int, default=None,
+                        help='Run TweetNLP once per batch with this inference batch size (default: per row)')
+    parser.add_argument('--model_server', action='store_true',
+                        help='Load TweetNLP models once in a server process shared by all workers')
+    parser.add_argument('--tnlp_backend', type=str, default="torch", choices=TNLP_BACKENDS,
+                        help='Run TweetNLP as PyTorch models, or through ONNX Runtime (full precision, or with int8 quantised weights)')
+    parser.add_argument('--onnx_dir', type=str, default="tnlp_onnx",
+                        help='Directory of the exported ONNX models, exported on first use (with --tnlp_backend onnx/onnx_int8)')
+    parser.add_argument('--onnx_threads', type=int, default=None,
+                        help='ONNX Runtime intra-op threads per process (default: the cores shared between the processes running models)')
+    parser.add_argument('--output_format', type=str, default="csv", choices=["csv", "parquet", "arrow"],
+                        help='One CSV per batch, or a single Parquet dataset / Arrow file with a manifest')
+    parser.add_argument('--geocoder', type=str, default="nominatim", choices=["nominatim", "gazetteer"],
+                        help='Location lookups from the live Nominatim service or an offline gazetteer')
+    parser.add_argument('--gazetteer', type=str, default=None,
+                        help='Gazetteer index (.pkl from gazetteer.py) or GeoNames dump, for --geocoder gazetteer')
+    parser.add_argument('--language_id', type=str, default="langdetect", choices=["langdetect", "langid", "fasttext"],
+                        help='Language identification of descriptions (and tweets): seeded langdetect, langid.py or a fastText model')
+    parser.add_argument('--language_model', type=str, default=None,
+                        help='fastText language identification model (e.g. lid.176.ftz), for --language_id fasttext')
+    parser.add_argument('--tweet_language', action='store_true',
+                        help='Also identify the language of each tweet text (post_language_detected), to check language_x')
+    parser.add_argument('--io_lane', action='store_true',
+                        help='Look up locations on an asyncio lane in the main process while the workers compute the other features')
+    parser.add_argument('--geocode_rate', type=float, default=1.0,
+                        help='Nominatim requests per second for the whole run, with --io_lane')
+    parser.add_argument('--geocode_concurrency', type=int, default=2,
+                        help='Nominatim requests in flight at once, with --io_lane')
+    parser.add_argument('--geocode_cache', type=str, default="geocode_cache.sqlite",
+                        help='SQLite cache of location lookups shared across workers and runs ("" to disable)')
+    parser.add_argument('--resource_cache', type=str, default=None,
+                        help='Directory of prebuilt serialized resources (name index, MBFC table), built on first use')
+    parser.add_argument('--grammar_servers', type=int, default=0,
+                        help='Shared LanguageTool servers for all workers (default 0: one per worker)')
+    parser.add_argument('--grammar_batch_chars', type=int, default=0,
+                        help='Characters of text sent per LanguageTool request in grammar server mode '
+                             '(default 0: one text per request; see compare_grammar_service.py)')
+    parser.add_argument('--feature_cache', type=str, default=None,
+                        help='SQLite cache of text features keyed on the stripped text, shared across workers and runs '
+                             '(e.g. {file_path}_features.sqlite; default: no cache)')
+    parser.add_argument('--feature_cache_mb', type=int, default=2048,
+                        help='Size of the feature cache before least recently used entries are evicted')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip batches the run manifest records as done; retry failed or missing ones')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time each pipeline stage in every worker; prints a summary and writes {file_path}_profile.json (Chrome trace)')
+    parser.add_argument('--profile_events', type=int, default=100000,
+                        help='Maximum trace events kept per process with --profile (stage totals are always complete)')
+    parser.add_argument('--target_batch_seconds', type=float, default=None,
+                        help='Cut the input into batches of about this many seconds each, estimated from the cost of each row '
+                             'and learned from completed batches (default: fixed --batch_size batches)')
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help='Process only shard i of N ("i/N", from 0) of the input, for runs split over several nodes '
+                             '(output and manifest under {file_path}_shard_{i}_of_{N}; combine them with merge_shards.py)')
+    parser.add_argument('--shard_by', type=str, default="id", choices=SHARD_BY,
+                        help='Assign rows to shards by a hash of their ID, or in contiguous row ranges')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Compute only the input rows that are new or changed since the last incremental run with this '
+                             '--file_path, and merge them into its Parquet dataset (row index in {file_path}_rows.sqlite)')
+    parser.add_argument('--max_pending_batches', type=int, default=None,
+                        help='Maximum batches read ahead of the workers (default: 2 x nproc)')
 
     args = parser.parse_args()
 
-    df = pd.read_pickle(args.input)
-    start = args.start_row
-    end = len(df)
-    batch_size = args.batch_size
+    if args.geocoder == "gazetteer" and not args.gazetteer:
+        parser.error("--geocoder gazetteer requires --gazetteer")
+    if args.io_lane and (args.type != "profile" or args.geocoder != "nominatim"):
+        parser.error("--io_lane is for --type profile with --geocoder nominatim")
+    if args.language_id == "fasttext" and not args.language_model:
+        parser.error("--language_id fasttext requires --language_model")
+    if args.resume and args.output_format == "arrow":
+        parser.error("--resume is not supported for a single Arrow file; use --output_format parquet or csv")
+    if args.incremental and args.output_format != "parquet":
+        parser.error("--incremental requires --output_format parquet")
 
-    batches = []
-    for batch_start in range(start, end, batch_size):
-        batch_df = df.iloc[batch_start:batch_start + batch_size].copy()
-        file_path = f"{args.file_path}_rows_{batch_start}_to_{batch_start + len(batch_df) - 1}.csv"
-        batches.append((batch_df, args.type, file_path, args.verbose))
+    # Each shard has its own output and run manifest, named after its output prefix
+    shard = args.shard
+    end_row = None
+    # Recorded in the run manifest, for --resume and merge_shards.py to check that the same input was read
+    # (a pickled input is loaded once, for its row count here and for its row keys and batches below)
+    input_df = read_pickle_input(args.input)
+    args.input_identity = input_identity(args.input, total_rows=None if input_df is None else len(input_df))
+    if shard is not None:
+        args.file_path = shard_path(args.file_path, shard)
+        if args.shard_by == "range":
+            first_row, end_row = shard_row_range(args.input_identity["rows"], shard)
+            args.start_row = max(args.start_row, first_row)
 
     num_processes = args.nproc or max(1, multiprocessing.cpu_count() - 1)
+    max_pending = args.max_pending_batches or 2 * num_processes
+
+    # TweetNLP inference backend, sharing the cores between the processes that run the models
+    model_processes = 1 if args.model_server else num_processes
+    tnlp_backend = make_tnlp_backend(args.tnlp_backend, model_dir=args.onnx_dir,
+                                     threads=args.onnx_threads or max(1, multiprocessing.cpu_count() // model_processes))
+    # Everything the language features depend on, for feature cache keys and --incremental row versions
+    feature_version = language_feature_version(tnlp_backend, args.grammar_servers, args.grammar_batch_chars)
+
+    # Rows new or changed since the outputs were last merged, or outside this run's rows (with --incremental)
+    selected = None
+    if args.incremental:
+        dataset_path = f"{args.file_path}_dataset"
+        if not has_row_keys(dataset_path):
+            parser.error(f"{dataset_path} was not written with --incremental; use another --file_path")
+        row_index = RowIndex(row_index_path(args.file_path))
+        version = ";".join([f"pipeline={PIPELINE_REVISION}", feature_version, f"geocoder={args.geocoder}",
+                            f"gazetteer={args.gazetteer}", f"language_id={args.language_id}",
+                            f"language_model={args.language_model}", f"tweet_language={args.tweet_language}"])
+        row_keys = read_row_keys(args.input, args.type, version, df=input_df)
+        keys = row_keys[ROW_KEY].to_numpy()
+        selected = row_index.changed(keys.tolist(), row_keys["fingerprint"].tolist())
+        selected[:args.start_row] = False
+        if end_row is not None:
+            selected[end_row:] = False
+        if shard is not None and args.shard_by == "id":
+            selected &= in_shard(row_keys, shard)
+        if args.verbose:
+            print(f"[INFO] Incremental: {selected.sum()} of {len(selected)} rows are new or changed")
+
+    # Ledger of batch ranges, statuses, timings and errors for this output path
+    manifest = RunManifest(manifest_path(args.file_path))
+    changed = manifest.changed_arguments(vars(args)) if args.resume else []
+    if changed:
+        manifest.close()
+        parser.error(f"--resume: {manifest.path} was written by a run with different "
+                     f"settings ({', '.join(changed)}); rerun without --resume or use another --file_path")
+    completed = CompletedRanges(manifest.done_ranges() if args.resume else [])
+    manifest.start_run(vars(args), resume=args.resume)
+    if args.resume and args.verbose:
+        print(f"[INFO] Resuming: {len(completed.ranges)} completed row range(s) will be skipped")
+
+    # Read batches lazily; Parquet, Arrow and JSONL inputs are streamed from disk
+    input_batches, total_batches = open_input_batches(args.input, args.batch_size, start_row=args.start_row, end_row=end_row,
+                                                      df=input_df)
+
+    # Optionally cut what is read into batches of equal estimated cost rather than equal rows
+    scheduler = None
+    if args.target_batch_seconds:
+        scheduler = AdaptiveScheduler(args.type, args.target_batch_seconds)
+        total_batches = None  # Not known in advance
+
+    # Location lookups made in this process, alongside the workers (instead of the lookup broker)
+    lane = None
+    if args.io_lane:
+        lane = GeocodeLane(cache_path=args.geocode_cache or None, rate=args.geocode_rate,
+                           concurrency=args.geocode_concurrency).start()
+
+    def csv_path(batch_range):
+        return f"{args.file_path}_rows_{batch_range[0]}_to_{batch_range[1]}.csv"
+
+    # Join the location levels looked up in the I/O lane to the rows of a batch (and write its CSV)
+    def join_locations(result):
+        row_start, row_end = result["batch_range"]
+        try:
+            if result["rows"] is not None:
+                with stage("geocode_join"):
+                    add_location_levels(result["rows"], lane.lookup)
+                if args.output_format == "csv":
+                    with stage("write_csv"):
+                        pd.DataFrame(result["rows"]).to_csv(csv_path(result["batch_range"]), index=False)
+                    result.update(status=DONE, output=csv_path(result["batch_range"]), rows=None)
+        except Exception as e:
+            print(f"[ERROR] Failed on rows {row_start} to {row_end}: {e}")
+            result.update(status=FAILED, error=f"{type(e).__name__}: {str(e)}", rows=None)
+        finally:
+            lane.release((row_start, row_end))
+
+    # Batch ranges with no rows to compute (outside this shard, or unchanged), recorded as done by the main loop
+    empty_batches = []
+
+    def record_empty_batches():
+        while empty_batches:
+            manifest.record(*empty_batches.pop(), DONE, seconds=0.0)
+
+    def make_batches():
+        for batch_start, batch_df in input_batches:
+            # Only the rows not yet completed (batches may straddle earlier ones if the batch size changed)
+            for uncovered_range in completed.uncovered(batch_start, batch_start + len(batch_df) - 1):
+                batch_ranges = [uncovered_range]
+                if scheduler is not None:
+                    uncovered_rows = batch_df.iloc[uncovered_range[0] - batch_start:uncovered_range[1] - batch_start + 1]
+                    batch_ranges = scheduler.split(uncovered_rows, uncovered_range[0])
+
+                for batch_range in batch_ranges:
+                    file_path = None
+                    if args.output_format == "csv" and lane is None:
+                        file_path = csv_path(batch_range)  # Otherwise written here once the locations are joined
+                    rows = batch_df.iloc[batch_range[0] - batch_start:batch_range[1] - batch_start + 1]
+                    # Only the rows to compute; the batch range is still recorded as a whole
+                    if selected is not None:
+                        keep = selected[batch_range[0]:batch_range[1] + 1]
+                        rows = rows[keep].assign(**{ROW_KEY: keys[batch_range[0]:batch_range[1] + 1][keep]})
+                    elif shard is not None and args.shard_by == "id":
+                        rows = rows[in_shard(rows, shard)]
+                    if rows.empty:
+                        empty_batches.append(batch_range)
+                        continue
+                    if lane is not None:
+                        lane.submit(batch_range, location_tokens(rows))
+                    yield (rows, args.type, file_path, args.verbose, args.inference_batch_size, batch_range)
+
+    pending = threading.BoundedSemaphore(max_pending)
+    batches = bounded(make_batches(), pending)
+
     if args.verbose:
-        print(f"[INFO] Using {num_processes} processes to handle {len(batches)} batches...")
+        print(f"[INFO] Using {num_processes} processes to handle {total_batches or 'streamed'} batches...")
+
+    # Export the ONNX models once, before the workers (or the model server) load them
+    if tnlp_backend is not None:
+        tnlp_backend.export()
+
+    # Optionally serve the models from a single process instead of loading them in every worker
+    server = None
+    if args.model_server:
+        server = start_model_server(batch_size=args.inference_batch_size, tnlp_backend=tnlp_backend)
+        if args.verbose:
+            print(f"[INFO] TweetNLP model server listening on {server[1]}")
+
+    # Make every network geocode lookup from one rate-limited broker process
+    broker = None
+    if args.type == "profile" and args.geocoder == "nominatim" and not args.io_lane:
+        broker = start_geocode_broker(cache_path=args.geocode_cache)
+
+    geocoder = make_geocoder(args.geocoder, cache_path=args.geocode_cache,
+                             broker=broker[1:] if broker else None, gazetteer_path=args.gazetteer)
+
+    language_identifier = make_language_identifier(args.language_id, model_path=args.language_model)
+
+    # Build the resources once here, rather than in every worker at the same time: forked workers inherit
+    # them, the gazetteer index is sent with the geocoder, and the serialized copies of the others are
+    # written if --resource_cache is set
+    set_geocoder(geocoder)
+    set_language_identifier(language_identifier)
+    set_resource_cache(args.resource_cache)
+    warm_resources(args.type, grammar=False, tweet_language=args.tweet_language)
+
+    # Optionally share N LanguageTool servers between all workers
+    grammar_tools = []
+    grammar_client = None
+    if args.grammar_servers:
+        grammar_tools = start_grammar_servers(args.grammar_servers)
+        grammar_client = GrammarClient(grammar_server_urls(grammar_tools), batch_chars=args.grammar_batch_chars)
+
+    # Text features shared by repeated texts (e.g. retweets), across workers and runs
+    feature_cache = None
+    if args.feature_cache:
+        feature_cache = FeatureCache(args.feature_cache, feature_version, max_mb=args.feature_cache_mb)
+
+    # Per-stage timings from every process, combined as batches complete
+    report = None
+    if args.profile:
+        enable_profiling(max_events=args.profile_events)
+        report = ProfileReport()
+
+    init_args = (server[1:] if server else None, geocoder, args.type, args.resource_cache, grammar_client, feature_cache,
+                 args.profile_events if args.profile else None, language_identifier, args.tweet_language, args.io_lane,
+                 tnlp_backend)
+
+    # Single consolidated output written by this process
+    writer = None
+    if args.output_format != "csv":
+        from output_writers import open_output_writer
+        # With --incremental, to an update dataset merged into the outputs once complete
+        output_prefix = f"{args.file_path}_update" if args.incremental else args.file_path
+        writer = open_output_writer(args.output_format, output_prefix, args.type, append=args.resume,
+                                    row_keys=args.incremental)
+        writer.on_flush = manifest.mark_done  # Batches are only done once their rows are on disk
+
+    start_time = time.perf_counter()
+    rows_processed = 0
+    failed_batches = 0
+    all_returned = False  # Every batch returned (not interrupted or crashed)
+    try:
+        with multiprocessing.Pool(processes=num_processes, initializer=init_models, initargs=init_args) as pool:
+            for result in tqdm(pool.imap_unordered(process_batch, batches), total=total_batches, desc="Processing Batches"):
+                pending.release()
+                failed_batches += result["status"] == FAILED
+                if scheduler is not None:
+                    scheduler.observe(result["batch_range"], result["seconds"] if result["status"] != FAILED else None)
+                if lane is not None:
+                    join_locations(result)
+                record_empty_batches()
+                manifest.record(*result["batch_range"], result["status"], seconds=result["seconds"],
+                                output=result["output"] or (writer.path if writer else None), error=result["error"])
+                if writer is not None and result["rows"] is not None:
+                    with stage("write_output"):
+                        writer.write_rows(result["rows"], key=result["batch_range"])
+                rows_processed += result["batch_range"][1] - result["batch_range"][0] + 1
+                if report is not None:
+                    report.add(result["profile"])
+        all_returned = True
+    finally:
+        if server is not None:
+            stop_model_server(*server)
+        if broker is not None:
+            stop_geocode_broker(*broker)
+        if lane is not None:
+            lane.close()
+        stop_grammar_servers(grammar_tools)
+        if writer is not None:
+            with stage("write_output"):
+                output_manifest = writer.close(completed=all_returned and not failed_batches)
+            if args.verbose:
+                print(f"[INFO] Wrote {output_manifest['rows_written']} rows to {writer.path}")
+        record_empty_batches()
+        if args.verbose:
+            print(f"[INFO] Run manifest {manifest.path}: {manifest.summary()}")
+            if scheduler is not None:
+                print(f"[INFO] Estimated seconds per row feature: {scheduler.seconds_per_feature()}")
+        manifest.close()
+        if report is not None:
+            report.add(get_profiler().collect())  # This process's own stages (e.g. output writes)
+            summary = report.summary(elapsed=time.perf_counter() - start_time, rows=rows_processed)
+            report.print_summary(summary)
+            report.write(f"{args.file_path}_profile.json", summary)
+            print(f"[INFO] Profile trace written to {args.file_path}_profile.json")
 
-    with multiprocessing.Pool(processes=num_processes, initializer=init_models) as pool:
-        list(tqdm(pool.imap_unordered(process_batch, batches), total=len(batches), desc="Processing Batches"))
\ No newline at end of file
+    # Merge the new and changed rows into the outputs, once every batch is written
+    if args.incremental:
+        if failed_batches:
+            print(f"[ERROR] {failed_batches} batch(es) failed; outputs not merged (rerun with --incremental --resume)")
+        elif selected.any():
+            merged = merge_update(dataset_path, writer.path, keys[selected].tolist(), output_manifest)
+            row_index.update(keys[selected].tolist(), row_keys["fingerprint"].to_numpy()[selected].tolist())
+            shutil.rmtree(writer.path)
+            print(f"[INFO] Merged {merged['rows_added']} new or changed rows into {dataset_path} "
+                  f"({merged['rows_replaced']} replaced, {merged['rows_written']} in all)")
+        else:
+            shutil.rmtree(writer.path)
+            print(f"[INFO] No new or changed rows; {dataset_path} is up to date")
+        row_index.close()
\ No newline at end of file
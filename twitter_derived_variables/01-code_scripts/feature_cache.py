@@ -0,0 +1,119 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+from instrumentation import profiled
+
+#### ---- CONTENT-ADDRESSED TEXT FEATURE CACHE ---- ###
+
+# Features of stripped text (textstat metrics, grammar score and TweetNLP outputs) keyed on a hash
+# of the text and a version string naming everything that computes them, so retweets and repeated
+# profile descriptions are only scored once. Shared across processes and runs (SQLite in WAL mode),
+# with the least recently used entries evicted once the cache grows beyond max_mb.
+
+class FeatureCache:
+
+    def __init__(self, path, version, max_mb=2048, check_every=1000):
+        self.path = path
+        self.version = version
+        self.max_mb = max_mb
+        self.check_every = check_every  # Entries written between size checks
+        self.conn = None
+        self.pid = None
+        self.unchecked = 0
+
+    # Open one connection per process (SQLite connections must not cross a fork)
+    def connect(self):
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=60)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS features (
+                                     key BLOB PRIMARY KEY,
+                                     value BLOB NOT NULL,
+                                     size INTEGER NOT NULL,
+                                     last_used REAL NOT NULL)""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS features_last_used ON features (last_used)")
+            self.conn.commit()
+            self.pid = os.getpid()
+            self.unchecked = 0
+        return self.conn
+
+    def key(self, text):
+        return hashlib.blake2b(f"{self.version}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def get(self, text):
+        return self.get_many([text]).get(text)
+
+    # Returns {text: features} for the texts found
+    @profiled("feature_cache.get")
+    def get_many(self, texts):
+        conn = self.connect()
+        keys = {self.key(text): text for text in texts}
+        found = {}
+        stale = []  # Keys found whose recency is over an hour old
+        now = time.time()
+        key_list = list(keys)
+        for i in range(0, len(key_list), 500):  # Stay below SQLite's limit on query parameters
+            chunk = key_list[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for key, value, last_used in conn.execute(
+                    f"SELECT key, value, last_used FROM features WHERE key IN ({placeholders})", chunk):
+                found[keys[key]] = pickle.loads(value)
+                if last_used < now - 3600:
+                    stale.append(key)
+
+        # Refresh recency for eviction (at most once an hour per entry, so that most reads take no write lock)
+        if stale:
+            conn.executemany("UPDATE features SET last_used = ? WHERE key = ?", [(now, key) for key in stale])
+            conn.commit()
+        return found
+
+    def put(self, text, features):
+        self.put_many({text: features})
+
+    @profiled("feature_cache.put")
+    def put_many(self, features_by_text):
+        conn = self.connect()
+        now = time.time()
+        values = []
+        for text, features in features_by_text.items():
+            value = pickle.dumps(features, protocol=pickle.HIGHEST_PROTOCOL)
+            values.append((self.key(text), value, len(value), now))
+        conn.executemany("INSERT OR REPLACE INTO features (key, value, size, last_used) VALUES (?, ?, ?, ?)", values)
+        conn.commit()
+
+        self.unchecked += len(values)
+        if self.unchecked >= self.check_every:
+            self.evict()
+
+    # Remove the least recently used entries until the cache is back under 90% of max_mb
+    def evict(self):
+        conn = self.connect()
+        self.unchecked = 0
+        total_bytes, entries = conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM features").fetchone()
+        max_bytes = self.max_mb * 1024 * 1024
+        if total_bytes <= max_bytes:
+            return
+        excess = -(-(total_bytes - 0.9 * max_bytes) * entries // total_bytes)  # Entries to remove, at the average size
+        conn.execute("DELETE FROM features WHERE key IN (SELECT key FROM features ORDER BY last_used LIMIT ?)",
+                     (int(excess),))
+        conn.commit()
+
+    # Keep the connection out of pickles sent to other processes
+    def __getstate__(self):
+        return {"path": self.path, "version": self.version, "max_mb": self.max_mb, "check_every": self.check_every}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["version"], max_mb=state["max_mb"], check_every=state["check_every"])
+
+# GLOBAL VARIABLE shared in each process (but not across them)
+_feature_cache = None
+
+def set_feature_cache(cache):
+    global _feature_cache
+    _feature_cache = cache
+
+def get_feature_cache():
+    return _feature_cache
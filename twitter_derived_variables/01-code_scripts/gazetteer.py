@@ -0,0 +1,200 @@
+import argparse
+import csv
+import pickle
+import re
+import unicodedata
+
+#### ---- OFFLINE GAZETTEER GEOCODER ---- ###
+
+# Resolves location tokens against a local GeoNames dump (e.g. allCountries.txt or cities1000.txt from
+# https://download.geonames.org/export/dump/) instead of the live Nominatim service, returning the same
+# raw-dictionary shape as geocoding.NominatimGeocoder (including "addresstype").
+
+# GeoNames dump columns (tab separated, no header)
+GEONAMES_COLUMNS = ["geonameid", "name", "asciiname", "alternatenames", "latitude", "longitude",
+                    "feature_class", "feature_code", "country_code", "cc2", "admin1_code", "admin2_code",
+                    "admin3_code", "admin4_code", "population", "elevation", "dem", "timezone", "modification_date"]
+
+# GeoNames feature codes mapped to the Nominatim address types recorded in LC_level_types
+FEATURE_CODE_TYPES = {
+    "CONT": "continent",
+    "PCLI": "country", "PCLD": "country", "PCLF": "country", "PCLS": "country", "PCLIX": "country", "PCL": "country",
+    "TERR": "territory",
+    "ADM1": "state", "ADM1H": "state",
+    "ADM2": "county", "ADM2H": "county",
+    "ADM3": "municipality",
+    "ADM4": "municipality",
+    "ADMD": "district",
+    "RGN": "region", "RGNE": "region",
+    "ISL": "island", "ISLS": "island",
+    "PPLX": "suburb",
+}
+
+# Populated places (feature class "P") are typed by population, roughly as Nominatim does
+def populated_place_type(population):
+    if population >= 100000:
+        return "city"
+    if population >= 10000:
+        return "town"
+    if population >= 1000:
+        return "village"
+    return "hamlet"
+
+# Populated places smaller than this are left out of the index, however it is built (gazetteer.py or a
+# GeoNames dump passed straight to --gazetteer), so the same dump always resolves the same tokens
+MIN_POPULATION = 1000
+
+# Preference when one name matches several places (lower is preferred, then larger population)
+ADDRESS_TYPE_RANK = {"country": 0, "state": 1, "city": 2, "continent": 3, "region": 4, "territory": 5,
+                     "county": 6, "town": 7, "island": 8, "municipality": 9, "district": 10,
+                     "village": 11, "suburb": 12, "hamlet": 13}
+
+# Normalise names and tokens: strip accents and punctuation ("U.S.A." -> "usa"), casefold, collapse spaces
+def normalise_name(name):
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    name = re.sub(r"[.']", "", name.casefold())
+    name = re.sub(r"[^\w]+", " ", name)
+    return " ".join(name.split())
+
+def get_address_type(feature_class, feature_code, population):
+    if feature_code in FEATURE_CODE_TYPES:
+        return FEATURE_CODE_TYPES[feature_code]
+    if feature_class == "P":
+        return "city" if feature_code in ("PPLC", "PPLA") else populated_place_type(population)
+    return None
+
+def entry_rank(entry):
+    return (ADDRESS_TYPE_RANK.get(entry["addresstype"], len(ADDRESS_TYPE_RANK)), -entry["population"])
+
+# Build {normalised name or alias: place entry} from a GeoNames dump
+def build_gazetteer_index(geonames_path, country_info_path=None, aliases_path=None, min_population=MIN_POPULATION):
+
+    index = {}
+
+    def add(key, entry):
+        key = normalise_name(key)
+        if key and (key not in index or entry_rank(entry) < entry_rank(index[key])):
+            index[key] = entry
+
+    entries_by_country = {}
+    with open(geonames_path, encoding="utf-8") as f:
+        for line in f:
+            values = dict(zip(GEONAMES_COLUMNS, line.rstrip("\n").split("\t")))
+            population = int(values.get("population") or 0)
+            address_type = get_address_type(values["feature_class"], values["feature_code"], population)
+
+            # Keep administrative areas regardless of size, but only populated places above the threshold
+            if address_type is None or (values["feature_class"] == "P" and population < min_population):
+                continue
+
+            entry = {
+                "name": values["name"],
+                "addresstype": address_type,
+                "country_code": values["country_code"],
+                "lat": values["latitude"],
+                "lon": values["longitude"],
+                "population": population,
+                "geonameid": values["geonameid"],
+            }
+            if address_type == "country":
+                entries_by_country[values["country_code"]] = entry
+
+            add(values["name"], entry)
+            add(values["asciiname"], entry)
+            for alias in values["alternatenames"].split(","):
+                add(alias, entry)
+
+    # Country ISO codes as aliases (e.g. "US", "USA", "GB", "GBR")
+    if country_info_path:
+        with open(country_info_path, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#"):
+                    continue
+                values = line.rstrip("\n").split("\t")
+                iso2, iso3 = values[0], values[1]
+                if iso2 in entries_by_country:
+                    add(iso2, entries_by_country[iso2])
+                    add(iso3, entries_by_country[iso2])
+
+    # Project-specific aliases: CSV with "alias,name" columns (e.g. "NYC,New York City")
+    if aliases_path:
+        with open(aliases_path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                target = index.get(normalise_name(row["name"]))
+                if target is not None:
+                    index[normalise_name(row["alias"])] = target
+
+    return index
+
+# Geocoder backed by an in-memory gazetteer index, with fuzzy matching for misspelt tokens
+class GazetteerGeocoder:
+
+    def __init__(self, path, fuzzy_cutoff=90):
+        self.path = path
+        self.fuzzy_cutoff = fuzzy_cutoff  # Minimum rapidfuzz ratio (0-100); None disables fuzzy matching
+        self.index = None
+        self.buckets = None
+
+    # Load a prebuilt index (.pkl), or build one directly from a GeoNames dump
+    def load(self):
+        if self.index is None:
+            if self.path.endswith(".pkl"):
+                with open(self.path, "rb") as f:
+                    self.index = pickle.load(f)
+            else:
+                self.index = build_gazetteer_index(self.path)
+        return self.index
+
+    # Candidate keys for fuzzy matching, bucketed by first character to keep the search small
+    def fuzzy_candidates(self, key):
+        if self.buckets is None:
+            self.buckets = {}
+            for name in self.load():
+                self.buckets.setdefault(name[0], []).append(name)
+        return self.buckets.get(key[0], [])
+
+    def lookup(self, token):
+        index = self.load()
+        key = normalise_name(token)
+        if not key:
+            return None
+
+        entry = index.get(key)
+        match = "exact"
+        if entry is None and self.fuzzy_cutoff is not None and len(key) > 3:
+            from rapidfuzz import fuzz, process
+            best = process.extractOne(key, self.fuzzy_candidates(key), scorer=fuzz.ratio, score_cutoff=self.fuzzy_cutoff)
+            if best is not None:
+                entry = index[best[0]]
+                match = "fuzzy"
+
+        if entry is None:
+            return None
+        return {**entry, "source": "geonames", "match": match}
+
+    # The index is sent with the geocoder once loaded, so workers started by spawn or forkserver do not
+    # rebuild it (forked workers share the main process's copy); the fuzzy buckets are rebuilt on use
+    def __getstate__(self):
+        return {"path": self.path, "fuzzy_cutoff": self.fuzzy_cutoff, "index": self.index}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], fuzzy_cutoff=state["fuzzy_cutoff"])
+        self.index = state.get("index")
+
+# MAIN ENTRY POINT: build and save an index once, for use with --geocoder gazetteer
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build an offline gazetteer index from a GeoNames dump.")
+    parser.add_argument('--geonames', type=str, required=True, help='Path to GeoNames dump (e.g. allCountries.txt)')
+    parser.add_argument('--country_info', type=str, default=None, help='Path to GeoNames countryInfo.txt (adds ISO code aliases)')
+    parser.add_argument('--aliases', type=str, default=None, help='CSV of extra aliases with "alias,name" columns')
+    parser.add_argument('--min_population', type=int, default=MIN_POPULATION, help='Minimum population for populated places')
+    parser.add_argument('--output', type=str, required=True, help='Output index path (.pkl)')
+
+    args = parser.parse_args()
+
+    index = build_gazetteer_index(args.geonames, country_info_path=args.country_info,
+                                  aliases_path=args.aliases, min_population=args.min_population)
+    with open(args.output, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"[INFO] Saved {len(index)} names to {args.output}")
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+from geocoding import NominatimGeocoder, GeocodeCache
+from get_geocode import GeocodeFailed
+
+#### ---- ASYNCIO I/O LANE FOR LOCATION LOOKUPS ---- ###
+
+# With the lookups made inside get_profile_metadata, a pool worker (and its loaded models) sits idle on
+# the rate limit and on each HTTP round trip. In the I/O lane, the main process looks up the location
+# tokens of each batch as it is read, on an asyncio event loop with one token bucket for the whole run
+# and a limit on requests in flight. Meanwhile the workers compute the text and model features, with
+# the location levels left out; the two are joined on each row once its batch comes back.
+
+# Requests allowed at rate per second, with bursts of up to burst requests
+class TokenBucket:
+
+    def __init__(self, rate=1.0, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Location lookups on an event loop in a background thread of the main process. The cache is only used
+# from the loop's thread; network lookups (geopy is blocking) run in the loop's default thread pool.
+class GeocodeLane:
+
+    def __init__(self, cache_path=None, rate=1.0, burst=1, concurrency=2, user_agent="location_lookup"):
+        self.cache = GeocodeCache(cache_path) if cache_path else None
+        self.geocoder = NominatimGeocoder(user_agent=user_agent, min_interval=0)  # Rate limited by the bucket
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.futures = {}  # {token: concurrent.futures.Future of the raw location, or None}
+        self.users = {}  # {token: batches waiting for it}
+        self.batches = {}  # {batch key: its tokens}
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="geocode_lane", daemon=True)
+        self.thread.start()
+        self.bucket, self.requests = asyncio.run_coroutine_threadsafe(self.make_limits(), self.loop).result()
+        return self
+
+    # Created on the loop, which they belong to
+    async def make_limits(self):
+        return TokenBucket(self.rate, self.burst), asyncio.Semaphore(self.concurrency)
+
+    # Start looking up the tokens of a batch (from any thread); tokens shared by the batches in flight are looked up once
+    def submit(self, key, tokens):
+        with self.lock:
+            self.batches[key] = tokens
+            for token in tokens:
+                if token not in self.futures:
+                    self.futures[token] = asyncio.run_coroutine_threadsafe(self.lookup_async(token), self.loop)
+                self.users[token] = self.users.get(token, 0) + 1
+
+    # Forget the lookups of a batch once joined (repeats in later batches are served by the cache)
+    def release(self, key):
+        with self.lock:
+            for token in self.batches.pop(key, []):
+                self.users[token] -= 1
+                if not self.users[token]:
+                    del self.users[token]
+                    del self.futures[token]
+
+    async def lookup_async(self, token):
+        if self.cache is not None:
+            hit, raw = self.cache.get(token)
+            if hit:
+                return raw
+
+        async with self.requests:
+            await self.bucket.acquire()
+            raw = await self.loop.run_in_executor(None, self.geocoder.lookup, token)
+
+        if self.cache is not None:
+            self.cache.put(token, raw)
+        return raw
+
+    # Raw location of a token, waiting for its lookup; failed lookups count as not identified (as in lookup_location)
+    def lookup(self, token):
+        with self.lock:
+            future = self.futures.get(token)
+        if future is None:
+            future = asyncio.run_coroutine_threadsafe(self.lookup_async(token), self.loop)
+        try:
+            return future.result()
+        except GeocodeFailed:
+            return None
+
+    def close(self):
+        if self.loop is not None:
+            with self.lock:
+                for future in self.futures.values():
+                    future.cancel()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
@@ -0,0 +1,299 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing.connection import Listener, Client
+
+from get_geocode import get_geocode, GeocodeFailed
+from instrumentation import profiled, stage
+
+#### ---- GEOCODERS ---- ###
+
+# Every geocoder has a lookup(token) method returning the raw location dictionary
+# (with "addresstype") or None if the token is not identified. Lookups that could not be
+# completed raise GeocodeFailed, so that they are never cached as negative results.
+
+# Normalise a location token for cache keys
+def normalise_token(token):
+    return " ".join(token.casefold().split())
+
+# Live Nominatim lookups, at most one request every min_interval seconds from this process
+class NominatimGeocoder:
+
+    def __init__(self, user_agent="location_lookup", min_interval=1.0):
+        self.user_agent = user_agent
+        self.min_interval = min_interval
+        self.app = None
+        self.last_request = 0.0
+
+    def lookup(self, token):
+        if self.app is None:
+            from geopy.geocoders import Nominatim
+            self.app = Nominatim(user_agent=self.user_agent)  # Instantiate a new Nominatim client
+
+        # Prevents exceeding rate limit
+        wait = self.last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            with stage("geocode.rate_limit_wait"):
+                time.sleep(wait)
+        try:
+            geo_location = get_geocode(self.app, token, raise_on_failure=True)
+        finally:
+            self.last_request = time.monotonic()
+
+        return geo_location.raw if geo_location else None
+
+# On-disk cache of lookups shared across processes and runs (SQLite in WAL mode)
+class GeocodeCache:
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+        self.pid = None
+
+    # Open one connection per process (SQLite connections must not cross a fork)
+    def connect(self):
+        if self.conn is None or self.pid != os.getpid():
+            # Lookahead lookups use the connection from their own thread (never at the same time as this one)
+            self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS geocodes (
+                                     token TEXT PRIMARY KEY,
+                                     found INTEGER NOT NULL,
+                                     raw TEXT,
+                                     looked_up_at REAL NOT NULL)""")
+            self.conn.commit()
+            self.pid = os.getpid()
+        return self.conn
+
+    # Returns (hit, raw); negative results are cached as hits with raw None
+    def get(self, token):
+        row = self.connect().execute("SELECT found, raw FROM geocodes WHERE token = ?",
+                                     (normalise_token(token),)).fetchone()
+        if row is None:
+            return False, None
+        found, raw = row
+        return True, json.loads(raw) if found else None
+
+    def put(self, token, raw):
+        conn = self.connect()
+        conn.execute("INSERT OR REPLACE INTO geocodes (token, found, raw, looked_up_at) VALUES (?, ?, ?, ?)",
+                     (normalise_token(token), int(raw is not None),
+                      json.dumps(raw) if raw is not None else None, time.time()))
+        conn.commit()
+
+    # Keep the connection out of pickles sent to other processes
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+# Check the cache before falling back to another geocoder
+class CachedGeocoder:
+
+    def __init__(self, backend, cache, store=True):
+        self.backend = backend
+        self.cache = cache
+        self.store = store  # False when the backend already writes to the same cache
+
+    def lookup(self, token):
+        hit, raw = self.cache.get(token)
+        if hit:
+            return raw
+        raw = self.backend.lookup(token)
+        if self.store:
+            self.cache.put(token, raw)
+        return raw
+
+#### ---- GEOCODE LOOKUP BROKER ---- ###
+
+# A single process makes every network lookup, so the 1 request/second policy holds across
+# all pool workers. Workers read the shared cache themselves and only send unseen tokens.
+
+# Client used by pool workers
+class GeocodeBrokerClient:
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self.conn = None
+
+    def lookup(self, token):
+        if self.conn is None:
+            self.conn = Client(self.address, authkey=self.authkey)
+        self.conn.send(token)
+        status, result = self.conn.recv()
+        if status == "failed":
+            raise GeocodeFailed(result)
+        if status == "error":
+            raise RuntimeError(f"Geocode broker: {result}")
+        return result
+
+    def __getstate__(self):
+        return {"address": self.address, "authkey": self.authkey}
+
+    def __setstate__(self, state):
+        self.__init__(state["address"], state["authkey"])
+
+# Broker process entry point: lookups are made one at a time, in arrival order
+def serve_geocodes(authkey, ready_queue, cache_path=None, min_interval=1.0):
+
+    geocoder = NominatimGeocoder(min_interval=min_interval)
+    if cache_path:
+        # Re-checks the cache, since another worker may have queued the same token first
+        geocoder = CachedGeocoder(geocoder, GeocodeCache(cache_path))
+
+    requests = queue.Queue()
+    listener = Listener(("localhost", 0), authkey=authkey)
+
+    def handle(conn):
+        try:
+            while True:
+                token = conn.recv()
+                requests.put(None if token is None else (conn, token))
+                if token is None:
+                    return
+        except (EOFError, OSError):
+            conn.close()
+
+    def accept():
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    ready_queue.put(listener.address)
+
+    while True:
+        request = requests.get()
+        if request is None:
+            listener.close()
+            return
+        conn, token = request
+        try:
+            conn.send(("ok", geocoder.lookup(token)))
+        except GeocodeFailed as e:
+            conn.send(("failed", str(e)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {str(e)}"))
+
+def start_geocode_broker(cache_path=None, min_interval=1.0):
+    authkey = os.urandom(16)
+    ready_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_geocodes, args=(authkey, ready_queue, cache_path, min_interval), daemon=True)
+    process.start()
+    address = ready_queue.get()
+    return process, address, authkey
+
+def stop_geocode_broker(process, address, authkey):
+    if process.is_alive():
+        conn = Client(address, authkey=authkey)
+        conn.send(None)
+        conn.close()
+        process.join()
+
+#### ---- GEOCODER USED BY get_profile_metadata ---- ###
+
+# GLOBAL VARIABLE shared in each process (but not across them)
+_geocoder = None
+
+def set_geocoder(geocoder):
+    global _geocoder
+    _geocoder = geocoder
+
+def get_geocoder():
+    global _geocoder
+    if _geocoder is None:
+        _geocoder = NominatimGeocoder()  # Uncached, rate-limited within this process only
+    return _geocoder
+
+# Build the geocoder for a run: an offline gazetteer, or Nominatim behind the shared cache
+# and (optionally) the lookup broker. Geocoders are picklable, so they can be sent to pool workers.
+def make_geocoder(backend="nominatim", cache_path=None, broker=None, gazetteer_path=None):
+    if backend == "gazetteer":
+        from gazetteer import GazetteerGeocoder
+        return GazetteerGeocoder(gazetteer_path)  # No network, so no cache, broker or rate limit
+
+    if broker is not None:
+        geocoder = GeocodeBrokerClient(*broker)
+        if cache_path:
+            geocoder = CachedGeocoder(geocoder, GeocodeCache(cache_path), store=False)
+    else:
+        geocoder = NominatimGeocoder()
+        if cache_path:
+            geocoder = CachedGeocoder(geocoder, GeocodeCache(cache_path))
+    return geocoder
+
+#### ---- LOOKAHEAD GEOCODING ---- ###
+
+# Location lookups wait on the network (and the rate limit), while the rest of each profile is CPU work.
+# The tokens of a whole batch are looked up in a background thread, in row order, while the rows are
+# processed, so each row only waits for the lookups that have not finished yet.
+
+# GLOBAL VARIABLES shared in each process (but not across them): a single lookup thread, so that the
+# geocoder is only ever used by one thread at a time (threads do not survive a fork, hence the pid)
+_lookahead_executor = None
+_lookahead_pid = None
+
+def get_lookahead_executor():
+    global _lookahead_executor, _lookahead_pid
+    if _lookahead_executor is None or _lookahead_pid != os.getpid():
+        _lookahead_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="geocode_lookahead")
+        _lookahead_pid = os.getpid()
+    return _lookahead_executor
+
+# Serves the lookups of one batch from the lookup thread (each distinct token is looked up once)
+class LookaheadGeocoder:
+
+    def __init__(self, geocoder, tokens):
+        self.geocoder = geocoder
+        self.futures = {}
+        for token in tokens:
+            self.submit(token)
+
+    def submit(self, token):
+        if token not in self.futures:
+            self.futures[token] = get_lookahead_executor().submit(self.geocoder.lookup, token)
+        return self.futures[token]
+
+    def lookup(self, token):
+        with stage("geocode.lookahead_wait"):
+            return self.submit(token).result()  # Raises GeocodeFailed as the geocoder would
+
+    # Drop the lookups not started yet (e.g. when the batch failed)
+    def cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+
+# Look up the given tokens ahead of the code in this block (offline indexes answer at once, so are used directly)
+@contextmanager
+def lookahead_geocoding(tokens):
+    geocoder = get_geocoder()
+    if not tokens or hasattr(geocoder, "load"):
+        yield
+        return
+
+    lookahead = LookaheadGeocoder(geocoder, tokens)
+    set_geocoder(lookahead)
+    try:
+        yield
+    finally:
+        set_geocoder(geocoder)
+        lookahead.cancel()
+
+# Look up one location token; failed lookups count as not identified (as get_geocode returns None)
+@profiled("geocode")
+def lookup_location(token):
+    try:
+        return get_geocoder().lookup(token)
+    except GeocodeFailed:
+        return None
@@ -2,7 +2,11 @@ import time
 import random
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 
-def get_geocode(app, query, retries=3):
+# Raised (instead of returning None) when every retry failed, so failures are not mistaken for "not found"
+class GeocodeFailed(Exception):
+    pass
+
+def get_geocode(app, query, retries=3, raise_on_failure=False):
     for attempt in range(retries):
         try:
             return app.geocode(query, addressdetails=True, timeout=10)
@@ -10,4 +14,6 @@ def get_geocode(app, query, retries=3):
             wait = 2 ** attempt + random.random()  # exponential backoff with jitter
             print(f"Geocoding error: {e}. Retrying in {wait:.2f} seconds...")
             time.sleep(wait)
+    if raise_on_failure:
+        raise GeocodeFailed(f"Geocoding failed after {retries} attempts: {query}")
     return None  # after max retries, return None
\ No newline at end of file
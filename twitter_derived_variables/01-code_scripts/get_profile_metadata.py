@@ -1,21 +1,58 @@
 import re
-import textstat as ts
-import emoji
 import pandas as pd
-import time
-from langdetect import detect
 
-from get_geocode import get_geocode
-from geopy.geocoders import Nominatim
-app = Nominatim(user_agent="location_lookup") # Instantiate a new Nominatim client
+from geocoding import lookup_location, lookahead_geocoding
+from language_id import identify_languages
+from instrumentation import profiled
 
-from text_analysis_functions import strip_text, count_capitals
+from text_analysis_functions import strip_text, count_emojis
+from text_counts import word_counts
 from real_name_checker import similarity_score, get_salutation, check_names
 from get_tweet_text_features import get_tweet_text_features
 
 #### ---- FUNCTION: GET PROFILE METADATA ---- ###
 
-def get_profile_metadata(profile_data, tnlp_models):
+# Levels of a location field (seperated by commas or slashes)
+def split_location(location):
+    tokens = re.split(r'[,/]', location)
+    return [token.strip() for token in tokens if token.strip()]
+
+# Placeholder key for location levels awaiting lookup in the I/O lane
+PENDING_LOCATION_KEY = "geocode_pending_levels"
+
+# Identify location levels (LC_levels_identified and LC_level_types, or the error message)
+def identify_location_levels(location_split, lookup=lookup_location):
+
+    location_levels = {
+        "level_identified": [],
+        "level_type": []
+    }
+
+    try:
+        for level in location_split:
+            geo_location = lookup(level)  # Cached and rate-limited (see geocoding)
+
+            if geo_location:
+                # Append 1 if level is identified
+                location_levels["level_identified"].append(1)
+
+                # Append the address type
+                location_levels["level_type"].append(geo_location.get("addresstype"))
+
+            else:
+                # Append 0 if level is not identified
+                location_levels["level_identified"].append(0)
+
+        return {"LC_levels_identified": sum(location_levels["level_identified"]),
+                "LC_level_types": location_levels["level_type"]}
+
+    except Exception as e:
+        return {"LC_levels_identified": str(e)}
+
+# languages maps descriptions to their (language, probability), if already identified for the batch;
+# with defer_locations, location levels are left for add_location_levels
+@profiled("profile_metadata")
+def get_profile_metadata(profile_data, tnlp_models, languages=None, defer_locations=False):
 
     # Create an empty dictionary to be populated
     meta_dict = {}
@@ -47,17 +84,11 @@ def get_profile_metadata(profile_data, tnlp_models):
     meta_dict["DN_exclamation_count"] = name_stripped.count("!")  # Exclamation marks
     meta_dict["DN_question_mark_count"] = name_stripped.count("?")  # Question marks
     meta_dict["DN_hashtag_count"] = len(re.findall(r"#\w+", display_name)) # Hashtags
-    meta_dict["DN_emoji_count"] = emoji.emoji_count(display_name)  # Emojis
+    meta_dict["DN_emoji_count"] = count_emojis(display_name)  # Emojis
 
     if name_stripped: # Only calculate if processed text is not empty
-            # Count text features
-            meta_dict["DN_character_count"] = ts.char_count(name_stripped)  # Characters
-            meta_dict["DN_capt_character_count"] = count_capitals(name_stripped)  # Capitalized characters
-            meta_dict["DN_capt_character_prop"] = round(meta_dict["DN_capt_character_count"] /
-                                                        meta_dict["DN_character_count"], 3) # Capitalized characters (%)
-            meta_dict["DN_letter_count"] = ts.letter_count(name_stripped)  # Letters
-            meta_dict["DN_word_count"] = ts.lexicon_count(name_stripped)  # Words
-            meta_dict["DN_unique_word_count"] = len(set(name_stripped.lower().split()))  # Unique words
+            # Count text features (characters, capitalized characters and %, letters, words, unique words)
+            meta_dict.update({f"DN_{key}": value for key, value in word_counts(name_stripped).items()})
 
             # Real name checker
             meta_dict["DN_handle_similarity"] = similarity_score(display_name, profile_data["screen_name"]) # Similarity to user handle
@@ -75,41 +106,18 @@ def get_profile_metadata(profile_data, tnlp_models):
     if meta_dict["LC_field_populated"]:
 
             # Split the location field (seperated by commas or slashes)
-            tokens = re.split(r'[,/]', location)
-            location_split = [token.strip() for token in tokens if token.strip()]
+            location_split = split_location(location)
 
             # Number of levels listed 
             meta_dict["LC_level_count"] = len(location_split)
 
-            # Identify location levels 
-            location_levels = {
-                "level_identified": [],
-                "level_type": []
-            }
-
-            try:
-                for level in location_split:
-                    geo_location = get_geocode(app, level)
-
-                    if geo_location:
-                        # Append 1 if level is identified
-                        location_levels["level_identified"].append(1)
-
-                        # Append the address type
-                        location_levels["level_type"].append(geo_location.raw.get("addresstype"))
-                    
-                    else: 
-                        # Append 0 if level is not identified
-                        location_levels["level_identified"].append(0)
-
-                    time.sleep(1)  # prevents exceeding rate limit
-            
-                # Append to metadata dictionary
-                meta_dict["LC_levels_identified"] = sum(location_levels["level_identified"])
-                meta_dict["LC_level_types"] = location_levels["level_type"]
-
-            except Exception as e:
-                meta_dict["LC_levels_identified"] = str(e)
+            if defer_locations:
+                # Left to the I/O lane, which looks the levels up while the pool carries on (see add_location_levels)
+                meta_dict["LC_levels_identified"] = None
+                meta_dict["LC_level_types"] = None
+                meta_dict[PENDING_LOCATION_KEY] = location_split
+            else:
+                meta_dict.update(identify_location_levels(location_split))
 
     ## - 04: DESCRIPTION - ##
     description = profile_data["description"]
@@ -120,10 +128,15 @@ def get_profile_metadata(profile_data, tnlp_models):
     if meta_dict["DS_field_populated"]:
 
         try:
-            # Predicted language
-            meta_dict["DS_language"] = detect(description)
+            # Predicted language and its probability
+            if languages is not None and description in languages:
+                language, probability = languages[description]
+            else:
+                language, probability = identify_languages([description])[0]
         except Exception as e:
-            meta_dict["DS_language"] = str(e)
+            language, probability = str(e), None
+        meta_dict["DS_language"] = language
+        meta_dict["DS_language_prob"] = probability
 
         # Derive textual features
         description_text_features = get_tweet_text_features(description,tnlp_models,expanded_urls=None)
@@ -132,4 +145,35 @@ def get_profile_metadata(profile_data, tnlp_models):
         meta_dict.update({f'DS_{key}': value for key, value in description_text_features.items()})
 
     # Return metadata dictionary
-    return meta_dict
\ No newline at end of file
+    return meta_dict
+
+# Profile metadata for each row of a batch, identifying the language of every description in one call
+# and looking up the batch's locations in the background while the rows are processed (or, with
+# defer_locations, leaving them to the I/O lane)
+@profiled("profile_metadata_batch")
+def get_profile_metadata_batch(profiles, tnlp_models, defer_locations=False):
+    descriptions = [text for text in profiles["description"].tolist() if text and isinstance(text, str)]
+    languages = dict(zip(descriptions, identify_languages(descriptions)))
+
+    tokens = [] if defer_locations else location_tokens(profiles)
+    with lookahead_geocoding(tokens):
+        return profiles.apply(get_profile_metadata, axis=1, args=(tnlp_models, languages, defer_locations)).tolist()
+
+# Location tokens of every profile, in row order
+def location_tokens(profiles):
+    return [token for location in profiles["location"].tolist() if location and isinstance(location, str)
+            for token in split_location(location)]
+
+# Fill in the location levels deferred to the I/O lane, looking up each level with lookup
+@profiled("location_levels")
+def add_location_levels(rows, lookup):
+    for row in rows:
+        if not row or PENDING_LOCATION_KEY not in row:
+            continue
+        levels = identify_location_levels(row.pop(PENDING_LOCATION_KEY), lookup)
+        row["LC_levels_identified"] = levels["LC_levels_identified"]
+        if "LC_level_types" in levels:
+            row["LC_level_types"] = levels["LC_level_types"]
+        else:
+            del row["LC_level_types"]
+    return rows
\ No newline at end of file
@@ -1,9 +1,22 @@
+import numbers
+import numpy as np
 import pandas as pd
 import re
 from get_tweet_text_features import get_tweet_text_features
+from instrumentation import profiled
+from language_id import identify_languages
+from text_analysis_functions import strip_text
+from url_bias_checker import url_bias_check_batch
+
+# Expanded URLs in the entities_urls field
+EXPANDED_URL_PATTERN = re.compile(r"'expanded_url': '([^']+)'")
+
+# Engagement metrics of the tweet (_x) and the referenced tweet (_y)
+ENGAGEMENT_COUNTS = ["retweet_count", "reply_count", "like_count", "quote_count"]
 
 #### ---- FUNCTION: GET POST METADATA ---- ###
 
+@profiled("tweet_metadata")
 def get_tweet_metadata(tweet, tnlp_models):
 
     # Break the function early if row data is missing
@@ -120,7 +133,7 @@ def get_tweet_metadata(tweet, tnlp_models):
         
         # Extract any expanded URLs
         if bool(tweet["entities_urls"]):
-            expanded_urls = re.findall(r"'expanded_url': '([^']+)'", tweet["entities_urls"])
+            expanded_urls = EXPANDED_URL_PATTERN.findall(tweet["entities_urls"])
         else:
             expanded_urls = None
 
@@ -134,4 +147,172 @@ def get_tweet_metadata(tweet, tnlp_models):
         return
 
     # Return metadata data frame
-    return meta_dict
\ No newline at end of file
+    return meta_dict
+
+#### ---- FUNCTION: GET POST METADATA FOR A WHOLE BATCH ---- ###
+
+# The same variables as get_tweet_metadata for every row of a data frame (None for skipped rows), with the
+# non-text variables computed column-wise. Rows whose values the column-wise path cannot reproduce exactly
+# (e.g. missing counts or unparseable dates, which raise in get_tweet_metadata) are passed to get_tweet_metadata.
+@profiled("tweet_metadata_batch")
+def get_tweet_metadata_batch(tweets, tnlp_models):
+
+    # Column values as get_tweet_metadata sees them in each row
+    columns = {column: tweets[column].tolist() for column in
+               ["ID", "created_at_x", "referenced_tweet_type", "source_x", "language_x", "reply_settings_x",
+                "created_at_y", "source_y", "language_y", "entities_urls", "tweet_text"]}
+
+    # Rows with missing row data are skipped
+    kept = is_populated(columns["created_at_x"])
+    referenced = kept & is_populated(columns["referenced_tweet_type"])
+
+    ## - 02: Post Created Date - ##
+    created_date = format_dates(columns["created_at_x"], kept)
+    RT_created_date = format_dates(columns["created_at_y"], referenced)
+
+    ## - 05: Engagement Metrics - ##
+    counts_x = {name: tweets[f"{name}_x"].tolist() for name in ENGAGEMENT_COUNTS}
+    counts_y = {name: tweets[f"{name}_y"].tolist() for name in ENGAGEMENT_COUNTS}
+    total_engagement, reply_ratio = engagement_metrics(counts_x)
+    RT_total_engagement, RT_reply_ratio = engagement_metrics(counts_y)
+
+    ## - 06/07: Media Attachment and Geo-Location Tag - ##
+    contains_media = tweets["media_keys"].to_numpy(dtype=object).astype(bool).tolist()
+    contains_geotag = tweets["geo_coordinates"].to_numpy(dtype=object).astype(bool).tolist()
+
+    ## - 10: Expanded URLs - ##
+    entities_urls = columns["entities_urls"]
+    urls_valid = np.array([not value or isinstance(value, str) for value in entities_urls], dtype=bool)
+
+    # Rows computed column-wise; the others (e.g. referenced tweets without a created date) are left to
+    # get_tweet_metadata, which raises or differs there
+    exact = (kept & np.array([date is not None for date in created_date], dtype=bool) &
+             ~np.isnan(total_engagement) & urls_valid)
+    exact &= ~referenced | (np.array([date is not None for date in RT_created_date], dtype=bool) &
+                            ~np.isnan(RT_total_engagement))
+
+    total_engagement = integers(total_engagement, exact)
+    reply_ratio = integers(reply_ratio, exact)
+    RT_total_engagement = integers(RT_total_engagement, exact & referenced)
+    RT_reply_ratio = integers(RT_reply_ratio, exact & referenced)
+
+    # Expanded URLs of every row computed column-wise, matched against MBFC in one pass
+    expanded_urls = [EXPANDED_URL_PATTERN.findall(entities_urls[i]) if exact[i] and entities_urls[i] else None
+                     for i in range(len(tweets))]
+    url_mbfc_scores = url_bias_check_batch(expanded_urls)
+
+    rows = [None] * len(tweets)
+    for i in np.flatnonzero(exact):
+        meta_dict = {
+            "ID": columns["ID"][i],
+            "post_type": columns["referenced_tweet_type"][i] if referenced[i] else "original",
+            "created_date": created_date[i],
+            "post_source": columns["source_x"][i],
+            "post_language": columns["language_x"][i],
+            "retweet_count": counts_x["retweet_count"][i],
+            "reply_count": counts_x["reply_count"][i],
+            "like_count": counts_x["like_count"][i],
+            "quote_count": counts_x["quote_count"][i],
+            "total_engagement": total_engagement[i],
+            "reply_ratio": reply_ratio[i],
+            "contains_media": contains_media[i],
+            "contains_geotag": contains_geotag[i],
+            "reply_settings": columns["reply_settings_x"][i],
+        }
+
+        if referenced[i]:
+            meta_dict.update({
+                "RT_created_date": RT_created_date[i],
+                "RT_post_source": columns["source_y"][i],
+                "RT_post_language": columns["language_y"][i],
+                "RT_retweet_count": counts_y["retweet_count"][i],
+                "RT_reply_count": counts_y["reply_count"][i],
+                "RT_like_count": counts_y["like_count"][i],
+                "RT_quote_count": counts_y["quote_count"][i],
+                "RT_total_engagement": RT_total_engagement[i],
+                "RT_reply_ratio": RT_reply_ratio[i],
+            })
+
+        # Derive textual features (per text, with the URL matches above; see add_batch_text_features for the
+        # batch-level stage)
+        try:
+            tweet_text_features = get_tweet_text_features(columns["tweet_text"][i], tnlp_models, expanded_urls=expanded_urls[i],
+                                                          url_mbfc_score=url_mbfc_scores[i])
+        except AttributeError:
+            continue
+
+        meta_dict.update({f'TEXT_{key}': value for key, value in tweet_text_features.items()})
+        rows[i] = meta_dict
+
+    # Everything else row by row, exactly as before
+    fallback = np.flatnonzero(kept & ~exact)
+    if len(fallback):
+        fallback_rows = tweets.iloc[fallback].apply(get_tweet_metadata, axis=1, args=(tnlp_models,)).tolist()
+        for i, meta_dict in zip(fallback, fallback_rows):
+            rows[i] = meta_dict
+
+    return rows
+
+# Language identified from the text of each tweet (to check language_x), added to the rows of a batch;
+# None where the text has nothing left to identify once URLs, mentions and emojis are stripped
+@profiled("tweet_language")
+def add_tweet_languages(rows, tweets):
+    texts = [strip_text(text) if row is not None and isinstance(text, str) else ""
+             for row, text in zip(rows, tweets["tweet_text"].tolist())]
+    identified = iter(identify_languages([text for text in texts if text]))
+
+    for row, text in zip(rows, texts):
+        if row is not None:
+            row["post_language_detected"], row["post_language_detected_prob"] = next(identified) if text else (None, None)
+    return rows
+
+# Whether each value is not None (as tested with "!= None" in get_tweet_metadata)
+def is_populated(values):
+    return np.fromiter((value is not None for value in values), dtype=bool, count=len(values))
+
+# "%Y-%m-%d" dates of the selected values, parsed in one call where they share a format (None where not
+# selected, or where get_tweet_metadata could not format the date)
+def format_dates(values, selected):
+    dates = [None] * len(values)
+    positions = np.flatnonzero(selected)
+    if not len(positions):
+        return dates
+
+    try:
+        formatted = pd.to_datetime(pd.Series([values[i] for i in positions], dtype=object)).dt.strftime("%Y-%m-%d").tolist()
+    except (ValueError, TypeError, OverflowError, AttributeError):
+        # Mixed formats or time zones: parse each distinct value on its own, as get_tweet_metadata does
+        parsed = {}
+        formatted = []
+        for i in positions:
+            key = (type(values[i]), values[i])
+            if key not in parsed:
+                try:
+                    parsed[key] = pd.to_datetime(values[i]).date().strftime("%Y-%m-%d")
+                except (ValueError, TypeError, OverflowError, AttributeError):
+                    parsed[key] = None
+            formatted.append(parsed[key])
+
+    for i, date in zip(positions, formatted):
+        dates[i] = date if isinstance(date, str) else None
+    return dates
+
+# Total engagement and reply ratio (replies / (retweets + likes), 0 where that divides by zero) as floats,
+# NaN where a count is not a number
+def engagement_metrics(counts):
+    retweets, replies, likes, quotes = [
+        np.array([value if isinstance(value, numbers.Real) else np.nan for value in counts[name]], dtype=float)
+        for name in ENGAGEMENT_COUNTS]
+
+    total_engagement = retweets + replies + likes + quotes
+    total_engagement[~np.isfinite(total_engagement)] = np.nan
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = retweets + likes
+        reply_ratio = np.where(denominator == 0, 0.0, replies / np.where(denominator == 0, 1.0, denominator))
+
+    return np.trunc(total_engagement), np.trunc(reply_ratio)
+
+# Truncated floats as Python integers (as int() in get_tweet_metadata) for the selected rows
+def integers(values, selected):
+    return np.where(selected, values, 0).astype(np.int64).tolist()
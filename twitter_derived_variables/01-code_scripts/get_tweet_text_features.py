@@ -1,11 +1,39 @@
-import re
-import textstat as ts
-import emoji
-
-from text_analysis_functions import strip_text, count_capitals, grammar_score
+from text_analysis_functions import grammar_score, grammar_scores
+from text_counts import surface_counts, text_counts, text_counts_many
 from url_bias_checker import url_bias_check
-
-def get_tweet_text_features(text,tnlp_models,expanded_urls=None):
+from feature_cache import get_feature_cache
+from instrumentation import profiled, stage
+
+# Placeholder key for stripped text awaiting batch-level scoring
+PENDING_TEXT_KEY = "tnlp_pending_text"
+
+# TweetNLP models, in the order expected by tnlp_models
+TNLP_MODEL_NAMES = ['topic_classification', 'sentiment', 'irony',
+                    'offensive', 'emotion', 'hate', 'ner']
+
+# Revision of the language features below; bump it when they change, so cached features are recomputed
+LANGUAGE_FEATURES_REVISION = 1
+
+# Names everything that computes the language features, for feature_cache keys
+# (tnlp_backend is from tnlp_backends.make_tnlp_backend; None for the PyTorch models). The grammar mode
+# is part of it, as texts batched into one LanguageTool request (--grammar_batch_chars) can score differently.
+def language_feature_version(tnlp_backend=None, grammar_servers=0, grammar_batch_chars=0):
+    from importlib import metadata
+    grammar_mode = f"server,batch_chars={grammar_batch_chars}" if grammar_servers else "local"
+    versions = [f"revision={LANGUAGE_FEATURES_REVISION}", f"grammar=en-US({grammar_mode})", "models=" + ",".join(TNLP_MODEL_NAMES)]
+    if tnlp_backend is not None:
+        versions.append(f"backend={tnlp_backend.version()}")
+    for package in ["textstat", "language_tool_python", "tweetnlp"]:
+        try:
+            versions.append(f"{package}={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package}=none")
+    return ";".join(versions)
+
+# url_mbfc_score: the MBFC matches of expanded_urls, when already resolved for the whole batch
+# (see get_tweet_metadata_batch)
+@profiled("text_features")
+def get_tweet_text_features(text,tnlp_models,expanded_urls=None,url_mbfc_score=None):
     
     # Ensure the text input is a string
     if not isinstance(text, str):
@@ -14,24 +42,14 @@ def get_tweet_text_features(text,tnlp_models,expanded_urls=None):
     # Initialize variable dictionary
     vars_dict = {}
 
-    # Strip out unwanted characters (e.g., emojis, URLs, etc.)
-    text_stripped = strip_text(text)
-
-    # Text width
-    vars_dict["post_length"] = len(text)  # Length of post (unstripped)
-
-    # Count special characters
-    vars_dict["exclamation_count"] = text_stripped.count("!")  # Exclamation marks
-    vars_dict["question_mark_count"] = text_stripped.count("?")  # Question marks
-    vars_dict["hashtag_count"] = len(re.findall(r"#\w+", text)) # Hashtags
-    vars_dict["emoji_count"] = emoji.emoji_count(text)  # Emojis
-    vars_dict["mentions_count"] = len(re.findall(r"@\w+", text)) # @Mentions
-    urls = re.findall(r"http[s]?://\S+", text) # URLs
-    vars_dict["url_count"] = len(urls)  # URL count
+    # Strip out unwanted characters (e.g., emojis, URLs, etc.), then count text width and special characters
+    text_stripped, counts = surface_counts(text)
+    vars_dict.update(counts)
 
     # Match URLs against Media Bias/Fact Check database (additional parameter)
     if expanded_urls != None:
-        url_mbfc_score = url_bias_check(expanded_urls)
+        if url_mbfc_score is None:
+            url_mbfc_score = url_bias_check(expanded_urls)
         vars_dict["url_mbfc_matches"] = len(url_mbfc_score["bias"])  # URL MBFC matches
         vars_dict["url_mbfc_bias"] = url_mbfc_score["bias"]  # URL bias score(s)
         vars_dict["url_mbfc_credibility"] = url_mbfc_score["credibility"]  # URL credibility score(s)
@@ -41,63 +59,167 @@ def get_tweet_text_features(text,tnlp_models,expanded_urls=None):
         vars_dict["url_mbfc_credibility"] = []
 
     if text_stripped: # Only calculate if processed text is not empty
-        
-        # Count language features
-        vars_dict["character_count"] = ts.char_count(text_stripped)  # Characters
-        vars_dict["capt_character_count"] = count_capitals(text_stripped)  # Capitalized characters
-        vars_dict["capt_character_prop"] = round(vars_dict["capt_character_count"] /
-                                            vars_dict["character_count"], 3) # Capitalized characters (%)
-        vars_dict["letter_count"] = ts.letter_count(text_stripped)  # Letters
-        vars_dict["word_count"] = ts.lexicon_count(text_stripped)  # Words
-        vars_dict["unique_word_count"] = len(set(text_stripped.lower().split()))  # Unique words
-        vars_dict["sentence_count"] = ts.sentence_count(text_stripped)  # Sentences
-        vars_dict["syllable_count"] = ts.syllable_count(text_stripped)  # Syllables
-        vars_dict["monosyllable_count"] = ts.monosyllabcount(text_stripped)  # Monosyllables
-        vars_dict["polysyllable_count"] = ts.polysyllabcount(text_stripped)  # Polysyllables
-
-        # Calculate language grammaticality, reading ease, and reading grade
-        vars_dict["grammar_score"] = grammar_score(text_stripped)  # Grammaticality score
-        vars_dict["reading_ease"] = ts.flesch_reading_ease(text_stripped)  # Flesch reading ease
-        vars_dict["non_eng_reading_ease"] = ts.mcalpine_eflaw(text_stripped)  # McAlpine reading ease (Non-English Readers)
-        vars_dict["reading_grade"] = ts.text_standard(text_stripped, float_output=True)  # Language reading grade (Consensus)
-
-        # Estimate additional features using TweetNLP
-        topic_model = tnlp_models[0]
-        sentiment_model = tnlp_models[1]
-        irony_model = tnlp_models[2]
-        offensive_model = tnlp_models[3]
-        emotion_model = tnlp_models[4]
-        hate_model = tnlp_models[5]
-        ner_model = tnlp_models[6]
-
-        topics = topic_model.topic(text_stripped, return_probability=True)  # Topic classification
-        vars_dict["topics"] = topics['label']  # Topic labels
-        vars_dict["topic_prob"] = {label: topics["probability"][label] for label in topics["label"]}  # Probabilities for detected topics
-
-        sentiment = sentiment_model.sentiment(text_stripped, return_probability=True)  # Sentiment analysis
-        vars_dict["sentiment"] = sentiment['label']  # Sentiment label
-        vars_dict["sentiment_prob"] = sentiment["probability"][sentiment["label"]]  # Probability for the detected sentiment
-
-        irony = irony_model.irony(text_stripped, return_probability=True)  # Irony detection
-        vars_dict["irony"] = irony['label']  # Irony label
-        vars_dict["irony_prob"] = irony["probability"][irony["label"]]  # Probability for the detected irony
-
-        offensive = offensive_model.offensive(text_stripped, return_probability=True)  # Offensive language detection
-        vars_dict["offensive"] = offensive['label']  # Offensive label
-        vars_dict["offensive_prob"] = offensive["probability"][offensive["label"]]  # Probability for the detected offensive label
-
-        emotion = emotion_model.emotion(text_stripped, return_probability=True)  # Emotion detection
-        vars_dict["emotion"] = emotion['label']  # Emotion label
-        vars_dict["emotion_prob"] = emotion["probability"][emotion["label"]]  # Probability for the detected emotion
-
-        hate = hate_model.hate(text_stripped, return_probability=True)  # Hate detection
-        vars_dict["hate"] = hate['label']  # Hate label
-        vars_dict["hate_prob"] = hate["probability"][hate["label"]]  # Probability for the detected hate
-
-        named_entities = ner_model.ner(text_stripped, return_probability=True)  # Named entity recognition
-        vars_dict["entity_count"] = len(named_entities)  # Count of named entities
-        vars_dict["entity_types"] = [entity['type'] for entity in named_entities]  # Entity types
-        vars_dict["entity_prob"] = [entity['probability'] for entity in named_entities]  # Probabilities for detected entity types
+
+        if tnlp_models is None:
+            # Defer to the batch-level stage, which scores each distinct text once (see add_batch_text_features)
+            vars_dict[PENDING_TEXT_KEY] = text_stripped
+        else:
+            # Reuse the features of identical text scored before
+            cache = get_feature_cache()
+            features = cache.get(text_stripped) if cache is not None else None
+
+            if features is None:
+                features = get_language_features(text_stripped)
+                features["grammar_score"] = grammar_score(text_stripped)  # Grammaticality score
+
+                # Estimate additional features using TweetNLP
+                if not isinstance(tnlp_models, (list, tuple)):
+                    # Models held by another process (e.g. tnlp_server.TNLPClient)
+                    features.update(tnlp_models.run([text_stripped])[0])
+                else:
+                    topic_model = tnlp_models[0]
+                    sentiment_model = tnlp_models[1]
+                    irony_model = tnlp_models[2]
+                    offensive_model = tnlp_models[3]
+                    emotion_model = tnlp_models[4]
+                    hate_model = tnlp_models[5]
+                    ner_model = tnlp_models[6]
+
+                    with stage("tnlp.topic"):
+                        topics = topic_model.topic(text_stripped, return_probability=True)  # Topic classification
+                    with stage("tnlp.sentiment"):
+                        sentiment = sentiment_model.sentiment(text_stripped, return_probability=True)  # Sentiment analysis
+                    with stage("tnlp.irony"):
+                        irony = irony_model.irony(text_stripped, return_probability=True)  # Irony detection
+                    with stage("tnlp.offensive"):
+                        offensive = offensive_model.offensive(text_stripped, return_probability=True)  # Offensive language detection
+                    with stage("tnlp.emotion"):
+                        emotion = emotion_model.emotion(text_stripped, return_probability=True)  # Emotion detection
+                    with stage("tnlp.hate"):
+                        hate = hate_model.hate(text_stripped, return_probability=True)  # Hate detection
+                    with stage("tnlp.ner"):
+                        named_entities = ner_model.ner(text_stripped, return_probability=True)  # Named entity recognition
+
+                    features.update(format_tnlp_outputs(topics, sentiment, irony, offensive, emotion, hate, named_entities))
+
+                if cache is not None:
+                    cache.put(text_stripped, features)
+
+            vars_dict.update(features)
 
     # Return the dictionary of features
-    return vars_dict
\ No newline at end of file
+    return vars_dict
+
+# Language features of stripped text (grammar_score is filled in by the caller, keeping its position)
+# Counted in one pass over the text (see text_counts)
+@profiled("textstat")
+def get_language_features(text_stripped):
+    return text_counts(text_stripped)
+
+# Convert raw TweetNLP outputs for one text into feature variables
+def format_tnlp_outputs(topics, sentiment, irony, offensive, emotion, hate, named_entities):
+
+    vars_dict = {}
+
+    vars_dict["topics"] = topics['label']  # Topic labels
+    vars_dict["topic_prob"] = {label: topics["probability"][label] for label in topics["label"]}  # Probabilities for detected topics
+
+    vars_dict["sentiment"] = sentiment['label']  # Sentiment label
+    vars_dict["sentiment_prob"] = sentiment["probability"][sentiment["label"]]  # Probability for the detected sentiment
+
+    vars_dict["irony"] = irony['label']  # Irony label
+    vars_dict["irony_prob"] = irony["probability"][irony["label"]]  # Probability for the detected irony
+
+    vars_dict["offensive"] = offensive['label']  # Offensive label
+    vars_dict["offensive_prob"] = offensive["probability"][offensive["label"]]  # Probability for the detected offensive label
+
+    vars_dict["emotion"] = emotion['label']  # Emotion label
+    vars_dict["emotion_prob"] = emotion["probability"][emotion["label"]]  # Probability for the detected emotion
+
+    vars_dict["hate"] = hate['label']  # Hate label
+    vars_dict["hate_prob"] = hate["probability"][hate["label"]]  # Probability for the detected hate
+
+    vars_dict["entity_count"] = len(named_entities)  # Count of named entities
+    vars_dict["entity_types"] = [entity['type'] for entity in named_entities]  # Entity types
+    vars_dict["entity_prob"] = [entity['probability'] for entity in named_entities]  # Probabilities for detected entity types
+
+    return vars_dict
+
+# Load the TweetNLP models (as PyTorch models, or through a backend from tnlp_backends)
+def load_tnlp_models(tnlp_backend=None):
+    if tnlp_backend is not None:
+        return tnlp_backend.load()
+    import tweetnlp as tnlp  # Imported here so that model-free processes do not load torch
+    return [tnlp.load_model(name) for name in TNLP_MODEL_NAMES]
+
+# Run each TweetNLP model once over a list of stripped texts
+def run_tnlp_models(texts, tnlp_models, batch_size=None):
+
+    # Models held by another process (e.g. tnlp_server.TNLPClient)
+    if not isinstance(tnlp_models, (list, tuple)):
+        return tnlp_models.run(texts, batch_size=batch_size)
+
+    topic_model, sentiment_model, irony_model, offensive_model, emotion_model, hate_model, ner_model = tnlp_models
+
+    # One padded forward pass per inference batch rather than one per text
+    with stage("tnlp.topic"):
+        topics = topic_model.topic(texts, batch_size=batch_size, return_probability=True)
+    with stage("tnlp.sentiment"):
+        sentiment = sentiment_model.sentiment(texts, batch_size=batch_size, return_probability=True)
+    with stage("tnlp.irony"):
+        irony = irony_model.irony(texts, batch_size=batch_size, return_probability=True)
+    with stage("tnlp.offensive"):
+        offensive = offensive_model.offensive(texts, batch_size=batch_size, return_probability=True)
+    with stage("tnlp.emotion"):
+        emotion = emotion_model.emotion(texts, batch_size=batch_size, return_probability=True)
+    with stage("tnlp.hate"):
+        hate = hate_model.hate(texts, batch_size=batch_size, return_probability=True)
+    with stage("tnlp.ner"):
+        named_entities = ner_model.ner(texts, batch_size=batch_size, return_probability=True)
+
+    return [format_tnlp_outputs(*outputs) for outputs in
+            zip(topics, sentiment, irony, offensive, emotion, hate, named_entities)]
+
+# Batch-level stage: language features, grammar checks and TweetNLP for every deferred text in a list of row dictionaries
+@profiled("batch_text_features")
+def add_batch_text_features(rows, tnlp_models, batch_size=None):
+
+    # Collect (row, prefix, text) for every row with a pending text (e.g. "TEXT_" or "DS_")
+    pending = []
+    for row in rows:
+        if not row:
+            continue
+        for key in [key for key in row if key.endswith(PENDING_TEXT_KEY)]:
+            pending.append((row, key[:-len(PENDING_TEXT_KEY)], row.pop(key)))
+
+    if not pending:
+        return rows
+
+    # Score each distinct text once (retweets and repeated descriptions share the same text)
+    texts = list(dict.fromkeys(text for _, _, text in pending))
+    cache = get_feature_cache()
+    features_by_text = cache.get_many(texts) if cache is not None else {}
+    missing = [text for text in texts if text not in features_by_text]
+
+    if missing:
+        with stage("textstat"):
+            computed = text_counts_many(missing)
+
+        # Check grammar for the whole list at once (batched requests in grammar service mode)
+        for features, score in zip(computed, grammar_scores(missing)):
+            features["grammar_score"] = score
+
+        # Run the models once over the whole list
+        for features, outputs in zip(computed, run_tnlp_models(missing, tnlp_models, batch_size=batch_size)):
+            features.update(outputs)
+
+        computed = dict(zip(missing, computed))
+        if cache is not None:
+            cache.put_many(computed)
+        features_by_text.update(computed)
+
+    # Write results back to the per-row dictionaries (appended last, as in the per-row path)
+    for row, prefix, text in pending:
+        row.update({f"{prefix}{key}": value for key, value in features_by_text[text].items()})
+
+    return rows
\ No newline at end of file
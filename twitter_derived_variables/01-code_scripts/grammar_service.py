@@ -0,0 +1,118 @@
+import os
+
+#### ---- SHARED LANGUAGETOOL SERVICE ---- ###
+
+# Instead of a LanguageTool JVM inside every pool worker, the main process starts one (or N) local
+# LanguageTool servers. Workers send texts over HTTP with a persistent session, concatenating many
+# texts into one request and mapping each error back to its text by offset.
+
+# Texts are joined with a paragraph break, so that each starts a new sentence
+SEPARATOR = "\n\n"
+
+# Offsets reported by LanguageTool count UTF-16 code units (Java characters)
+def utf16_length(text):
+    return len(text.encode("utf-16-le")) // 2
+
+# Start n local LanguageTool servers; returns the tool objects (keep them to shut the servers down)
+def start_grammar_servers(n=1, language="en-US"):
+    import language_tool_python
+    return [language_tool_python.LanguageTool(language) for _ in range(n)]
+
+# Base URL of a server (e.g. "http://127.0.0.1:8081/v2/"), from language_tool_python's public url property,
+# or its host and port
+def grammar_server_url(tool):
+    url = getattr(type(tool), "url", None)
+    if isinstance(url, property):
+        return tool.url
+    host, port = getattr(type(tool), "host", None), getattr(type(tool), "port", None)
+    if isinstance(host, property) and isinstance(port, property):
+        return f"http://{tool.host}:{tool.port}/v2/"
+    raise RuntimeError("Cannot find the LanguageTool server URL: --grammar_servers needs a language_tool_python "
+                       "version with the url (or host and port) property")
+
+# Base URLs of the servers, checking that each one answers
+def grammar_server_urls(tools):
+    import requests
+    urls = [grammar_server_url(tool) for tool in tools]
+    for url in urls:
+        try:
+            requests.get(f"{url}languages", timeout=30).raise_for_status()
+        except requests.RequestException as e:
+            raise RuntimeError(f"LanguageTool server at {url} is not answering: {e}")
+    return urls
+
+def stop_grammar_servers(tools):
+    for tool in tools:
+        tool.close()
+
+# HTTP client for the shared servers, used by pool workers. With batch_chars=0, each text is checked in its
+# own request, as the per-process LanguageTool does; otherwise texts are concatenated into requests of up to
+# batch_chars characters (check parity with compare_grammar_service.py first)
+class GrammarClient:
+
+    def __init__(self, urls, language="en-US", batch_chars=0):
+        self.urls = urls
+        self.language = language
+        self.batch_chars = batch_chars
+        self.session = None
+
+    # Spread workers across servers
+    def url(self):
+        return self.urls[os.getpid() % len(self.urls)]
+
+    def check(self, text):
+        if self.session is None:
+            import requests
+            self.session = requests.Session()  # Reuses the HTTP connection between calls
+        response = self.session.post(f"{self.url()}check", data={"language": self.language, "text": text})
+        response.raise_for_status()
+        return response.json()["matches"]
+
+    # Number of grammar errors in each text, checking up to batch_chars characters per request
+    def count_errors(self, texts):
+        counts = [0] * len(texts)
+
+        batch = []
+        batch_length = 0
+        for i, text in enumerate(texts):
+            if batch and (not self.batch_chars or batch_length + len(text) > self.batch_chars):
+                self.check_batch(batch, texts, counts)
+                batch, batch_length = [], 0
+            batch.append(i)
+            batch_length += len(text) + len(SEPARATOR)
+        if batch:
+            self.check_batch(batch, texts, counts)
+
+        return counts
+
+    def check_batch(self, batch, texts, counts):
+
+        # Start and end offset of each text in the concatenated request
+        spans = []
+        position = 0
+        for i in batch:
+            spans.append((position, position + utf16_length(texts[i]), i))
+            position += utf16_length(texts[i]) + utf16_length(SEPARATOR)
+
+        # Assign each error to the text it starts in (errors within a separator are dropped)
+        for match in self.check(SEPARATOR.join(texts[i] for i in batch)):
+            for start, end, i in spans:
+                if start <= match["offset"] < end:
+                    counts[i] += 1
+                    break
+
+    def __getstate__(self):
+        return {"urls": self.urls, "language": self.language, "batch_chars": self.batch_chars}
+
+    def __setstate__(self, state):
+        self.__init__(state["urls"], language=state["language"], batch_chars=state["batch_chars"])
+
+# GLOBAL VARIABLE shared in each process (but not across them)
+_client = None
+
+def set_grammar_client(client):
+    global _client
+    _client = client
+
+def get_grammar_client():
+    return _client
@@ -0,0 +1,204 @@
+import datetime
+import hashlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from input_readers import get_input_format, read_input_blocks
+
+#### ---- INCREMENTAL RUNS ---- ###
+
+# With --incremental, each input row gets a key (its identity) and a fingerprint (its source values and
+# the pipeline version). A SQLite row index next to the output records the fingerprint of every row already
+# in the output dataset, so a new input (e.g. a day's collection, or a re-collection with updated counts)
+# only computes the rows that are new or have changed. Their outputs carry the row key in a "row_key"
+# column, and replace the older rows with the same key when merged into the existing Parquet dataset.
+
+# Bump when the metadata functions change what they compute, so that every row is recomputed
+PIPELINE_REVISION = 1
+
+# Columns that identify a row: the ID, and for tweets (which have no tweet ID in the linked exports) its
+# created time and type. Rows with the same identity are told apart by their order in the input.
+KEY_COLUMNS = {
+    "profile": ["ID"],
+    "tweet": ["ID", "created_at_x", "referenced_tweet_type"],
+}
+
+# Columns the metadata functions read (see get_profile_metadata and get_tweet_metadata_batch)
+SOURCE_COLUMNS = {
+    "profile": ["ID", "created_at", "followers_count", "following_count", "tweet_count", "listed_count",
+                "display_name", "screen_name", "location", "description"],
+    "tweet": ["ID", "created_at_x", "referenced_tweet_type", "source_x", "language_x", "reply_settings_x",
+              "retweet_count_x", "reply_count_x", "like_count_x", "quote_count_x", "media_keys", "geo_coordinates",
+              "created_at_y", "source_y", "language_y", "retweet_count_y", "reply_count_y", "like_count_y",
+              "quote_count_y", "entities_urls", "tweet_text"],
+}
+
+# Column of the row key in incremental outputs
+ROW_KEY = "row_key"
+
+# Text of a value that is the same however the input was read (e.g. 3 and 3.0 from a column with missing
+# values, or None and NaN)
+def canonical_value(value):
+    if value is None or value is pd.NaT or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return str(bool(value))
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+def digest(values):
+    return hashlib.blake2b("\0".join(values).encode("utf-8"), digest_size=16).hexdigest()
+
+# Blocks of the whole input (pickles are read in one go, unless already loaded as df)
+def input_blocks(path, df=None):
+    if get_input_format(path) == "pickle":
+        return [pd.read_pickle(path) if df is None else df]
+    return read_input_blocks(path)
+
+# (ID, row key, fingerprint) of every input row, in input order (df: the pickled input if already loaded)
+def read_row_keys(path, function_type, version, df=None):
+    key_columns = KEY_COLUMNS[function_type]
+    occurrences = {}
+    ids, keys, fingerprints = [], [], []
+    for block in input_blocks(path, df=df):
+        source_columns = [column for column in SOURCE_COLUMNS[function_type] if column in block]
+        key_values = zip(*(block[column].tolist() for column in key_columns))
+        source_values = zip(*(block[column].tolist() for column in source_columns))
+        for key_row, source_row in zip(key_values, source_values):
+            identity = digest(canonical_value(value) for value in key_row)
+            occurrence = occurrences.get(identity, 0)
+            occurrences[identity] = occurrence + 1
+            keys.append(digest([identity, str(occurrence)]))
+            fingerprints.append(digest([version, *(canonical_value(value) for value in source_row)]))
+        ids += block["ID"].tolist()
+    return pd.DataFrame({"ID": ids, ROW_KEY: keys, "fingerprint": fingerprints})
+
+# Row index path for an output file path prefix
+def row_index_path(file_path):
+    return f"{file_path}_rows.sqlite"
+
+# Fingerprints of the rows in an incremental output dataset, by row key
+class RowIndex:
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS rows (
+                                 row_key TEXT PRIMARY KEY,
+                                 fingerprint TEXT NOT NULL,
+                                 updated_at REAL NOT NULL)""")
+        self.conn.commit()
+
+    # Whether each row is new or has changed since it was last merged
+    def changed(self, keys, fingerprints):
+        stored = {}
+        for i in range(0, len(keys), 500):  # Stay below SQLite's limit on query parameters
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            stored.update(self.conn.execute(f"SELECT row_key, fingerprint FROM rows WHERE row_key IN ({placeholders})", chunk))
+        return np.array([stored.get(key) != fingerprint for key, fingerprint in zip(keys, fingerprints)], dtype=bool)
+
+    # Record the fingerprints of merged rows
+    def update(self, keys, fingerprints):
+        now = time.time()
+        self.conn.executemany("""INSERT INTO rows (row_key, fingerprint, updated_at) VALUES (?, ?, ?)
+                                 ON CONFLICT (row_key) DO UPDATE SET
+                                     fingerprint = excluded.fingerprint, updated_at = excluded.updated_at""",
+                              [(key, fingerprint, now) for key, fingerprint in zip(keys, fingerprints)])
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+def part_paths(dataset_path):
+    if not os.path.isdir(dataset_path):
+        return []
+    return [os.path.join(dataset_path, file_name) for file_name in sorted(os.listdir(dataset_path))
+            if file_name.startswith("part-") and file_name.endswith(".parquet")]
+
+# Whether an existing output dataset can be merged into (written with --incremental), or there is none yet
+def has_row_keys(dataset_path):
+    import pyarrow.parquet as pq
+    parts = part_paths(dataset_path)
+    return not parts or ROW_KEY in pq.read_schema(parts[0]).names
+
+# Link a part file into the merged dataset without copying it where possible
+def link_part(source, destination):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+# Merge the parts of an update dataset into an output dataset, dropping the output rows whose key is in
+# replaced_keys. Parts without replaced rows are kept as they are; the merged dataset replaces the old one
+# in a single rename. Returns the merged dataset's manifest.
+def merge_update(dataset_path, update_path, replaced_keys, update_manifest):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    merging_path = f"{dataset_path}.merging"
+    shutil.rmtree(merging_path, ignore_errors=True)
+    os.makedirs(merging_path)
+
+    replaced = pa.array(list(replaced_keys), type=pa.string())
+    files = {}
+    rows_replaced = 0
+
+    def add_part(source, table=None):
+        part_path = os.path.join(merging_path, f"part-{len(files):05d}.parquet")
+        if table is None:
+            link_part(source, part_path)
+            files[part_path] = pq.ParquetFile(part_path).metadata.num_rows
+        else:
+            pq.write_table(table, part_path)
+            files[part_path] = table.num_rows
+
+    for part in part_paths(dataset_path):
+        is_replaced = pc.is_in(pq.read_table(part, columns=[ROW_KEY])[ROW_KEY], value_set=replaced)
+        count = pc.sum(is_replaced).as_py() or 0
+        if not count:
+            add_part(part)
+            continue
+        rows_replaced += count
+        kept = pq.read_table(part).filter(pc.invert(is_replaced))
+        if kept.num_rows:
+            add_part(part, kept)
+
+    for part in part_paths(update_path):
+        add_part(part)
+
+    # Swap the merged dataset in, with paths as they will be once renamed
+    old_path = f"{dataset_path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.isdir(dataset_path):
+        os.replace(dataset_path, old_path)
+    os.replace(merging_path, dataset_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    manifest = dict(update_manifest,
+                    path=dataset_path,
+                    completed_at=datetime.datetime.now().isoformat(timespec="seconds"),
+                    files=[{"path": os.path.join(dataset_path, os.path.basename(path)), "rows": rows}
+                           for path, rows in files.items()],
+                    rows_written=sum(files.values()),
+                    rows_added=update_manifest["rows_written"],
+                    rows_replaced=rows_replaced)
+    with open(os.path.join(dataset_path, "_manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
\ No newline at end of file
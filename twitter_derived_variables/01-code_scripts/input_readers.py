@@ -0,0 +1,158 @@
+import math
+import os
+import pandas as pd
+
+#### ---- INPUT READERS ---- ###
+
+# Rows read from disk at a time for streamed formats (independent of --batch_size)
+READ_BLOCK_ROWS = 1024
+
+# Input formats by file extension
+INPUT_FORMATS = {
+    ".pkl": "pickle",
+    ".pickle": "pickle",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+}
+
+def get_input_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in INPUT_FORMATS:
+        raise ValueError(f"Unsupported input format '{extension}'. Expected one of: {', '.join(INPUT_FORMATS)}")
+    return INPUT_FORMATS[extension]
+
+# Open an Arrow IPC file (random access) or stream, memory-mapped
+def open_arrow(path):
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    source = pa.memory_map(path)
+    try:
+        reader = ipc.open_file(source)
+        return (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        source.seek(0)
+        return iter(ipc.open_stream(source))
+
+# Count input rows without materialising the data (None where this needs a full read)
+def count_input_rows(path):
+    input_format = get_input_format(path)
+    if input_format == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    if input_format == "arrow":
+        return sum(record_batch.num_rows for record_batch in open_arrow(path))
+    return None
+
+# Text columns read back from Parquet/Arrow/JSON can hold NaN for missing values, whereas the
+# pickled inputs (and the metadata functions' "!= None" / bool() checks) expect None
+def restore_missing_as_none(df):
+    for column in df.columns:
+        if df[column].dtype == object or pd.api.types.is_string_dtype(df[column]):
+            df[column] = df[column].astype(object).where(df[column].notna(), None)
+    return df
+
+# Lazily read DataFrame blocks from a streamed format
+def read_input_blocks(path, block_size=READ_BLOCK_ROWS):
+    input_format = get_input_format(path)
+
+    if input_format == "parquet":
+        import pyarrow.parquet as pq
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=block_size):
+            yield restore_missing_as_none(record_batch.to_pandas())
+
+    elif input_format == "arrow":
+        for record_batch in open_arrow(path):
+            # Record batches can be arbitrarily large, so slice them (zero-copy) before converting
+            for offset in range(0, record_batch.num_rows, block_size):
+                yield restore_missing_as_none(record_batch.slice(offset, block_size).to_pandas())
+
+    elif input_format == "jsonl":
+        with pd.read_json(path, lines=True, chunksize=block_size) as reader:
+            for chunk in reader:
+                yield restore_missing_as_none(chunk)
+
+    else:
+        raise ValueError(f"Input format '{input_format}' cannot be streamed")
+
+# Yield (batch_start, batch_df) pairs from an in-memory DataFrame, sliced lazily (up to end_row, exclusive)
+def iter_dataframe_batches(df, batch_size, start_row=0, end_row=None):
+    end_row = len(df) if end_row is None else min(end_row, len(df))
+    for batch_start in range(start_row, end_row, batch_size):
+        yield batch_start, df.iloc[batch_start:min(batch_start + batch_size, end_row)].copy()
+
+# Yield (batch_start, batch_df) pairs of batch_size rows streamed from disk, from start_row onwards
+# (up to end_row, exclusive)
+def iter_input_batches(path, batch_size, start_row=0, end_row=None):
+
+    position = 0
+    remainder = None
+    for block in read_input_blocks(path, max(batch_size, READ_BLOCK_ROWS)):
+
+        # Index rows by their absolute position in the input
+        block.index = pd.RangeIndex(position, position + len(block))
+        position += len(block)
+
+        # Skip rows before the start row
+        if len(block) == 0 or block.index[-1] < start_row:
+            continue
+        block = block.iloc[max(0, start_row - block.index[0]):]
+
+        # Stop at the end row
+        if end_row is not None:
+            block = block.iloc[:max(0, end_row - block.index[0])]
+            if len(block) == 0:
+                break
+
+        if remainder is not None:
+            block = pd.concat([remainder, block])
+
+        # Emit full batches and carry the rest over to the next block
+        full_rows = len(block) - len(block) % batch_size
+        for offset in range(0, full_rows, batch_size):
+            batch_df = block.iloc[offset:offset + batch_size].copy()
+            yield batch_df.index[0], batch_df
+        remainder = block.iloc[full_rows:] if full_rows < len(block) else None
+
+    if remainder is not None:
+        yield remainder.index[0], remainder.copy()
+
+# Open the input as a lazy batch iterator, returning (batches, total_batches or None if unknown)
+# df: the pickled input if already loaded (see read_pickle_input)
+def open_input_batches(path, batch_size, start_row=0, end_row=None, df=None):
+
+    # Pickles cannot be read partially, so load the whole frame (the legacy path)
+    if get_input_format(path) == "pickle":
+        df = pd.read_pickle(path) if df is None else df
+        total_rows = len(df) if end_row is None else min(end_row, len(df))
+        total_batches = math.ceil(max(0, total_rows - start_row) / batch_size)
+        return iter_dataframe_batches(df, batch_size, start_row=start_row, end_row=end_row), total_batches
+
+    total_rows = count_input_rows(path)
+    if end_row is not None:
+        total_rows = end_row if total_rows is None else min(end_row, total_rows)
+    total_batches = None if total_rows is None else math.ceil(max(0, total_rows - start_row) / batch_size)
+    return iter_input_batches(path, batch_size, start_row=start_row, end_row=end_row), total_batches
+
+# The whole input if it is a pickle, which cannot be read partially (None for the streamed formats), so
+# that one load serves both its row count and its batches
+def read_pickle_input(path):
+    return pd.read_pickle(path) if get_input_format(path) == "pickle" else None
+
+# Selected columns of the whole input (e.g. to count its rows, or to check merged shards against it)
+def read_input_columns(path, columns):
+    if get_input_format(path) == "pickle":
+        return pd.read_pickle(path)[columns]
+    blocks = [block[columns] for block in read_input_blocks(path)]
+    return pd.concat(blocks, ignore_index=True) if blocks else pd.DataFrame(columns=columns)
+
+# Hold back batches until the pool has finished with earlier ones, so that
+# at most max_pending batches are in memory (Pool.imap consumes its input eagerly)
+def bounded(iterable, semaphore):
+    for item in iterable:
+        semaphore.acquire()
+        yield item
@@ -0,0 +1,162 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+#### ---- PER-STAGE PROFILING ---- ###
+
+# With --profile, each process times the pipeline stages (wall and CPU time, call counts) and samples its
+# resident memory after each batch. Workers return their figures with each batch result; the main process
+# aggregates them into a summary table and a Chrome trace (open in chrome://tracing or https://ui.perfetto.dev).
+# Stage times are inclusive, so nested stages (e.g. "tnlp.topic" within "text_features") are also counted
+# in their parents. When profiling is off, stages cost a single global lookup.
+
+# Resident memory (MB) of a process, read from /proc (Linux only)
+def get_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return 0.0
+
+class StageProfiler:
+
+    def __init__(self, max_events=100000):
+        self.max_events = max_events  # Trace events kept by this process (stage totals are always kept)
+        self.pid = os.getpid()
+        self.reset()
+        self.traced = 0
+        self.dropped = 0
+
+    def reset(self):
+        self.stats = {}  # {stage: [calls, wall seconds, cpu seconds]}
+        self.events = []
+        self.peak_rss_mb = 0.0
+
+    def record(self, name, start, wall, cpu):
+        stats = self.stats.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += wall
+        stats[2] += cpu
+
+        if self.traced < self.max_events:
+            self.traced += 1
+            self.events.append({"name": name, "ph": "X", "pid": self.pid, "tid": threading.get_ident(),
+                                "ts": round(start * 1e6), "dur": round(wall * 1e6, 1)})
+        else:
+            self.dropped += 1
+
+    def sample_rss(self):
+        rss_mb = get_rss_mb(self.pid)
+        self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+        self.events.append({"name": "rss_mb", "ph": "C", "pid": self.pid, "ts": round(time.time() * 1e6),
+                            "args": {"rss_mb": round(rss_mb, 1)}})
+
+    # Hand over the figures recorded since the last collect (e.g. with a batch result)
+    def collect(self):
+        self.sample_rss()
+        profile = {"pid": self.pid, "stats": self.stats, "events": self.events,
+                   "peak_rss_mb": self.peak_rss_mb, "dropped": self.dropped}
+        self.reset()
+        self.dropped = 0
+        return profile
+
+# GLOBAL VARIABLE shared in each process (but not across them)
+_profiler = None
+
+def enable_profiling(max_events=100000):
+    global _profiler
+    _profiler = StageProfiler(max_events=max_events)
+
+def get_profiler():
+    return _profiler
+
+# Time a block of code as a named stage
+@contextmanager
+def stage(name):
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    start = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        profiler.record(name, start, time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+
+# Time every call of a function as a named stage
+def profiled(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return function(*args, **kwargs)
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Combines the figures collected from every process
+class ProfileReport:
+
+    def __init__(self):
+        self.stats = {}
+        self.events = []
+        self.peak_rss_mb = {}  # {pid: MB}
+        self.dropped = 0
+
+    def add(self, profile):
+        if not profile:
+            return
+        for name, (calls, wall, cpu) in profile["stats"].items():
+            stats = self.stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += calls
+            stats[1] += wall
+            stats[2] += cpu
+        self.events.extend(profile["events"])
+        pid = profile["pid"]
+        self.peak_rss_mb[pid] = max(self.peak_rss_mb.get(pid, 0.0), profile["peak_rss_mb"])
+        self.dropped += profile["dropped"]
+
+    def summary(self, elapsed=None, rows=None):
+        total_wall = self.stats.get("batch", [0, 0.0, 0.0])[1]
+        stages = []
+        for name, (calls, wall, cpu) in sorted(self.stats.items(), key=lambda item: -item[1][1]):
+            stages.append({
+                "stage": name,
+                "calls": calls,
+                "wall_s": round(wall, 3),
+                "cpu_s": round(cpu, 3),
+                "mean_ms": round(1000 * wall / calls, 3) if calls else 0.0,
+                "batch_pct": round(100 * wall / total_wall, 1) if total_wall else None,  # Share of worker batch time
+            })
+        return {
+            "elapsed_s": round(elapsed, 3) if elapsed is not None else None,
+            "rows": rows,
+            "rows_per_second": round(rows / elapsed, 2) if elapsed and rows else None,
+            "peak_rss_mb": {str(pid): round(rss, 1) for pid, rss in self.peak_rss_mb.items()},
+            "dropped_trace_events": self.dropped,
+            "stages": stages,
+        }
+
+    def print_summary(self, summary):
+        print(f"\n[PROFILE] {summary['rows']} rows in {summary['elapsed_s']}s ({summary['rows_per_second']} rows/s)")
+        print(f"{'stage':<28}{'calls':>10}{'wall s':>12}{'cpu s':>12}{'mean ms':>12}{'% batch':>9}")
+        for row in summary["stages"]:
+            batch_pct = "" if row["batch_pct"] is None else row["batch_pct"]
+            print(f"{row['stage']:<28}{row['calls']:>10}{row['wall_s']:>12}{row['cpu_s']:>12}{row['mean_ms']:>12}{batch_pct:>9}")
+        peak = summary["peak_rss_mb"]
+        if peak:
+            print(f"Peak RSS: {max(peak.values())} MB (max of {len(peak)} processes), {sum(peak.values()):.1f} MB summed")
+
+    # Chrome trace format, with the summary alongside
+    def write(self, path, summary):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms", "summary": summary}, f)
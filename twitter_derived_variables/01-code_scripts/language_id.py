@@ -0,0 +1,134 @@
+from instrumentation import profiled
+
+#### ---- LANGUAGE IDENTIFIERS ---- ###
+
+# Every identifier has an identify_many(texts) method returning a (language, probability) pair for each
+# text, and a load() method for its model. Results do not depend on the order of the texts or on the
+# other texts in the batch, so the same text always gets the same language.
+
+# langdetect (the original DS_language), seeded so that it gives the same answer on every run.
+# Texts it cannot identify (e.g. no letters) get its error message as the language, as before.
+# The seed is set on this identifier's own detector factory, whose detectors each sample n-grams with their
+# own random.Random, so neither the process-global random nor langdetect's shared DetectorFactory is seeded.
+class LangdetectIdentifier:
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.factory = None
+
+    def load(self):
+        if self.factory is None:
+            from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+            factory = DetectorFactory()
+            factory.load_profile(PROFILES_DIRECTORY)
+            factory.set_seed(self.seed)  # Otherwise each detection samples n-grams at random
+            self.factory = factory
+        return self.factory
+
+    def identify_many(self, texts):
+        from langdetect.lang_detect_exception import LangDetectException
+        factory = self.load()
+
+        results = []
+        for text in texts:
+            try:
+                detector = factory.create()
+                detector.append(text)
+                best = detector.get_probabilities()[0]
+                results.append((best.lang, best.prob))
+            except LangDetectException as e:
+                results.append((str(e), None))
+        return results
+
+    # Send the seed only; each process loads (and seeds) its own detector factory
+    def __getstate__(self):
+        return {"seed": self.seed}
+
+    def __setstate__(self, state):
+        self.__init__(state["seed"])
+
+# Compact n-gram model (langid.py), with probabilities normalised over its 97 languages
+class LangidIdentifier:
+
+    def __init__(self):
+        self.model = None
+
+    def load(self):
+        if self.model is None:
+            from langid.langid import LanguageIdentifier, model
+            self.model = LanguageIdentifier.from_modelstring(model, norm_probs=True)
+        return self.model
+
+    def identify_many(self, texts):
+        model = self.load()
+        return [model.classify(text) for text in texts]
+
+    # Send no model; each process loads its own
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+# Local fastText language identification model (e.g. lid.176.ftz), predicting a whole batch in one call.
+# Its language codes are ISO 639 codes, as langdetect's except for Chinese ("zh" rather than "zh-cn"/"zh-tw").
+class FastTextIdentifier:
+
+    LABEL_PREFIX = "__label__"
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model = None
+
+    def load(self):
+        if self.model is None:
+            import fasttext
+            self.model = fasttext.load_model(self.model_path)
+        return self.model
+
+    def identify_many(self, texts):
+        if not texts:
+            return []
+        # fastText predicts one line at a time
+        labels, probabilities = self.load().predict([" ".join(text.split()) for text in texts], k=1)
+        return [(label[0][len(self.LABEL_PREFIX):], min(float(probability[0]), 1.0))
+                for label, probability in zip(labels, probabilities)]
+
+    # Send the path only; each process loads its own copy of the model
+    def __getstate__(self):
+        return {"model_path": self.model_path}
+
+    def __setstate__(self, state):
+        self.__init__(state["model_path"])
+
+#### ---- LANGUAGE IDENTIFIER USED BY THE PIPELINE ---- ###
+
+# GLOBAL VARIABLE shared in each process (but not across them)
+_language_identifier = None
+
+def set_language_identifier(identifier):
+    global _language_identifier
+    _language_identifier = identifier
+
+def get_language_identifier():
+    global _language_identifier
+    if _language_identifier is None:
+        _language_identifier = LangdetectIdentifier()
+    return _language_identifier
+
+# Build the language identifier for a run (picklable, so it can be sent to pool workers)
+def make_language_identifier(backend="langdetect", model_path=None):
+    if backend == "fasttext":
+        return FastTextIdentifier(model_path)
+    if backend == "langid":
+        return LangidIdentifier()
+    return LangdetectIdentifier()
+
+# (language, probability) of each text, identifying each distinct text once
+@profiled("language_id")
+def identify_languages(texts):
+    distinct = list(dict.fromkeys(texts))
+    if not distinct:
+        return []
+    identified = dict(zip(distinct, get_language_identifier().identify_many(distinct)))
+    return [identified[text] for text in texts]
@@ -0,0 +1,37 @@
+import argparse
+import json
+import subprocess
+import sys
+
+#### ---- REPORT: WORKER COLD-START TIME AND MEMORY ---- ###
+
+# Each measurement runs in a fresh interpreter, as a new pool worker would
+MEASURE = """
+import json, resource, sys, time
+from resources import set_resource_cache, warm_resources
+start = time.perf_counter()
+import get_profile_metadata, get_tweet_metadata
+imported = time.perf_counter()
+set_resource_cache(sys.argv[2] or None)
+warm_resources(sys.argv[1], grammar=False)
+warmed = time.perf_counter()
+print(json.dumps({"import_seconds": round(imported - start, 2),
+                  "warm_seconds": round(warmed - imported, 2),
+                  "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)}))
+"""
+
+def measure(function_type, resource_cache):
+    result = subprocess.run([sys.executable, "-c", MEASURE, function_type, resource_cache or ""],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure worker cold-start time and memory for each pipeline (excluding TweetNLP models and LanguageTool).")
+    parser.add_argument('--resource_cache', type=str, default=None, help='Directory of prebuilt serialized resources')
+
+    args = parser.parse_args()
+
+    for function_type in ["tweet", "profile"]:
+        if args.resource_cache:
+            measure(function_type, args.resource_cache)  # Build the cache first
+        print(function_type, measure(function_type, args.resource_cache))
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+import pandas as pd
+
+from input_readers import read_input_columns
+from run_manifest import RunManifest, CompletedRanges, manifest_path, DONE
+from shard import shard_path, id_shards, shard_row_range
+
+#### ---- MERGE SHARDED OUTPUTS ---- ###
+
+# Checks the outputs of a sharded run (derive_social_media_variables.py --shard i/N on each node) and
+# combines them into the final profile or tweet variable table:
+#  - every shard ran with the same settings, and its run manifest has every batch of its rows done;
+#  - with the input at hand, each shard's output holds exactly the IDs of the rows assigned to it (as
+#    many times as they produce a row), so no ID is missing or duplicated; without it, each ID is at
+#    least in the shard its hash assigns it to (--shard_by id).
+# Rows are combined in input order of their batches, and of shards within a batch (one file per shard
+# for Parquet and Arrow outputs, whose rows are in the order they were written).
+
+# Settings that must be the same on every node (the input by its file name, size and row count, as nodes
+# may read it from different local paths; see shard.input_identity)
+SHARED_ARGUMENTS = ["input_identity", "type", "shard_by", "output_format"]
+
+# (output prefix, run arguments, batches) of one shard, or None if it has no run manifest
+def load_shard(file_path, shard):
+    prefix = shard_path(file_path, shard)
+    path = manifest_path(prefix)
+    if not os.path.exists(path):
+        return None
+    manifest = RunManifest(path)
+    try:
+        return prefix, manifest.run_arguments(), manifest.batches()
+    finally:
+        manifest.close()
+
+# Problems with the batches of one shard: batches not done (and not redone), and input rows [first, end) not covered
+def check_coverage(batches, first, end):
+    problems = []
+    done = CompletedRanges([(row_start, row_end) for row_start, row_end, status, _ in batches if status == DONE])
+    for row_start, row_end, status, _ in batches:
+        if status != DONE and done.uncovered(row_start, row_end):  # Not since redone with another batch size
+            problems.append(f"rows {row_start} to {row_end} are {status}")
+    for gap_start, gap_end in done.uncovered(first, end - 1) if end > first else []:
+        problems.append(f"rows {gap_start} to {gap_end} were not processed")
+    return problems
+
+# Output of one shard: [(batch row_start, DataFrame)] for CSV batches, or one pyarrow Table
+def read_shard_output(prefix, output_format, batches):
+    if output_format == "csv":
+        # Every cell as text, so IDs keep leading zeros and full precision and are written back unchanged
+        return [(row_start, pd.read_csv(output, dtype=str, keep_default_na=False))
+                for row_start, _, status, output in batches if status == DONE and output]
+    if output_format == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(f"{prefix}_dataset")  # Skips the _manifest.json
+    import pyarrow as pa
+    with pa.memory_map(f"{prefix}.arrow") as source:
+        return pa.ipc.open_file(source).read_all()
+
+# IDs (as text) of every row of a shard's output
+def output_ids(output):
+    if isinstance(output, list):
+        return Counter(str(value) for _, df in output if "ID" in df for value in df["ID"].tolist())
+    return Counter(str(value) for value in output.column("ID").to_pylist())
+
+# IDs (as text) of the input rows assigned to each shard that produce an output row (tweets without a
+# created date are skipped by get_tweet_metadata)
+def expected_ids(input_df, function_type, shard_by, count, start_rows):
+    produced = [True] * len(input_df)
+    if function_type == "tweet":
+        produced = [value is not None for value in input_df["created_at_x"].tolist()]
+    ids = input_df["ID"].tolist()
+    shards = id_shards(ids, count) if shard_by == "id" else None
+
+    expected = []
+    for index in range(count):
+        first, end = shard_row_range(len(ids), (index, count)) if shard_by == "range" else (0, len(ids))
+        first = max(first, start_rows[index])
+        expected.append(Counter(str(ids[i]) for i in range(first, end)
+                                if produced[i] and (shards is None or shards[i] == index)))
+    return expected
+
+# Differences between expected and actual ID counts, e.g. "3 missing (user1, user7, ...)"
+def describe_id_differences(expected, actual):
+    problems = []
+    for label, difference in [("missing", expected - actual), ("duplicated or unexpected", actual - expected)]:
+        if difference:
+            examples = ", ".join(sorted(difference)[:5])
+            problems.append(f"{sum(difference.values())} ID row(s) {label} ({examples}{', ...' if len(difference) > 5 else ''})")
+    return problems
+
+# Check the shards and build the merged table; returns (problems, merged DataFrame or pyarrow Table, output format)
+def merge_shards(file_path, count, input_path=None):
+    shards = [load_shard(file_path, (index, count)) for index in range(count)]
+    problems = [f"shard {index}: no run manifest at {manifest_path(shard_path(file_path, (index, count)))}"
+                for index, shard in enumerate(shards) if shard is None]
+    if problems:
+        return problems, None, None
+
+    arguments = [shard[1] for shard in shards]
+    for name in SHARED_ARGUMENTS:
+        values = {json.dumps(shard_arguments.get(name), sort_keys=True) for shard_arguments in arguments}
+        if len(values) > 1:
+            problems.append(f"shards ran with different --{name}: {', '.join(sorted(values))}")
+    for index, shard_arguments in enumerate(arguments):
+        if list(shard_arguments.get("shard") or []) != [index, count]:
+            problems.append(f"shard {index}: ran as --shard {shard_arguments.get('shard')}")
+    if problems:
+        return problems, None, None
+
+    function_type = arguments[0]["type"]
+    shard_by = arguments[0]["shard_by"]
+    output_format = arguments[0]["output_format"]
+    start_rows = [shard_arguments["start_row"] for shard_arguments in arguments]
+
+    # The input's length, or as far as the batches reach without it
+    input_path = input_path or arguments[0]["input"]
+    input_df = None
+    if os.path.exists(input_path):
+        input_df = read_input_columns(input_path, ["ID", "created_at_x"] if function_type == "tweet" else ["ID"])
+        total_rows = len(input_df)
+        shard_rows = (arguments[0].get("input_identity") or {}).get("rows")
+        if shard_rows is not None and shard_rows != total_rows:
+            return [f"input {input_path} has {total_rows} rows, but the shards read {shard_rows}"], None, None
+    else:
+        print(f"[WARNING] Input {input_path} not found: IDs are not checked against it")
+        total_rows = max((row_end + 1 for shard in shards for _, row_end, _, _ in shard[2]), default=0)
+
+    # Every batch of every shard done, covering its rows
+    for index, (_, _, batches) in enumerate(shards):
+        first, end = shard_row_range(total_rows, (index, count)) if shard_by == "range" else (0, total_rows)
+        problems += [f"shard {index}: {problem}" for problem in check_coverage(batches, max(first, start_rows[index]), end)]
+
+    outputs = [read_shard_output(prefix, output_format, batches) for prefix, _, batches in shards]
+
+    # No missing or duplicated IDs
+    ids = [output_ids(output) for output in outputs]
+    if input_df is not None:
+        for index, expected in enumerate(expected_ids(input_df, function_type, shard_by, count, start_rows)):
+            problems += [f"shard {index}: {problem}" for problem in describe_id_differences(expected, ids[index])]
+    elif shard_by == "id":
+        for index, shard_ids in enumerate(ids):
+            misplaced = [value for value, shard in zip(shard_ids, id_shards(list(shard_ids), count)) if shard != index]
+            if misplaced:
+                problems.append(f"shard {index}: {len(misplaced)} ID(s) belong to other shards ({', '.join(sorted(misplaced)[:5])})")
+
+    if output_format == "csv":
+        frames = sorted(((row_start, index, df) for index, output in enumerate(outputs) for row_start, df in output),
+                        key=lambda frame: frame[:2])
+        merged = pd.concat([df for _, _, df in frames], ignore_index=True) if frames else pd.DataFrame()
+    else:
+        import pyarrow as pa
+        merged = pa.concat_tables(outputs)
+
+    return problems, merged, output_format
+
+# Write the merged table in the shards' output format
+def write_merged(merged, path, output_format):
+    if output_format == "csv":
+        merged.to_csv(path, index=False)
+    elif output_format == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(merged, path)
+    else:
+        import pyarrow as pa
+        with pa.ipc.new_file(path, merged.schema) as writer:
+            writer.write_table(merged)
+
+# MAIN ENTRY POINT: check and combine the shards of a run
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the outputs of a sharded run and merge them into one table.")
+    parser.add_argument('--file_path', type=str, required=True, help='Output file path prefix given to every shard')
+    parser.add_argument('--shards', type=int, required=True, help='Number of shards (N in --shard i/N)')
+    parser.add_argument('--input', type=str, default=None, help='Input file (default: as recorded by the shards)')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Merged table (default: {file_path}_merged.csv, .parquet or .arrow, as the shards)')
+    parser.add_argument('--force', action='store_true', help='Write the merged table even if the checks fail')
+
+    args = parser.parse_args()
+
+    problems, merged, output_format = merge_shards(args.file_path, args.shards, input_path=args.input)
+    for problem in problems:
+        print(f"[ERROR] {problem}")
+    if merged is None or (problems and not args.force):
+        print(f"[ERROR] {len(problems)} problem(s) found; nothing written (use --force to write anyway)")
+        sys.exit(1)
+
+    output = args.output or f"{args.file_path}_merged.{output_format}"
+    write_merged(merged, output, output_format)
+    print(f"[INFO] Merged {len(merged)} rows from {args.shards} shards into {output}")
+    if problems:
+        sys.exit(1)
@@ -0,0 +1,340 @@
+import datetime
+import json
+import math
+import numbers
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+#### ---- OUTPUT SCHEMAS ---- ###
+
+# Derived text features (prefixed "TEXT_" for tweets and "DS_" for profile descriptions)
+TEXT_FEATURE_FIELDS = [
+    ("post_length", pa.int64()),
+    ("exclamation_count", pa.int64()),
+    ("question_mark_count", pa.int64()),
+    ("hashtag_count", pa.int64()),
+    ("emoji_count", pa.int64()),
+    ("mentions_count", pa.int64()),
+    ("url_count", pa.int64()),
+    ("url_mbfc_matches", pa.int64()),
+    ("url_mbfc_bias", pa.list_(pa.float64())),
+    ("url_mbfc_credibility", pa.list_(pa.float64())),
+    ("character_count", pa.int64()),
+    ("capt_character_count", pa.int64()),
+    ("capt_character_prop", pa.float64()),
+    ("letter_count", pa.int64()),
+    ("word_count", pa.int64()),
+    ("unique_word_count", pa.int64()),
+    ("sentence_count", pa.int64()),
+    ("syllable_count", pa.int64()),
+    ("monosyllable_count", pa.int64()),
+    ("polysyllable_count", pa.int64()),
+    ("grammar_score", pa.float64()),
+    ("reading_ease", pa.float64()),
+    ("non_eng_reading_ease", pa.float64()),
+    ("reading_grade", pa.float64()),
+    ("topics", pa.list_(pa.string())),
+    ("topic_prob", pa.map_(pa.string(), pa.float64())),
+    ("sentiment", pa.string()),
+    ("sentiment_prob", pa.float64()),
+    ("irony", pa.string()),
+    ("irony_prob", pa.float64()),
+    ("offensive", pa.string()),
+    ("offensive_prob", pa.float64()),
+    ("emotion", pa.string()),
+    ("emotion_prob", pa.float64()),
+    ("hate", pa.string()),
+    ("hate_prob", pa.float64()),
+    ("entity_count", pa.int64()),
+    ("entity_types", pa.list_(pa.string())),
+    ("entity_prob", pa.list_(pa.float64())),
+]
+
+def text_feature_fields(prefix):
+    return [pa.field(f"{prefix}{name}", data_type) for name, data_type in TEXT_FEATURE_FIELDS]
+
+# Profile-level variables (see get_profile_metadata)
+PROFILE_SCHEMA = pa.schema([
+    pa.field("ID", pa.string()),
+    pa.field("created_date", pa.date32()),
+    pa.field("followers_count", pa.int64()),
+    pa.field("following_count", pa.int64()),
+    pa.field("tweet_count", pa.int64()),
+    pa.field("listed_count", pa.int64()),
+    pa.field("DN_length", pa.int64()),
+    pa.field("DN_exclamation_count", pa.int64()),
+    pa.field("DN_question_mark_count", pa.int64()),
+    pa.field("DN_hashtag_count", pa.int64()),
+    pa.field("DN_emoji_count", pa.int64()),
+    pa.field("DN_character_count", pa.int64()),
+    pa.field("DN_capt_character_count", pa.int64()),
+    pa.field("DN_capt_character_prop", pa.float64()),
+    pa.field("DN_letter_count", pa.int64()),
+    pa.field("DN_word_count", pa.int64()),
+    pa.field("DN_unique_word_count", pa.int64()),
+    pa.field("DN_handle_similarity", pa.float64()),
+    pa.field("DN_listed_salutation", pa.bool_()),
+    pa.field("DN_first_name", pa.bool_()),
+    pa.field("DN_last_name", pa.bool_()),
+    pa.field("LC_field_populated", pa.bool_()),
+    pa.field("LC_level_count", pa.int64()),
+    pa.field("LC_levels_identified", pa.int64()),
+    pa.field("LC_level_types", pa.list_(pa.string())),
+    pa.field("DS_field_populated", pa.bool_()),
+    pa.field("DS_language", pa.string()),
+    pa.field("DS_language_prob", pa.float64()),
+] + text_feature_fields("DS_"))
+
+# Tweet-level variables (see get_tweet_metadata)
+TWEET_SCHEMA = pa.schema([
+    pa.field("ID", pa.string()),
+    pa.field("post_type", pa.string()),
+    pa.field("created_date", pa.date32()),
+    pa.field("post_source", pa.string()),
+    pa.field("post_language", pa.string()),
+    pa.field("retweet_count", pa.int64()),
+    pa.field("reply_count", pa.int64()),
+    pa.field("like_count", pa.int64()),
+    pa.field("quote_count", pa.int64()),
+    pa.field("total_engagement", pa.int64()),
+    pa.field("reply_ratio", pa.int64()),
+    pa.field("contains_media", pa.bool_()),
+    pa.field("contains_geotag", pa.bool_()),
+    pa.field("reply_settings", pa.string()),
+    pa.field("RT_created_date", pa.date32()),
+    pa.field("RT_post_source", pa.string()),
+    pa.field("RT_post_language", pa.string()),
+    pa.field("RT_retweet_count", pa.int64()),
+    pa.field("RT_reply_count", pa.int64()),
+    pa.field("RT_like_count", pa.int64()),
+    pa.field("RT_quote_count", pa.int64()),
+    pa.field("RT_total_engagement", pa.int64()),
+    pa.field("RT_reply_ratio", pa.int64()),
+] + text_feature_fields("TEXT_") + [
+    # Language identified from the tweet text (with --tweet_language)
+    pa.field("post_language_detected", pa.string()),
+    pa.field("post_language_detected_prob", pa.float64()),
+])
+
+OUTPUT_SCHEMAS = {
+    "profile": PROFILE_SCHEMA,
+    "tweet": TWEET_SCHEMA
+}
+
+# Added to either schema with --incremental (see incremental.py)
+ROW_KEY_FIELD = pa.field("row_key", pa.string())
+
+#### ---- VALUE COERCION ---- ###
+
+# Sentinel for values that do not fit the column type (e.g. an error message in a count column)
+INVALID = object()
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+# Convert one value to the Python type pyarrow expects for data_type
+def coerce_value(value, data_type):
+    if is_missing(value):
+        return None
+
+    if pa.types.is_boolean(data_type):
+        return bool(value) if isinstance(value, (bool, np.bool_, numbers.Integral)) else INVALID
+
+    if pa.types.is_integer(data_type):
+        if isinstance(value, numbers.Integral):
+            return int(value)
+        if isinstance(value, numbers.Real) and float(value).is_integer():
+            return int(value)
+        return INVALID
+
+    if pa.types.is_floating(data_type):
+        return float(value) if isinstance(value, numbers.Real) else INVALID
+
+    if pa.types.is_string(data_type):
+        return str(value)
+
+    if pa.types.is_date(data_type):
+        if isinstance(value, datetime.datetime):
+            return value.date()
+        if isinstance(value, datetime.date):
+            return value
+        try:
+            return datetime.date.fromisoformat(str(value)[:10])
+        except ValueError:
+            return INVALID
+
+    if pa.types.is_map(data_type):
+        if not isinstance(value, dict):
+            return INVALID
+        items = [(str(key), coerce_value(item, data_type.item_type)) for key, item in value.items()]
+        return INVALID if any(item is INVALID for _, item in items) else items
+
+    if pa.types.is_list(data_type):
+        if not isinstance(value, (list, tuple)):
+            return INVALID
+        items = [coerce_value(item, data_type.value_type) for item in value]
+        return INVALID if any(item is INVALID for item in items) else items
+
+    return value
+
+#### ---- OUTPUT WRITERS ---- ###
+
+# Base writer: converts row dictionaries to typed record batches and keeps manifest statistics
+class OutputWriter:
+
+    durable = True  # Whether flushed rows are readable before close
+
+    def __init__(self, path, function_type, buffer_rows=10000, row_keys=False):
+        self.path = path
+        self.function_type = function_type
+        self.schema = OUTPUT_SCHEMAS[function_type]
+        if row_keys:
+            self.schema = self.schema.append(ROW_KEY_FIELD)  # Key of each input row, for incremental runs
+        self.buffer_rows = buffer_rows
+        self.buffer = []
+        self.buffer_keys = []  # Batch keys whose rows are in the buffer
+        self.on_flush = None  # Called with those keys once their rows are safely on disk
+        self.files = {}
+        self.stats = {
+            "rows_written": 0,
+            "batches_received": 0,
+            "rows_skipped": 0,  # Rows the metadata functions returned None for
+            "invalid_values": {},  # Values set to null because they did not fit the column type
+            "unknown_columns": []  # Keys with no column in the schema
+        }
+
+    # Append the processed rows of one batch
+    def write_rows(self, rows, key=None):
+        self.stats["batches_received"] += 1
+        if key is not None:
+            self.buffer_keys.append(key)
+        for row in rows:
+            if not row:
+                self.stats["rows_skipped"] += 1
+                continue
+            self.buffer.append(row)
+        if len(self.buffer) >= self.buffer_rows:
+            self.flush()
+
+    # Convert buffered rows to a record batch with the fixed schema
+    def to_record_batch(self, rows):
+        known = set(self.schema.names)
+        for row in rows:
+            for key in row:
+                if key not in known and key not in self.stats["unknown_columns"]:
+                    self.stats["unknown_columns"].append(key)
+
+        arrays = []
+        for field in self.schema:
+            values = []
+            for row in rows:
+                value = coerce_value(row.get(field.name), field.type)
+                if value is INVALID:
+                    self.stats["invalid_values"][field.name] = self.stats["invalid_values"].get(field.name, 0) + 1
+                    value = None
+                values.append(value)
+            arrays.append(pa.array(values, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def flush(self):
+        if self.buffer:
+            record_batch = self.to_record_batch(self.buffer)
+            self.write_record_batch(record_batch)
+            self.stats["rows_written"] += record_batch.num_rows
+            self.buffer = []
+        if self.buffer_keys and self.durable:
+            if self.on_flush is not None:
+                self.on_flush(self.buffer_keys)
+            self.buffer_keys = []
+
+    def write_record_batch(self, record_batch):
+        raise NotImplementedError
+
+    def close_files(self):
+        pass
+
+    # Flush remaining rows, close the output and write the manifest. Only a run that finished with every
+    # batch written (completed=True) stamps the manifest completed_at; otherwise it is marked incomplete.
+    def close(self, completed=True):
+        self.flush()
+        self.close_files()
+        if self.buffer_keys and self.on_flush is not None:
+            self.on_flush(self.buffer_keys)  # Rows are only readable once the file is closed
+            self.buffer_keys = []
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        manifest = {
+            "type": self.function_type,
+            "format": self.output_format,
+            "path": self.path,
+            "status": "complete" if completed else "incomplete",
+            **({"completed_at": now} if completed else {"closed_at": now}),
+            "files": [{"path": path, "rows": rows} for path, rows in self.files.items()],
+            "schema": [{"name": field.name, "type": str(field.type)} for field in self.schema],
+            **self.stats
+        }
+        with open(self.manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(completed=exc_type is None)
+
+# Partitioned Parquet dataset: a directory with one complete part file per flush, so that rows
+# are readable (and resumable) as soon as they are flushed. With append=True, existing parts are kept.
+class ParquetDatasetWriter(OutputWriter):
+
+    output_format = "parquet"
+    durable = True
+
+    def __init__(self, path, function_type, buffer_rows=100000, append=False, row_keys=False):
+        super().__init__(path, function_type, buffer_rows=buffer_rows, row_keys=row_keys)
+        os.makedirs(path, exist_ok=True)
+        self.manifest_path = os.path.join(path, "_manifest.json")
+
+        for file_name in sorted(os.listdir(path)):
+            if file_name.startswith("part-") and file_name.endswith(".parquet"):
+                part_path = os.path.join(path, file_name)
+                if append:
+                    self.files[part_path] = pq.ParquetFile(part_path).metadata.num_rows
+                else:
+                    os.remove(part_path)
+        self.stats["rows_written"] = sum(self.files.values())
+
+    def write_record_batch(self, record_batch):
+        part_path = os.path.join(self.path, f"part-{len(self.files):05d}.parquet")
+        temp_path = f"{part_path}.tmp"
+        pq.write_table(pa.Table.from_batches([record_batch]), temp_path)
+        os.replace(temp_path, part_path)  # Parts appear complete or not at all
+        self.files[part_path] = record_batch.num_rows
+
+# Single Arrow IPC file
+class ArrowFileWriter(OutputWriter):
+
+    output_format = "arrow"
+    durable = False  # The file is only readable once closed
+
+    def __init__(self, path, function_type, buffer_rows=10000):
+        super().__init__(path, function_type, buffer_rows=buffer_rows)
+        self.manifest_path = f"{os.path.splitext(path)[0]}_manifest.json"
+        self.writer = pa.ipc.new_file(path, self.schema)
+        self.files[path] = 0
+
+    def write_record_batch(self, record_batch):
+        self.writer.write_batch(record_batch)
+        self.files[self.path] += record_batch.num_rows
+
+    def close_files(self):
+        self.writer.close()
+
+# Open the writer for an output format, using the --file_path prefix
+def open_output_writer(output_format, file_path, function_type, append=False, row_keys=False):
+    if output_format == "parquet":
+        return ParquetDatasetWriter(f"{file_path}_dataset", function_type, append=append, row_keys=row_keys)
+    if output_format == "arrow":
+        return ArrowFileWriter(f"{file_path}.arrow", function_type)
+    raise ValueError(f"Unsupported output format '{output_format}'")
@@ -1,9 +1,51 @@
 from rapidfuzz import fuzz
 from nameparser import HumanName
 
-# Load names dataset
-from names_dataset import NameDataset
-nd = NameDataset()
+import argparse
+
+from resources import cached_resource, set_resource_cache
+from instrumentation import profiled
+
+# A name is "real" if it is ranked in at least this many countries in the names dataset
+NAME_COMMONALITY_THRESHOLD = 3
+
+# Version of what build_name_index builds; bump it when that changes, so cached copies are rebuilt
+NAME_INDEX_VERSION = 1
+
+# GLOBAL VARIABLE: compact name index, loaded on first use
+_name_index = None
+
+# Build the compact index: the (title-cased) first and last names ranked in enough countries.
+# This is the only part of the multi-gigabyte names dataset check_names needs.
+def build_name_index(threshold=NAME_COMMONALITY_THRESHOLD):
+    from names_dataset import NameDataset
+    nd = NameDataset()
+
+    def common_names(names):
+        return sorted(name for name, info in names.items()
+                      if sum(1 for rank in info["rank"].values() if rank is not None) >= threshold)
+
+    return {"threshold": threshold,
+            "first_names": common_names(nd.first_names),
+            "last_names": common_names(nd.last_names)}
+
+# Load the name index (from the prebuilt pickle in the resource cache, if it was built from the installed
+# names dataset with the current threshold)
+def get_name_index():
+    global _name_index
+    if _name_index is None:
+        from importlib import metadata
+        try:
+            dataset_version = metadata.version("names-dataset")
+        except metadata.PackageNotFoundError:
+            dataset_version = "none"  # Not installed as a distribution (build_name_index still needs the module)
+        sources = [f"names-dataset={dataset_version}", NAME_COMMONALITY_THRESHOLD]
+        name_index = cached_resource("names_index.pkl", build_name_index, sources, NAME_INDEX_VERSION)
+        if name_index["threshold"] != NAME_COMMONALITY_THRESHOLD:
+            raise ValueError(f"Name index was built with threshold {name_index['threshold']}, expected {NAME_COMMONALITY_THRESHOLD}")
+        _name_index = {"first_names": frozenset(name_index["first_names"]),
+                       "last_names": frozenset(name_index["last_names"])}
+    return _name_index
 
 # Check similarity between name and handle
 def similarity_score(name, handle):
@@ -19,22 +61,23 @@ def get_salutation(name):
     return title
 
 # Check if first and last names exist in the names dataset
+@profiled("name_check")
 def check_names(name):
     name = HumanName(name)
-    first_name_check = nd.search(name.first)
-    last_name_check = nd.search(name.last)
-    if bool(first_name_check["first_name"]):
-        first_name_ranks = first_name_check["first_name"]["rank"]
-        first_name_commmonality = sum(1 for v in first_name_ranks.values() if v is not None)
-    else: 
-        first_name_commmonality = 0
-    if bool(last_name_check["last_name"]):
-        last_name_ranks = last_name_check["last_name"]["rank"]
-        last_name_commmonality = sum(1 for v in last_name_ranks.values() if v is not None)
-    else: 
-        last_name_commmonality = 0
-    first_name_real = True if first_name_commmonality >=3 else False
-    last_name_real = True if last_name_commmonality >=3 else False
+    name_index = get_name_index()
+    first_name_real = name.first.strip().title() in name_index["first_names"]  # Same key as NameDataset.search
+    last_name_real = name.last.strip().title() in name_index["last_names"]
     name_check_dict = {"first_name":  first_name_real, 
                        "last_name": last_name_real}
-    return name_check_dict
\ No newline at end of file
+    return name_check_dict
+
+# MAIN ENTRY POINT: build the name index once into a resource cache directory
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the compact name index used by check_names.")
+    parser.add_argument('--resource_cache', type=str, required=True, help='Resource cache directory to write names_index.pkl to')
+
+    args = parser.parse_args()
+
+    set_resource_cache(args.resource_cache)
+    name_index = get_name_index()
+    print(f"[INFO] Indexed {len(name_index['first_names'])} first names and {len(name_index['last_names'])} last names")
@@ -0,0 +1,73 @@
+import os
+import pickle
+
+#### ---- LAZILY-INITIALISED RESOURCES ---- ###
+
+# Heavy state (the name index, the MBFC table, the gazetteer index, the language model, LanguageTool)
+# is no longer built as a side effect of importing a module. Each resource is loaded on first use, or
+# warmed explicitly for the selected pipeline so that workers only hold what that pipeline needs.
+
+# Directory of prebuilt serialized resources (None: build from source on each start)
+_cache_dir = None
+
+def set_resource_cache(path):
+    global _cache_dir
+    _cache_dir = path
+    if path:
+        os.makedirs(path, exist_ok=True)
+
+# Path of a serialized resource in the cache directory, or None if there is no cache
+def resource_cache_path(name):
+    return os.path.join(_cache_dir, name) if _cache_dir else None
+
+# Format of the cached pickles ({"key", "value"}); bump it if that wrapper changes
+RESOURCE_CACHE_FORMAT = 1
+
+# Identity of a source file a resource is built from: absolute path, size and modification time
+def file_identity(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+# A resource from its pickle in the cache directory, or built (and cached) if there is none or it was
+# cached from other sources (e.g. file_identity of the source files, package versions) or another version
+# of the resource's builder
+def cached_resource(name, build, sources, version):
+    cache_path = resource_cache_path(name)
+    key = {"format": RESOURCE_CACHE_FORMAT, "version": version, "sources": sources}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if isinstance(cached, dict) and cached.get("key") == key:
+            return cached["value"]
+
+    value = build()
+    if cache_path:
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"  # Replaced whole, so a reader never sees a partial pickle
+        with open(temp_path, "wb") as f:
+            pickle.dump({"key": key, "value": value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    return value
+
+# Load the resources used by one pipeline ("profile" or "tweet"); tweet_language if tweets are language-identified
+def warm_resources(function_type, grammar=True, tweet_language=False):
+    if function_type == "profile":
+        from real_name_checker import get_name_index
+        from geocoding import get_geocoder
+        get_name_index()
+        geocoder = get_geocoder()
+        if hasattr(geocoder, "load"):
+            geocoder.load()  # Offline gazetteer index
+
+    if function_type == "tweet":
+        from url_bias_checker import get_mbfc
+        get_mbfc()
+
+    if function_type == "profile" or tweet_language:
+        from language_id import get_language_identifier
+        get_language_identifier().load()
+
+    if grammar:
+        from grammar_service import get_grammar_client
+        from text_analysis_functions import get_tool
+        if get_grammar_client() is None:
+            get_tool()  # This process's own LanguageTool server
@@ -0,0 +1,47 @@
+import argparse
+import os
+import subprocess
+import sys
+
+from merge_shards import merge_shards, write_merged
+
+#### ---- SIMULATED MULTI-NODE RUN ---- ###
+
+# Runs N shards of derive_social_media_variables.py as N local processes, as N nodes would, then
+# checks and merges their outputs. Arguments after "--" are passed to every shard, e.g.
+#   python run_local_shards.py --shards 4 -- --input profiles.pkl --type profile --file_path out/profiles --nproc 1
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "derive_social_media_variables.py")
+
+# Start every shard, wait for all of them, and return their exit codes
+def run_shards(count, shard_args):
+    processes = [subprocess.Popen([sys.executable, SCRIPT, *shard_args, "--shard", f"{index}/{count}"])
+                 for index in range(count)]
+    return [process.wait() for process in processes]
+
+# MAIN ENTRY POINT
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate a sharded run with one local process per shard, then merge it.")
+    parser.add_argument('--shards', type=int, required=True, help='Number of shards (simulated nodes)')
+    parser.add_argument('shard_args', nargs=argparse.REMAINDER, help='Arguments for derive_social_media_variables.py, after "--"')
+
+    args = parser.parse_args()
+    shard_args = args.shard_args[1:] if args.shard_args[:1] == ["--"] else args.shard_args
+    if "--file_path" not in shard_args:
+        parser.error("the shard arguments must include --file_path")
+    file_path = shard_args[shard_args.index("--file_path") + 1]
+
+    exit_codes = run_shards(args.shards, shard_args)
+    for index, code in enumerate(exit_codes):
+        if code:
+            print(f"[ERROR] Shard {index} exited with code {code}")
+
+    problems, merged, output_format = merge_shards(file_path, args.shards)
+    for problem in problems:
+        print(f"[ERROR] {problem}")
+    if problems or merged is None:
+        sys.exit(1)
+
+    output = f"{file_path}_merged.{output_format}"
+    write_merged(merged, output, output_format)
+    print(f"[INFO] Merged {len(merged)} rows from {args.shards} shards into {output}")
@@ -0,0 +1,123 @@
+import bisect
+import json
+import sqlite3
+import time
+
+#### ---- RUN MANIFEST ---- ###
+
+# SQLite ledger of batch row ranges (input row positions) with status, timings and errors, written by
+# the main process. A restarted run skips ranges already done and retries failed or missing ones.
+
+# Batch statuses
+DONE = "done"  # Output written to disk
+PROCESSED = "processed"  # Rows returned, waiting in an output writer's buffer
+FAILED = "failed"
+
+# Settings a resumed run must share with the run that wrote the ledger, or its done row ranges would
+# refer to other rows (the input by its file name, size and row count; see shard.input_identity)
+RESUME_ARGUMENTS = ["input_identity", "type", "start_row", "shard", "shard_by", "incremental", "output_format"]
+
+class RunManifest:
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS batches (
+                                 row_start INTEGER NOT NULL,
+                                 row_end INTEGER NOT NULL,
+                                 status TEXT NOT NULL,
+                                 attempts INTEGER NOT NULL DEFAULT 0,
+                                 seconds REAL,
+                                 finished_at REAL,
+                                 output TEXT,
+                                 error TEXT,
+                                 PRIMARY KEY (row_start, row_end))""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS runs (
+                                 started_at REAL NOT NULL,
+                                 resumed INTEGER NOT NULL,
+                                 arguments TEXT)""")
+        self.conn.commit()
+
+    # Record the start of a run; without resume, the previous ledger is cleared
+    def start_run(self, arguments, resume=False):
+        if not resume:
+            self.conn.execute("DELETE FROM batches")
+        self.conn.execute("INSERT INTO runs (started_at, resumed, arguments) VALUES (?, ?, ?)",
+                          (time.time(), int(resume), json.dumps(arguments)))
+        self.conn.commit()
+
+    # Row ranges whose output is on disk, sorted by start
+    def done_ranges(self):
+        return self.conn.execute("SELECT row_start, row_end FROM batches WHERE status = ? ORDER BY row_start",
+                                 (DONE,)).fetchall()
+
+    # Record a finished batch (status DONE, PROCESSED or FAILED)
+    def record(self, row_start, row_end, status, seconds=None, output=None, error=None):
+        self.conn.execute("""INSERT INTO batches (row_start, row_end, status, attempts, seconds, finished_at, output, error)
+                             VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+                             ON CONFLICT (row_start, row_end) DO UPDATE SET
+                                 status = excluded.status, attempts = attempts + 1, seconds = excluded.seconds,
+                                 finished_at = excluded.finished_at, output = excluded.output, error = excluded.error""",
+                          (row_start, row_end, status, seconds, time.time(), output, error))
+        self.conn.commit()
+
+    # Mark buffered batches done once an output writer has flushed them
+    def mark_done(self, batch_ranges):
+        self.conn.executemany("UPDATE batches SET status = ? WHERE row_start = ? AND row_end = ?",
+                              [(DONE, row_start, row_end) for row_start, row_end in batch_ranges])
+        self.conn.commit()
+
+    # Arguments of the latest run
+    def run_arguments(self):
+        row = self.conn.execute("SELECT arguments FROM runs ORDER BY started_at DESC LIMIT 1").fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Names of the RESUME_ARGUMENTS whose values differ from the latest run's (none for a new ledger)
+    def changed_arguments(self, arguments):
+        previous = self.run_arguments()
+        if previous is None:
+            return []
+        return [name for name in RESUME_ARGUMENTS
+                if json.dumps(previous.get(name), sort_keys=True) != json.dumps(arguments.get(name), sort_keys=True)]
+
+    # (row_start, row_end, status, output) of every batch, sorted by start
+    def batches(self):
+        return self.conn.execute("SELECT row_start, row_end, status, output FROM batches ORDER BY row_start").fetchall()
+
+    def summary(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM batches GROUP BY status").fetchall())
+
+    def close(self):
+        self.conn.close()
+
+# Finds the rows of a range not covered by completed ones (even if the batch size has changed)
+class CompletedRanges:
+
+    def __init__(self, ranges):
+        # Merge overlapping or adjacent ranges
+        self.ranges = []
+        for row_start, row_end in sorted(ranges):
+            if self.ranges and row_start <= self.ranges[-1][1] + 1:
+                self.ranges[-1][1] = max(self.ranges[-1][1], row_end)
+            else:
+                self.ranges.append([row_start, row_end])
+
+        self.starts = [start for start, _ in self.ranges]
+
+    # Sub-ranges of a row range still to be processed
+    def uncovered(self, row_start, row_end):
+        gaps = []
+        i = max(bisect.bisect_right(self.starts, row_start) - 1, 0)
+        for done_start, done_end in self.ranges[i:]:
+            if done_start > row_end:
+                break
+            if done_start > row_start:
+                gaps.append((row_start, done_start - 1))
+            row_start = max(row_start, done_end + 1)
+        if row_start <= row_end:
+            gaps.append((row_start, row_end))
+        return gaps
+
+# Ledger path for an output file path prefix
+def manifest_path(file_path):
+    return f"{file_path}_run_manifest.sqlite"
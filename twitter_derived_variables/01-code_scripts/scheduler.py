@@ -0,0 +1,124 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+from get_profile_metadata import split_location
+
+#### ---- ADAPTIVE BATCH SCHEDULER ---- ###
+
+# Fixed --batch_size slices take very different times: a tweet without text skips every model, a long
+# one runs all seven plus LanguageTool, and each location level of a profile waits on the geocoder.
+# The scheduler estimates the cost of each row from cheap features, and cuts each chunk of input into
+# contiguous batches of equal estimated cost, so that batch ranges still suit the run manifest and
+# --resume. The seconds per unit of each feature start from rough priors and are refitted from the
+# times of the batches completed so far, so batches approach the target time as the run goes on.
+
+# Cheap features of each row, and prior seconds per unit of each
+COST_FEATURES = {
+    "tweet": ["rows", "texts", "text_chars", "referenced_tweets"],
+    "profile": ["rows", "descriptions", "description_chars", "location_tokens"],
+}
+PRIOR_SECONDS = {
+    "tweet": [0.001, 0.05, 0.0002, 0.001],
+    "profile": [0.005, 0.05, 0.0002, 1.0],  # Uncached Nominatim lookups take a second each
+}
+
+# Features of each row of a chunk; repeated texts and location tokens are only counted the first time,
+# as they are scored once per batch (or served from the feature and geocode caches)
+def row_features(df, function_type):
+    features = np.zeros((len(df), len(COST_FEATURES[function_type])))
+    features[:, 0] = 1
+    seen = set()
+
+    if function_type == "tweet":
+        rows = zip(df["created_at_x"].tolist(), df["tweet_text"].tolist(), df["referenced_tweet_type"].tolist())
+        for i, (created_at, text, referenced_type) in enumerate(rows):
+            if created_at is None:
+                continue  # Skipped by get_tweet_metadata
+            if text and isinstance(text, str) and text not in seen:
+                seen.add(text)
+                features[i, 1:3] = 1, len(text)
+            features[i, 3] = referenced_type is not None
+        return features
+
+    for i, (description, location) in enumerate(zip(df["description"].tolist(), df["location"].tolist())):
+        if description and isinstance(description, str) and description not in seen:
+            seen.add(description)
+            features[i, 1:3] = 1, len(description)
+        if location and isinstance(location, str):
+            tokens = [token for token in split_location(location) if ("location", token) not in seen]
+            seen.update(("location", token) for token in tokens)
+            features[i, 3] = len(tokens)
+    return features
+
+# Splits chunks of input into batches of about target_seconds each, learning from completed batches.
+# Batches are cut in the thread feeding the pool and timed in the main process, hence the lock.
+class AdaptiveScheduler:
+
+    def __init__(self, function_type, target_seconds, window=200, ridge=1e-3):
+        self.function_type = function_type
+        self.target_seconds = target_seconds
+        self.prior = np.array(PRIOR_SECONDS[function_type])
+        self.weights = self.prior.copy()
+        self.ridge = ridge  # Pull towards the priors, for features not seen enough yet
+        self.pending = {}  # {batch_range: feature totals}
+        self.observed = deque(maxlen=window)  # (feature totals, seconds) of recent batches
+        self.lock = threading.Lock()
+
+    # Contiguous (first, last) row ranges of equal estimated cost covering rows, whose first row is row_start
+    def split(self, rows, row_start):
+        features = row_features(rows, self.function_type)
+        with self.lock:
+            costs = features @ self.weights
+
+        # Cut where the running cost passes each multiple of the per-batch cost
+        total = costs.sum()
+        n_batches = min(len(rows), max(1, round(total / self.target_seconds)))
+        boundaries = total * np.arange(1, n_batches) / n_batches
+        ends = np.searchsorted(np.cumsum(costs), boundaries, side="left")
+        ends = sorted(set(ends.tolist()) | {len(rows) - 1})
+
+        ranges = []
+        start = 0
+        with self.lock:
+            for end in ends:
+                batch_range = (row_start + start, row_start + end)
+                self.pending[batch_range] = features[start:end + 1].sum(axis=0)
+                ranges.append(batch_range)
+                start = end + 1
+        return ranges
+
+    # Record how long a batch took (seconds None if it failed), and refit the seconds per feature
+    def observe(self, batch_range, seconds):
+        with self.lock:
+            features = self.pending.pop(tuple(batch_range), None)
+            if features is None or seconds is None:
+                return
+            self.observed.append((features, seconds))
+
+            # Ridge regression of batch times on feature totals, towards the priors. The penalty of each feature
+            # is scaled by its own sum of squares, so that large-valued features (e.g. text characters) do not
+            # hold the others at their priors.
+            # Features that come out negative (e.g. rows against texts, which mostly go together) are dropped
+            # and the rest refitted, rather than clipped, which would leave the fit off.
+            X = np.array([features for features, _ in self.observed])
+            y = np.array([seconds for _, seconds in self.observed])
+            gram = X.T @ X
+            penalty = self.ridge * np.maximum(np.diag(gram), 1e-12)
+            weights = np.zeros(len(self.prior))
+            active = np.arange(len(self.prior))
+            while len(active):
+                fitted = np.linalg.solve(gram[np.ix_(active, active)] + np.diag(penalty[active]),
+                                         X[:, active].T @ y + penalty[active] * self.prior[active])
+                if (fitted >= 0).all():
+                    weights[active] = fitted
+                    break
+                active = active[fitted >= 0]
+            self.weights = weights
+            self.weights[0] = max(self.weights[0], 1e-6)  # Every row costs something
+
+    # Current seconds per unit of each feature
+    def seconds_per_feature(self):
+        with self.lock:
+            return dict(zip(COST_FEATURES[self.function_type], self.weights.round(6).tolist()))
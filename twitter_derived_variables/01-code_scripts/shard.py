@@ -0,0 +1,52 @@
+import os
+import zlib
+
+import numpy as np
+
+from input_readers import count_input_rows, read_input_columns
+
+#### ---- SHARDED EXECUTION ---- ###
+
+# One run can be split over several nodes: each node runs derive_social_media_variables.py with
+# --shard i/N (i from 0 to N-1) and writes its own output and run manifest, under the prefix
+# {file_path}_shard_{i}_of_{N}; merge_shards.py then checks that the shards cover the input and
+# combines them. With --shard_by id, rows go to a node by a stable hash of their ID, so all the rows
+# of one ID are on the same node; with --shard_by range, each node takes a contiguous N-th of the rows.
+
+SHARD_BY = ["id", "range"]
+
+# Parse "i/N" as (i, N)
+def parse_shard(text):
+    index, count = (int(part) for part in text.split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index must be between 0 and {count - 1}: {text}")
+    return index, count
+
+# Output prefix of one shard
+def shard_path(file_path, shard):
+    index, count = shard
+    return f"{file_path}_shard_{index}_of_{count}"
+
+# Shard index of each ID (CRC-32 of its text, the same on every node and Python process)
+def id_shards(ids, count):
+    return np.array([zlib.crc32(str(value).encode("utf-8")) % count for value in ids], dtype=np.int64)
+
+# Whether each row of a DataFrame belongs to a shard (with --shard_by id)
+def in_shard(df, shard):
+    index, count = shard
+    return id_shards(df["ID"].tolist(), count) == index
+
+# Input rows [first, end) of a shard (with --shard_by range)
+def shard_row_range(total_rows, shard):
+    index, count = shard
+    return total_rows * index // count, total_rows * (index + 1) // count
+
+
+# Identity of an input file as each node sees it: its file name, size and row count. Nodes may read the
+# same input from different local paths, so merge_shards.py compares these rather than --input.
+def input_identity(path, total_rows=None):
+    if total_rows is None:
+        total_rows = count_input_rows(path)
+    if total_rows is None:
+        total_rows = len(read_input_columns(path, ["ID"]))
+    return {"name": os.path.basename(path), "size": os.path.getsize(path), "rows": total_rows}
\ No newline at end of file
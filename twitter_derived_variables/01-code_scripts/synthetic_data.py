@@ -0,0 +1,151 @@
+import argparse
+import random
+import pandas as pd
+
+#### ---- SYNTHETIC TWEETS AND PROFILES FOR BENCHMARKS ---- ###
+
+# Randomly generated rows with the same columns and types as the survey-linked exports read by
+# get_tweet_metadata and get_profile_metadata (missing values are None, as in the pickled exports).
+# Generation is seeded, so every run of a benchmark sees the same data.
+
+WORDS = ["the", "election", "vote", "today", "policy", "people", "government", "news", "big", "we",
+         "need", "change", "great", "country", "economy", "health", "campaign", "debate", "tonight",
+         "Teh", "is", "are", "not", "for", "and", "with", "this", "that", "support", "local", "council",
+         "London", "Manchester", "candidate", "party", "vote!", "really?", "WOW", "proud", "family"]
+HASHTAGS = ["#vote", "#GE2024", "#election", "#NHS", "#economy", "#breaking", "#MAGA"]
+EMOJIS = ["\U0001F600", "\U0001F44D", "\U0001F1FA\U0001F1F8", "\u2764\uFE0F", "\U0001F525"]
+SOURCES = ["Twitter for iPhone", "Twitter for Android", "Twitter Web App", "TweetDeck"]
+LANGUAGES = ["en", "en", "en", "en", "es", "fr", "und"]
+REPLY_SETTINGS = ["everyone", "everyone", "following", "mentionedUsers"]
+REFERENCED_TYPES = [None, None, "retweeted", "quoted", "replied_to"]
+NEWS_DOMAINS = ["https://www.bbc.co.uk", "https://www.theguardian.com", "https://www.foxnews.com",
+                "https://www.breitbart.com", "https://www.nytimes.com", "https://www.example-blog.com"]
+
+FIRST_NAMES = ["John", "Mary", "Ahmed", "Priya", "Chloe", "David", "Olu", "Sarah", "Tom", "Wei"]
+LAST_NAMES = ["Smith", "Jones", "Khan", "Patel", "Brown", "Williams", "Taylor", "Okafor", "Chen"]
+TITLES = ["", "", "", "Dr ", "Mr ", "Prof "]
+LOCATIONS = ["", "", "London", "London, UK", "Manchester, England", "New York, USA", "Paris/France",
+             "Earth", "somewhere over the rainbow", "Glasgow, Scotland, UK", "Cardiff"]
+
+def make_text(rng, max_words=40):
+    tokens = rng.choices(WORDS, k=rng.randint(3, max_words))
+    for extra, rate in [(HASHTAGS, 0.3), (EMOJIS, 0.3), ([f"@user{rng.randrange(1000)}"], 0.4),
+                        ([f"https://t.co/{rng.randrange(10 ** 6):x}"], 0.3)]:
+        if rng.random() < rate:
+            tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(extra))
+    return " ".join(tokens).capitalize() + rng.choice([".", "!", "?", ""])
+
+def make_timestamp(rng, year):
+    return f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randrange(60):02d}:00.000Z"
+
+# Tweets joined to their referenced tweets (the _x and _y columns); duplicate_rate is the share of
+# retweets repeating an earlier tweet's text, as in real collections
+def make_tweets(n, seed=0, duplicate_rate=0.3):
+    rng = random.Random(seed)
+    texts = []
+    records = []
+    for i in range(n):
+        referenced_type = rng.choice(REFERENCED_TYPES)
+
+        if referenced_type == "retweeted" and texts and rng.random() < duplicate_rate:
+            text = rng.choice(texts)
+        else:
+            text = make_text(rng)
+            if referenced_type == "retweeted":
+                text = f"RT @user{rng.randrange(1000)}: {text}"
+            texts.append(text)
+
+        urls = rng.sample(NEWS_DOMAINS, rng.choice([0, 0, 1, 2]))
+        entities_urls = None
+        if urls:
+            entities_urls = str([{"start": 0, "end": 23, "url": "https://t.co/x",
+                                  "expanded_url": f"{url}/news/{rng.randrange(10 ** 5)}"} for url in urls])
+
+        record = {
+            "ID": f"user{rng.randrange(max(1, n // 5))}",
+            "created_at_x": make_timestamp(rng, 2024),
+            "referenced_tweet_type": referenced_type,
+            "source_x": rng.choice(SOURCES),
+            "language_x": rng.choice(LANGUAGES),
+            "retweet_count_x": rng.randrange(50),
+            "reply_count_x": rng.randrange(10),
+            "like_count_x": rng.randrange(200),
+            "quote_count_x": rng.randrange(5),
+            "media_keys": str([f"3_{rng.randrange(10 ** 9)}"]) if rng.random() < 0.2 else None,
+            "geo_coordinates": str({"type": "Point", "coordinates": [-0.1, 51.5]}) if rng.random() < 0.02 else None,
+            "reply_settings_x": rng.choice(REPLY_SETTINGS),
+            "created_at_y": None, "source_y": None, "language_y": None,
+            "retweet_count_y": 0, "reply_count_y": 0, "like_count_y": 0, "quote_count_y": 0,
+            "entities_urls": entities_urls,
+            "tweet_text": text,
+        }
+        if referenced_type is not None:
+            record.update({
+                "created_at_y": make_timestamp(rng, 2023),
+                "source_y": rng.choice(SOURCES),
+                "language_y": rng.choice(LANGUAGES),
+                "retweet_count_y": rng.randrange(5000),
+                "reply_count_y": rng.randrange(500),
+                "like_count_y": rng.randrange(20000),
+                "quote_count_y": rng.randrange(200),
+            })
+        records.append(record)
+
+    return to_frame(records)
+
+# Profiles; duplicate_rate is the share of descriptions repeated from earlier profiles (re-collections)
+def make_profiles(n, seed=0, duplicate_rate=0.1):
+    rng = random.Random(seed)
+    descriptions = []
+    records = []
+    for i in range(n):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        display_name = rng.choice([f"{rng.choice(TITLES)}{first} {last}", f"{first} {last} {rng.choice(EMOJIS)}",
+                                   f"{first}{rng.randrange(100)}", f"#{rng.choice(WORDS)} {first}"])
+
+        if descriptions and rng.random() < duplicate_rate:
+            description = rng.choice(descriptions)
+        else:
+            description = make_text(rng, max_words=25) if rng.random() < 0.8 else ""
+            descriptions.append(description)
+
+        records.append({
+            "ID": f"user{i}",
+            "created_at": make_timestamp(rng, rng.randint(2008, 2023)),
+            "followers_count": rng.randrange(10000),
+            "following_count": rng.randrange(3000),
+            "tweet_count": rng.randrange(50000),
+            "listed_count": rng.randrange(50),
+            "display_name": display_name,
+            "screen_name": f"{first.lower()}{last.lower()}{rng.randrange(100)}",
+            "location": rng.choice(LOCATIONS),
+            "description": description,
+        })
+
+    return to_frame(records)
+
+# Keep text columns as objects, so that missing values stay None
+def to_frame(records):
+    df = pd.DataFrame(records)
+    for column in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = pd.Series([record[column] for record in records], dtype=object)
+    return df
+
+# MAIN ENTRY POINT: write a synthetic input file for derive_social_media_variables.py
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic tweets or profiles for benchmarks.")
+    parser.add_argument('--type', type=str, required=True, choices=["profile", "tweet"], help='Data type')
+    parser.add_argument('--rows', type=int, default=10000, help='Number of rows')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--output', type=str, required=True, help='Output path (.pkl or .parquet)')
+
+    args = parser.parse_args()
+
+    make = make_tweets if args.type == "tweet" else make_profiles
+    df = make(args.rows, seed=args.seed)
+    if args.output.endswith(".parquet"):
+        df.to_parquet(args.output, index=False)
+    else:
+        df.to_pickle(args.output)
+    print(f"[INFO] Wrote {len(df)} synthetic {args.type} rows to {args.output}")
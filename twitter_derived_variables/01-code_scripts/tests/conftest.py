@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# The scripts import each other by module name, and the stubs stand in for the TweetNLP models and LanguageTool
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs")
+sys.path[:0] = [STUBS_DIR, SCRIPTS_DIR]
+
+# Run one of the scripts in a fresh interpreter (with the stubs), failing the test on a non-zero exit
+@pytest.fixture
+def run_script(tmp_path):
+    def run(script, *args, check=True):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([STUBS_DIR, SCRIPTS_DIR]))
+        completed = subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, script), *map(str, args)],
+                                   cwd=tmp_path, env=env, capture_output=True, text=True, timeout=600)
+        if check and completed.returncode:
+            pytest.fail(f"{script} exited with code {completed.returncode}:\n{completed.stdout}\n{completed.stderr}")
+        return completed
+    return run
\ No newline at end of file
@@ -0,0 +1,17 @@
+# Stand-in for LanguageTool in tests: one error per misspelling and per sentence not starting with a capital
+
+MISSPELLINGS = {"teh", "recieve", "definately", "alot", "wierd"}
+
+class LanguageTool:
+
+    def __init__(self, language):
+        self.language = language
+
+    def check(self, text):
+        words = text.lower().split()
+        sentences = [sentence.strip() for sentence in text.replace("!", ".").replace("?", ".").split(".")]
+        return ([word for word in words if word in MISSPELLINGS] +
+                [sentence for sentence in sentences if sentence and sentence[0].islower()])
+
+    def close(self):
+        pass
\ No newline at end of file
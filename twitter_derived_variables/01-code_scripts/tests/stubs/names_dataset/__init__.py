@@ -0,0 +1,13 @@
+# Stand-in for the names dataset in tests: a few first and last names ranked in several countries
+
+COUNTRIES = ["GB", "US", "CA", "AU"]
+
+def ranked(names, countries):
+    return {name: {"rank": {country: (rank + 1 if country in countries else None) for country in COUNTRIES}}
+            for rank, name in enumerate(names)}
+
+class NameDataset:
+
+    def __init__(self):
+        self.first_names = {**ranked(["John", "Mary", "Sarah", "David"], COUNTRIES), **ranked(["Priya"], ["GB"])}
+        self.last_names = {**ranked(["Smith", "Jones", "Taylor"], COUNTRIES), **ranked(["Okafor"], ["US"])}
\ No newline at end of file
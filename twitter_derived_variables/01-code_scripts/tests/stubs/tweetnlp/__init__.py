@@ -0,0 +1,61 @@
+import zlib
+
+# Stand-in for the TweetNLP models in tests: labels and probabilities derived from a hash of the text,
+# accepting one text or a list of texts as the real models do
+
+LABELS = {
+    "sentiment": ["negative", "neutral", "positive"],
+    "irony": ["non_irony", "irony"],
+    "offensive": ["non-offensive", "offensive"],
+    "emotion": ["joy", "anger", "sadness", "optimism"],
+    "hate": ["NOT-HATE", "HATE"],
+}
+
+# Texts containing this make every model raise, so that tests can fail a batch
+FAIL_TEXT = "stub-model-failure"
+
+TOPICS = ["news_&_social_concern", "sports", "diaries_&_daily_life"]
+
+def text_hash(text):
+    return zlib.crc32(text.encode("utf-8"))
+
+def classify(labels, text):
+    h = text_hash(text)
+    label = labels[h % len(labels)]
+    p = 0.5 + (h % 500) / 1000
+    return {"label": label, "probability": {other: p if other == label else (1 - p) / (len(labels) - 1) for other in labels}}
+
+def topic(text):
+    h = text_hash(text)
+    return {"label": [TOPICS[h % len(TOPICS)]], "probability": {label: (0.9 if i == h % len(TOPICS) else 0.1)
+                                                               for i, label in enumerate(TOPICS)}}
+
+def ner(text):
+    return [{"type": "person", "entity": word, "probability": 0.8} for word in text.split() if word.istitle()][:3]
+
+class StubModel:
+
+    def __init__(self, name):
+        self.name = name
+
+    def predict(self, text):
+        if FAIL_TEXT in text:
+            raise RuntimeError("stub model failure")
+        if self.name == "topic_classification":
+            return topic(text)
+        if self.name == "ner":
+            return ner(text)
+        return classify(LABELS[self.name], text)
+
+    def run(self, text, batch_size=None, return_probability=True):
+        if isinstance(text, list):
+            return [self.predict(item) for item in text]
+        return self.predict(text)
+
+    topic = sentiment = irony = offensive = emotion = hate = run
+
+    def ner(self, text, batch_size=None, return_probability=True):
+        return self.run(text)
+
+def load_model(name):
+    return StubModel(name)
\ No newline at end of file
@@ -0,0 +1,27 @@
+import os
+
+from synthetic_data import make_profiles, make_tweets
+from test_gazetteer import GEONAMES
+
+# derive_combined.py on synthetic profiles and tweets (stub models, offline gazetteer)
+
+def run_combined(tmp_path, run_script, tweets):
+    make_profiles(20, seed=2).to_pickle(tmp_path / "profiles.pkl")
+    tweets.to_pickle(tmp_path / "tweets.pkl")
+    (tmp_path / "cities.txt").write_text("".join("\t".join(row) + "\n" for row in GEONAMES), encoding="utf-8")
+    return run_script("derive_combined.py", "--profile_input", "profiles.pkl", "--tweet_input", "tweets.pkl",
+                      "--file_path", "out", "--batch_size", "10", "--nproc", "2",
+                      "--geocoder", "gazetteer", "--gazetteer", "cities.txt")
+
+def test_summary_of_a_complete_run(tmp_path, run_script):
+    completed = run_combined(tmp_path, run_script, make_tweets(30, seed=2))
+    assert os.path.exists(tmp_path / "out_users.csv")
+    assert "[ERROR]" not in completed.stdout
+
+def test_no_summary_when_a_batch_failed(tmp_path, run_script):
+    tweets = make_tweets(30, seed=2)
+    tweets.loc[3, "tweet_text"] = "This tweet makes the stub-model-failure"
+    completed = run_combined(tmp_path, run_script, tweets)
+    assert not os.path.exists(tmp_path / "out_users.csv")
+    assert not os.path.exists(tmp_path / "out_users.pkl")
+    assert "[ERROR] Batches failed (1 tweet)" in completed.stdout
\ No newline at end of file
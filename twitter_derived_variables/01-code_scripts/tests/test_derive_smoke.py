@@ -0,0 +1,43 @@
+import glob
+
+import pandas as pd
+
+from synthetic_data import make_tweets
+
+# End-to-end runs of derive_social_media_variables.py on synthetic tweets (stub models)
+
+def test_tweets_csv(tmp_path, run_script):
+    make_tweets(60, seed=1).to_pickle(tmp_path / "tweets.pkl")
+    run_script("derive_social_media_variables.py", "--input", "tweets.pkl", "--type", "tweet",
+               "--file_path", "out", "--batch_size", "25", "--nproc", "2")
+
+    outputs = sorted(glob.glob(str(tmp_path / "out_rows_*.csv")))
+    assert len(outputs) == 3
+    df = pd.concat([pd.read_csv(path) for path in outputs])
+    assert len(df) > 0
+    assert {"ID", "post_type", "TEXT_sentiment", "TEXT_grammar_score"} <= set(df.columns)
+    assert not (tmp_path / "feature_cache.sqlite").exists()  # The feature cache is opt-in
+
+def test_tweets_parquet(tmp_path, run_script):
+    make_tweets(60, seed=1).to_pickle(tmp_path / "tweets.pkl")
+    run_script("derive_social_media_variables.py", "--input", "tweets.pkl", "--type", "tweet",
+               "--file_path", "out", "--batch_size", "25", "--nproc", "2", "--output_format", "parquet")
+
+    manifest = pd.read_json(tmp_path / "out_dataset" / "_manifest.json", typ="series")
+    assert manifest["status"] == "complete"
+    assert len(pd.read_parquet(tmp_path / "out_dataset")) == manifest["rows_written"] > 0
+
+def test_parquet_matches_csv(tmp_path, run_script):
+    make_tweets(60, seed=1).to_pickle(tmp_path / "tweets.pkl")
+    for output_format in ["csv", "parquet"]:
+        run_script("derive_social_media_variables.py", "--input", "tweets.pkl", "--type", "tweet", "--file_path", output_format,
+                   "--batch_size", "25", "--nproc", "1", "--output_format", output_format)
+
+    csv = pd.concat([pd.read_csv(path, float_precision="round_trip") for path in sorted(glob.glob(str(tmp_path / "csv_rows_*.csv")),
+                                                            key=lambda path: int(path.split("_rows_")[1].split("_")[0]))],
+                    ignore_index=True)
+    parquet = pd.read_parquet(tmp_path / "parquet_dataset")
+    columns = ["ID", "post_type", "created_date", "total_engagement", "TEXT_word_count", "TEXT_reading_ease",
+               "TEXT_sentiment", "TEXT_sentiment_prob", "TEXT_grammar_score"]
+    parquet["created_date"] = parquet["created_date"].astype(str)  # A date type in Parquet, text in CSV
+    pd.testing.assert_frame_equal(parquet[columns].reset_index(drop=True), csv[columns], check_dtype=False)
@@ -0,0 +1,29 @@
+import pickle
+
+from gazetteer import GazetteerGeocoder
+
+# A loaded gazetteer index travels with the geocoder to pool workers instead of being rebuilt there
+
+GEONAMES = [
+    ["2643743", "London", "London", "Londres,Londra", "51.50853", "-0.12574", "P", "PPLC", "GB", "", "ENG", "", "", "",
+     "8961989", "", "25", "Europe/London", "2023-01-01"],
+    ["6252001", "United States", "United States", "USA,America", "39.76", "-98.5", "A", "PCLI", "US", "", "00", "", "",
+     "", "327167434", "", "543", "America/Chicago", "2023-01-01"],
+]
+
+def test_loaded_index_is_pickled(tmp_path):
+    dump = tmp_path / "cities.txt"
+    dump.write_text("".join("\t".join(row) + "\n" for row in GEONAMES), encoding="utf-8")
+    geocoder = GazetteerGeocoder(str(dump))
+    geocoder.load()
+
+    dump.unlink()  # A worker that rebuilt the index would fail to read the dump
+    worker_geocoder = pickle.loads(pickle.dumps(geocoder))
+    assert worker_geocoder.index == geocoder.index
+    assert worker_geocoder.lookup("Londra")["name"] == "London"
+    assert worker_geocoder.lookup("Londn")["match"] == "fuzzy"
+
+def test_unloaded_geocoder_pickles_its_path(tmp_path):
+    worker_geocoder = pickle.loads(pickle.dumps(GazetteerGeocoder(str(tmp_path / "index.pkl"), fuzzy_cutoff=80)))
+    assert worker_geocoder.index is None
+    assert worker_geocoder.fuzzy_cutoff == 80
\ No newline at end of file
@@ -0,0 +1,22 @@
+import random
+
+from language_id import LangdetectIdentifier
+
+# langdetect is seeded through its own detector factory, not the process-global random
+
+TEXTS = ["This is a sentence in English about the weather today", "Ceci est une phrase en français", "12345"]
+
+def test_langdetect_is_repeatable_and_leaves_global_random_alone():
+    random.seed(1)
+    expected = random.random()
+    random.seed(1)
+    first = LangdetectIdentifier().identify_many(TEXTS)
+    assert random.random() == expected
+    assert LangdetectIdentifier().identify_many(TEXTS) == first
+    assert [language for language, _ in first[:2]] == ["en", "fr"]
+    assert first[2][1] is None  # No letters: langdetect's error message as the language
+
+def test_langdetect_leaves_the_shared_factory_unseeded():
+    from langdetect import DetectorFactory
+    LangdetectIdentifier(seed=5).identify_many(TEXTS)
+    assert DetectorFactory.seed is None
\ No newline at end of file
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from synthetic_data import make_tweets
+
+# Shards of a run merged by merge_shards.py, checked against the input
+
+def test_csv_ids_are_merged_unchanged(tmp_path, run_script):
+    tweets = make_tweets(40, seed=4)
+    # Numeric-looking IDs with leading zeros, and longer than a float or int64 holds
+    tweets["ID"] = [f"00{index % 7}" if index % 2 else f"1234567890123456789{index % 7:03d}" for index in range(len(tweets))]
+    tweets.to_pickle(tmp_path / "tweets.pkl")
+    for shard in ["0/2", "1/2"]:
+        run_script("derive_social_media_variables.py", "--input", "tweets.pkl", "--type", "tweet", "--file_path", "out",
+                   "--batch_size", "10", "--nproc", "1", "--shard", shard)
+
+    completed = run_script("merge_shards.py", "--file_path", "out", "--shards", "2", check=False)
+    assert completed.returncode == 0, completed.stdout
+
+    merged = pd.read_csv(tmp_path / "out_merged.csv", dtype=str, keep_default_na=False)
+    produced = tweets[tweets["created_at_x"].notna()]
+    assert sorted(merged["ID"]) == sorted(produced["ID"])  # Shards by ID hash, so rows are regrouped
\ No newline at end of file
@@ -0,0 +1,38 @@
+import os
+import pickle
+
+import pytest
+
+from resources import cached_resource, file_identity, resource_cache_path, set_resource_cache
+
+# Cached resource pickles are rebuilt when their source file or builder version changes
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    set_resource_cache(str(tmp_path / "cache"))
+    yield tmp_path / "cache"
+    set_resource_cache(None)
+
+def test_rebuilt_when_the_source_changes(tmp_path, cache_dir):
+    source = tmp_path / "table.csv"
+    source.write_text("a,b\n")
+    builds = []
+
+    def build():
+        builds.append(source.read_text())
+        return source.read_text()
+
+    assert cached_resource("table.pkl", build, [file_identity(str(source))], 1) == "a,b\n"
+    assert cached_resource("table.pkl", build, [file_identity(str(source))], 1) == "a,b\n"
+    assert len(builds) == 1
+
+    source.write_text("a,b,c\n")
+    assert cached_resource("table.pkl", build, [file_identity(str(source))], 1) == "a,b,c\n"
+    assert cached_resource("table.pkl", build, [file_identity(str(source))], 2) == "a,b,c\n"
+    assert len(builds) == 3
+
+def test_unversioned_pickle_is_rebuilt(cache_dir):
+    with open(resource_cache_path("names.pkl"), "wb") as f:
+        pickle.dump({"threshold": 3}, f)  # Written before cached pickles carried a key
+    assert cached_resource("names.pkl", lambda: {"threshold": 4}, ["names-dataset=3.1"], 1) == {"threshold": 4}
+    assert not [name for name in os.listdir(cache_dir) if name.endswith(".tmp")]
\ No newline at end of file
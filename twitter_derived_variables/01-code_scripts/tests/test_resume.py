@@ -0,0 +1,46 @@
+import glob
+import sqlite3
+
+from synthetic_data import make_tweets
+
+# --resume: only batches the run manifest does not record as done are rerun, and only against the same input
+
+def run_tweets(run_script, *args, check=True):
+    return run_script("derive_social_media_variables.py", "--input", "tweets.pkl", "--type", "tweet",
+                      "--file_path", "out", "--batch_size", "25", "--nproc", "1", *args, check=check)
+
+def test_resume_reruns_only_unfinished_batches(tmp_path, run_script):
+    make_tweets(60, seed=1).to_pickle(tmp_path / "tweets.pkl")
+    run_tweets(run_script)
+
+    # As if the run had stopped before writing the batch of rows 25 to 49
+    with sqlite3.connect(tmp_path / "out_run_manifest.sqlite") as conn:
+        conn.execute("UPDATE batches SET status = 'failed' WHERE row_start = 25")
+    for path in glob.glob(str(tmp_path / "out_rows_25_*.csv")):
+        (tmp_path / path).unlink()
+    written = {path: (tmp_path / path).stat().st_mtime_ns for path in glob.glob(str(tmp_path / "out_rows_*.csv"))}
+
+    run_tweets(run_script, "--resume")
+
+    outputs = glob.glob(str(tmp_path / "out_rows_*.csv"))
+    assert len(outputs) == 3
+    assert {path: (tmp_path / path).stat().st_mtime_ns for path in written} == written
+    with sqlite3.connect(tmp_path / "out_run_manifest.sqlite") as conn:
+        assert {status for status, in conn.execute("SELECT status FROM batches")} == {"done"}
+
+def test_resume_refuses_another_input(tmp_path, run_script):
+    make_tweets(60, seed=1).to_pickle(tmp_path / "tweets.pkl")
+    run_tweets(run_script)
+
+    make_tweets(80, seed=2).to_pickle(tmp_path / "tweets.pkl")
+    completed = run_tweets(run_script, "--resume", check=False)
+    assert completed.returncode == 2
+    assert "input_identity" in completed.stderr
+
+def test_resume_refuses_another_start_row(tmp_path, run_script):
+    make_tweets(60, seed=1).to_pickle(tmp_path / "tweets.pkl")
+    run_tweets(run_script)
+
+    completed = run_tweets(run_script, "--resume", "--start_row", "10", check=False)
+    assert completed.returncode == 2
+    assert "start_row" in completed.stderr
\ No newline at end of file
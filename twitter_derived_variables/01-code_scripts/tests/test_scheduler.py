@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from scheduler import AdaptiveScheduler, row_features
+from synthetic_data import make_tweets
+
+# Batch times simulated from known seconds per feature, below and above the priors
+# (rows, texts, text_chars, referenced_tweets; the priors are 0.001, 0.05, 0.0002, 0.001)
+TRUE_SECONDS = {
+    "below the priors": np.array([0.0002, 0.004, 0.00002, 0.0005]),
+    "above the priors": np.array([0.002, 0.2, 0.0004, 0.002]),
+}
+
+def simulate(df, target_seconds, true_seconds, chunk_rows=200):
+    scheduler = AdaptiveScheduler("tweet", target_seconds)
+    batch_seconds = []
+    for start in range(0, len(df), chunk_rows):
+        for first, last in scheduler.split(df.iloc[start:start + chunk_rows], start):
+            seconds = float(row_features(df.iloc[first:last + 1], "tweet").sum(axis=0) @ true_seconds)
+            scheduler.observe((first, last), seconds)
+            batch_seconds.append(seconds)
+    return batch_seconds
+
+@pytest.mark.parametrize("costs", TRUE_SECONDS)
+def test_batches_converge_to_target(costs):
+    df = make_tweets(3000, seed=2)
+    target_seconds = 0.05 if costs == "below the priors" else 1.0
+    batch_seconds = simulate(df, target_seconds, TRUE_SECONDS[costs])
+    assert np.mean(batch_seconds[-50:]) == pytest.approx(target_seconds, rel=0.2)
+
+def test_contiguous_ranges_cover_the_chunk():
+    df = make_tweets(500, seed=3)
+    ranges = AdaptiveScheduler("tweet", 0.05).split(df.iloc[100:400], 100)
+    assert ranges[0][0] == 100 and ranges[-1][1] == 399
+    assert all(next_first == last + 1 for (_, last), (next_first, _) in zip(ranges, ranges[1:]))
\ No newline at end of file
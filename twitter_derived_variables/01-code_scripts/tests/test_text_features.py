@@ -0,0 +1,35 @@
+import pytest
+
+import text_counts
+from synthetic_data import make_profiles, make_tweets
+from get_tweet_metadata import get_tweet_metadata_batch
+from get_tweet_text_features import add_batch_text_features, language_feature_version, load_tnlp_models
+from text_analysis_functions import strip_text
+
+# Language features and their cache keys
+
+def stripped_texts():
+    texts = make_tweets(150, seed=6)["tweet_text"].tolist() + make_profiles(100, seed=6)["description"].tolist()
+    texts += ["Hi.", "One two. Three four five! Six seven eight nine ten eleven? Twelve.", "x" * 300]
+    return [text for text in (strip_text(value) for value in texts if isinstance(value, str)) if text.strip()]
+
+def test_feature_version_names_the_grammar_mode():
+    local = language_feature_version()
+    assert local == language_feature_version(grammar_servers=0, grammar_batch_chars=20000)  # Batching needs servers
+    unbatched = language_feature_version(grammar_servers=2)
+    batched = language_feature_version(grammar_servers=2, grammar_batch_chars=20000)
+    assert len({local, unbatched, batched}) == 3
+
+def test_batched_tweetnlp_matches_per_text():
+    tweets = make_tweets(60, seed=7)
+    tnlp_models = load_tnlp_models()
+    per_text = get_tweet_metadata_batch(tweets, tnlp_models)
+    deferred = get_tweet_metadata_batch(tweets, None)  # Texts left for the batch-level stage
+    assert add_batch_text_features(deferred, tnlp_models, batch_size=8) == per_text
+
+@pytest.mark.skipif(not text_counts.use_fused_counts(), reason="textstat version not reproduced by text_counts")
+def test_fused_counts_match_textstat(monkeypatch):
+    texts = stripped_texts()
+    fused = text_counts.text_counts_many(texts)
+    monkeypatch.setattr(text_counts, "_fused", False)  # Every count from textstat itself
+    assert fused == text_counts.text_counts_many(texts)
\ No newline at end of file
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from synthetic_data import make_tweets
+from get_tweet_metadata import get_tweet_metadata, get_tweet_metadata_batch
+from get_tweet_text_features import load_tnlp_models
+
+# get_tweet_metadata_batch (column-wise) gives the rows get_tweet_metadata gives one by one
+
+def per_row(tweets, tnlp_models):
+    return tweets.apply(get_tweet_metadata, axis=1, args=(tnlp_models,)).tolist()
+
+def test_column_wise_rows_match_per_row():
+    tweets = make_tweets(80, seed=5)
+    tweets.loc[3, "created_at_x"] = None  # Skipped
+    tweets.loc[11, "tweet_text"] = "https://t.co/abc @someone"  # Nothing left once stripped
+    tnlp_models = load_tnlp_models()
+    expected = per_row(tweets, tnlp_models)
+    assert get_tweet_metadata_batch(tweets, tnlp_models) == expected
+    assert expected[3] is None
+
+def test_rows_get_tweet_metadata_rejects_still_raise():
+    tweets = make_tweets(20, seed=5)
+    tweets.loc[7, "like_count_x"] = np.nan  # Left to get_tweet_metadata, which cannot count its engagement
+    tnlp_models = load_tnlp_models()
+    with pytest.raises(ValueError):
+        per_row(tweets, tnlp_models)
+    with pytest.raises(ValueError):
+        get_tweet_metadata_batch(tweets, tnlp_models)
\ No newline at end of file
@@ -0,0 +1,11 @@
+from url_bias_checker import get_mbfc, url_bias_check, url_bias_check_batch
+
+# The per-tweet lookup (domain dict) and the batch lookup (domain index) give the same scores
+
+def test_batch_matches_per_tweet():
+    rated = get_mbfc()["table"]["url"].tolist()[:3]
+    url_lists = [[rated[0], "https://www.example.com/a", rated[0]], [], [rated[1], rated[2]], ["https://unrated.org/"]]
+    results = url_bias_check_batch(url_lists)
+    assert results == [url_bias_check(urls) for urls in url_lists]
+    assert len(results[0]["bias"]) == 2  # Repeated links are scored each time
+    assert results[3] == {"bias": [], "credibility": []}
\ No newline at end of file
@@ -1,8 +1,11 @@
 
 # Modules 
 import emoji
+import functools
 import re
 
+from instrumentation import profiled
+
 # Global singleton variable for LanguageTool
 _tool_instance = None
 
@@ -13,6 +16,27 @@ def get_tool():
         _tool_instance = language_tool_python.LanguageTool('en-US')
     return _tool_instance
 
+# Count grammar errors in each text, using the shared LanguageTool servers if configured
+# (see grammar_service), otherwise this process's own LanguageTool
+@profiled("grammar")
+def count_grammar_errors(texts):
+    from grammar_service import get_grammar_client
+    client = get_grammar_client()
+    if client is not None:
+        return client.count_errors(texts)
+    tool = get_tool()
+    return [len(tool.check(text)) for text in texts]
+
+# Grammar score from the number of errors
+def score_grammar_errors(post_text_stripped, num_errors):
+
+    # Count words
+    total_words = len(post_text_stripped.split())
+
+    # Calculate grammar score
+    score = max(0, 100 * (1 - num_errors / total_words))  # Ensure score is not negative
+    return round(score, 2)
+
 # Calculate grammaticality score using LanguageTool
 def grammar_score(post_text_stripped):
 
@@ -20,37 +44,58 @@ def grammar_score(post_text_stripped):
     if not post_text_stripped.strip():
         return "N/A"
     
-    # Initialise language tool
-    tool = get_tool()
-
     # Check grammar errors
-    matches = tool.check(post_text_stripped)
-    num_errors = len(matches)
+    num_errors = count_grammar_errors([post_text_stripped])[0]
 
-    # Count words
-    total_words = len(post_text_stripped.split())
+    return score_grammar_errors(post_text_stripped, num_errors)
 
-    # Calculate grammar score
-    score = max(0, 100 * (1 - num_errors / total_words))  # Ensure score is not negative
-    return round(score, 2)
+# Calculate grammaticality scores for a list of texts at once
+def grammar_scores(post_texts_stripped):
+    scores = ["N/A"] * len(post_texts_stripped)
+    checked = [i for i, text in enumerate(post_texts_stripped) if text.strip()]
+    error_counts = count_grammar_errors([post_texts_stripped[i] for i in checked])
+    for i, num_errors in zip(checked, error_counts):
+        scores[i] = score_grammar_errors(post_texts_stripped[i], num_errors)
+    return scores
+
+# Patterns removed by strip_text (in this order, after URLs and before whitespace)
+URL_PATTERN = re.compile(r"http[s]?://\S+")
+HASHTAG_PATTERN = re.compile(r"#\S+")
+MENTION_PATTERN = re.compile(r"@\S+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# Non-ASCII characters found in emojis (every emoji has at least one)
+@functools.lru_cache(maxsize=None)
+def emoji_characters():
+    return frozenset(character for emoji_text in emoji.EMOJI_DATA for character in emoji_text if not character.isascii())
+
+# Whether a text might contain an emoji (False means that it certainly does not)
+def may_contain_emoji(text):
+    return not text.isascii() and not emoji_characters().isdisjoint(text)
+
+# Number of emojis (without scanning texts that cannot contain any)
+def count_emojis(text):
+    return emoji.emoji_count(text) if may_contain_emoji(text) else 0
 
 # Strip out URLS, emojis, hashtags, @mentions, extra whitespace
+@profiled("strip_text")
 def strip_text(text):
     # Remove URLs
-    text_without_urls = re.sub(r"http[s]?://\S+", "", text)
+    text_without_urls = URL_PATTERN.sub("", text)
     # Remove emojis
-    text_without_emojis = emoji.replace_emoji(text_without_urls, replace="")
+    if may_contain_emoji(text_without_urls):
+        text_without_emojis = emoji.replace_emoji(text_without_urls, replace="")
+    else:
+        text_without_emojis = text_without_urls
     # Remove hashtags
-    text_without_hashtags = re.sub(r"#\S+", "", text_without_emojis)
+    text_without_hashtags = HASHTAG_PATTERN.sub("", text_without_emojis)
     # Remove @mentions
-    text_without_mentions = re.sub(r"@\S+", "", text_without_hashtags)
+    text_without_mentions = MENTION_PATTERN.sub("", text_without_hashtags)
     # Remove extra whitespace
-    text_without_whitespace = re.sub(r"\s+", " ", text_without_mentions).strip()
+    text_without_whitespace = WHITESPACE_PATTERN.sub(" ", text_without_mentions).strip()
     # Return stripped text
     return text_without_whitespace
 
 # Count the number of capitalised characters
 def count_capitals(text):
-    capital_letters = [char for char in text if char.isupper()]
-    capital_count = len(capital_letters)
-    return capital_count
\ No newline at end of file
+    return sum(map(str.isupper, text))
\ No newline at end of file
@@ -0,0 +1,242 @@
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+
+import textstat as ts
+
+from text_analysis_functions import strip_text, count_capitals, count_emojis, URL_PATTERN
+
+#### ---- SINGLE-PASS TEXT COUNTS ---- ###
+
+# The character, word, syllable and readability counts of get_language_features from one tokenisation of
+# the (stripped) text, with precompiled patterns and syllables counted once per distinct word. textstat
+# re-tokenises the text in every counter and formula, and its caches only hold the last 128 texts.
+# The formulas below are textstat's own (versions 0.7.3 to 0.7.5, English), including its rounding, so the
+# numbers are the same; with any other textstat version the counts are taken from textstat directly.
+FUSED_TEXTSTAT_VERSIONS = {"0.7.3", "0.7.4", "0.7.5"}
+
+PUNCTUATION = re.compile(r"[^\w\s]")  # As removed by textstat (apostrophes included)
+WHITESPACE = re.compile(r"\s")
+NON_WORD_CHARACTER = re.compile(r"[^\w]")
+SENTENCE = re.compile(r"\b[^.!?]+[.!?]*", re.UNICODE)
+DIFFICULT_WORD_CANDIDATE = re.compile(r"[\w\='‘’]+")
+HASHTAG = re.compile(r"#\w+")
+MENTION = re.compile(r"@\w+")
+
+# Minimum syllables of a difficult word in the Gunning fog index (textstat's "syllable_threshold" for English)
+FOG_SYLLABLE_THRESHOLD = 3
+
+# GLOBAL VARIABLE shared in each process (but not across them)
+_fused = None
+
+# Whether the installed textstat is one whose counts are reproduced here
+def use_fused_counts():
+    global _fused
+    if _fused is None:
+        from importlib import metadata
+        try:
+            _fused = metadata.version("textstat") in FUSED_TEXTSTAT_VERSIONS
+        except metadata.PackageNotFoundError:
+            _fused = False
+    return _fused
+
+# Dale-Chall easy words, as loaded by textstat
+@lru_cache(maxsize=None)
+def easy_words():
+    from importlib import resources
+    text = resources.files("textstat").joinpath("resources/en/easy_words.txt").read_bytes().decode("utf-8")
+    return {line.strip() for line in text.splitlines()}
+
+# textstat's rounding (half away from zero)
+def legacy_round(number, points=0):
+    p = 10 ** points
+    return float(math.floor((number * p) + math.copysign(0.5, number))) / p
+
+# Syllables of one lower-case word without punctuation (cmudict first in textstat 0.7.5, otherwise pyphen)
+@lru_cache(maxsize=100000)
+def word_syllables(word):
+    cmu_dict = getattr(ts.textstat, "cmu_dict", None)
+    if cmu_dict is not None:
+        phones = cmu_dict.get(word)
+        if phones:
+            return sum(1 for phone in phones[0] if phone[-1].isdigit())
+    return len(ts.textstat.pyphen.positions(word)) + 1
+
+# Syllables of a token, as textstat counts them for a text made of that token
+@lru_cache(maxsize=100000)
+def token_syllables(token):
+    return sum(word_syllables(word) for word in PUNCTUATION.sub("", token.lower()).split())
+
+# Sentences with more than two words (at least 1)
+def count_sentences(text):
+    sentences = SENTENCE.findall(text)
+    ignored = sum(1 for sentence in sentences if len(PUNCTUATION.sub("", sentence).split()) <= 2)
+    return max(1, len(sentences) - ignored)
+
+# Stripped text, and the counts of get_tweet_text_features taken from the unstripped text (in the same order)
+def surface_counts(text):
+
+    text_stripped = strip_text(text)
+    counts = {
+        "post_length": len(text),  # Length of post (unstripped)
+        "exclamation_count": text_stripped.count("!"),  # Exclamation marks
+        "question_mark_count": text_stripped.count("?"),  # Question marks
+        "hashtag_count": len(HASHTAG.findall(text)),  # Hashtags
+        "emoji_count": count_emojis(text),  # Emojis
+        "mentions_count": len(MENTION.findall(text)),  # @Mentions
+        "url_count": len(URL_PATTERN.findall(text)),  # URLs
+    }
+    return text_stripped, counts
+
+# Character and word counts (the first variables of get_language_features, also used for display names)
+def word_counts(text):
+
+    if not use_fused_counts():
+        character_count = ts.char_count(text)
+        capt_character_count = count_capitals(text)
+        return {"character_count": character_count,
+                "capt_character_count": capt_character_count,
+                "capt_character_prop": round(capt_character_count / character_count, 3),
+                "letter_count": ts.letter_count(text),
+                "word_count": ts.lexicon_count(text),
+                "unique_word_count": len(set(text.lower().split()))}
+
+    character_count = len(text) - len(WHITESPACE.findall(text))
+    capt_character_count = count_capitals(text)
+    return {"character_count": character_count,
+            "capt_character_count": capt_character_count,
+            "capt_character_prop": round(capt_character_count / character_count, 3),
+            "letter_count": len(NON_WORD_CHARACTER.sub("", text)),
+            "word_count": len(PUNCTUATION.sub("", text).split()),
+            "unique_word_count": len(set(text.lower().split()))}
+
+# All the counts of get_language_features for one stripped (non-empty) text, in the same order
+def text_counts(text):
+
+    counts = word_counts(text)
+
+    if not use_fused_counts():
+        counts.update({
+            "sentence_count": ts.sentence_count(text),
+            "syllable_count": ts.syllable_count(text),
+            "monosyllable_count": ts.monosyllabcount(text),
+            "polysyllable_count": ts.polysyllabcount(text),
+            "grammar_score": None,
+            "reading_ease": ts.flesch_reading_ease(text),
+            "non_eng_reading_ease": ts.mcalpine_eflaw(text),
+            "reading_grade": ts.text_standard(text, float_output=True),
+        })
+        return counts
+
+    # One tokenisation: words without punctuation, their lower-case forms, and the raw tokens
+    words = PUNCTUATION.sub("", text).split()
+    tokens = text.split()
+    n_words = len(words)
+    n_letters = counts["letter_count"]
+    n_characters = counts["character_count"]
+    n_sentences = count_sentences(text)
+    n_syllables = sum(word_syllables(word) for word in PUNCTUATION.sub("", text.lower()).split())
+    n_monosyllables = sum(1 for word in words if token_syllables(word) < 2)
+    n_polysyllables = sum(1 for token in tokens if token_syllables(token) >= 3)
+    n_miniwords = sum(1 for word in words if len(word) <= 3)
+
+    # Difficult words: not on the Dale-Chall list (any syllables), and also with 3+ syllables (Gunning fog)
+    candidates = set(DIFFICULT_WORD_CANDIDATE.findall(text.lower())) - easy_words()
+    n_difficult = len(candidates)
+    n_fog_difficult = sum(1 for word in candidates if token_syllables(word) >= FOG_SYLLABLE_THRESHOLD)
+
+    # Average sentence length and syllables per word
+    sentence_length = legacy_round(float(n_words / n_sentences), 1)
+    syllables_per_word = legacy_round(float(n_syllables) / float(n_words), 1) if n_words else 0.0
+
+    # Flesch reading ease and Flesch-Kincaid grade
+    reading_ease = legacy_round(206.835 - float(1.015 * sentence_length) - float(84.6 * syllables_per_word), 2)
+    kincaid_grade = legacy_round(float(0.39 * sentence_length) + float(11.8 * syllables_per_word) - 15.59, 1)
+
+    # SMOG index
+    smog = 0.0
+    if n_sentences >= 3:
+        smog = legacy_round((1.043 * (30 * (n_polysyllables / n_sentences)) ** .5) + 3.1291, 1)
+
+    # Coleman-Liau index
+    letters_per_word = legacy_round(float(n_letters / n_words), 2) if n_words else 0.0
+    sentences_per_word = legacy_round(float(n_sentences / n_words), 2) if n_words else 0.0
+    coleman_liau = legacy_round(float((0.058 * legacy_round(letters_per_word * 100, 2)) -
+                                      (0.296 * legacy_round(sentences_per_word * 100, 2)) - 15.8), 2)
+
+    # Automated readability index
+    readability_index = 0.0
+    if n_words:
+        readability_index = legacy_round((4.71 * legacy_round(float(n_characters) / float(n_words), 2)) +
+                                         (0.5 * legacy_round(float(n_words) / float(n_sentences), 2)) - 21.43, 1)
+
+    # Dale-Chall readability score
+    dale_chall = 0.0
+    if n_words:
+        per_difficult_words = 100 - float(n_words - n_difficult) / float(n_words) * 100
+        dale_chall = (0.1579 * per_difficult_words) + (0.0496 * sentence_length)
+        if per_difficult_words > 5:
+            dale_chall += 3.6365
+        dale_chall = legacy_round(dale_chall, 2)
+
+    # Linsear Write formula (first 100 tokens)
+    first_tokens = tokens[:100]
+    n_hard_tokens = sum(1 for token in first_tokens if token_syllables(token) >= 3)
+    first_text = " ".join(first_tokens)
+    linsear_sentences = n_sentences if first_text == text else count_sentences(first_text)
+    linsear_write = float((len(first_tokens) - n_hard_tokens + n_hard_tokens * 3) / linsear_sentences)
+    if linsear_write <= 20:
+        linsear_write -= 2
+    linsear_write = linsear_write / 2
+
+    # Gunning fog index
+    gunning_fog = 0.0
+    if n_words:
+        gunning_fog = legacy_round(0.4 * (sentence_length + n_fog_difficult / n_words * 100), 2)
+
+    counts.update({
+        "sentence_count": n_sentences,
+        "syllable_count": n_syllables,
+        "monosyllable_count": n_monosyllables,
+        "polysyllable_count": n_polysyllables,
+        "grammar_score": None,
+        "reading_ease": reading_ease,
+        "non_eng_reading_ease": legacy_round((n_words + n_miniwords) / n_sentences, 1) if text else 0.0,
+        "reading_grade": reading_grade(kincaid_grade, reading_ease, smog, coleman_liau, readability_index,
+                                       dale_chall, linsear_write, gunning_fog),
+    })
+    return counts
+
+# Counts for a list of stripped texts (syllables of words shared between texts are counted once)
+def text_counts_many(texts):
+    return [text_counts(text) for text in texts]
+
+# textstat's readability consensus (text_standard with float_output)
+def reading_grade(kincaid_grade, reading_ease, smog, coleman_liau, readability_index, dale_chall, linsear_write,
+                  gunning_fog):
+    grade = [int(legacy_round(kincaid_grade)), int(math.ceil(kincaid_grade))]
+
+    if 90 <= reading_ease < 100:
+        grade.append(5)
+    elif 80 <= reading_ease < 90:
+        grade.append(6)
+    elif 70 <= reading_ease < 80:
+        grade.append(7)
+    elif 60 <= reading_ease < 70:
+        grade.append(8)
+        grade.append(9)
+    elif 50 <= reading_ease < 60:
+        grade.append(10)
+    elif 40 <= reading_ease < 50:
+        grade.append(11)
+    elif 30 <= reading_ease < 40:
+        grade.append(12)
+    else:
+        grade.append(13)
+
+    for score in [smog, coleman_liau, readability_index, dale_chall, linsear_write, gunning_fog]:
+        grade.append(int(legacy_round(score)))
+        grade.append(int(math.ceil(score)))
+
+    return float(Counter(grade).most_common(1)[0][0])
@@ -0,0 +1,144 @@
+import os
+
+from instrumentation import profiled
+
+#### ---- TWEETNLP INFERENCE BACKENDS ---- ###
+
+# By default the seven TweetNLP models run as full-precision PyTorch models (load_tnlp_models with no
+# backend). The ONNX Runtime backend exports each model's network to ONNX once, optionally with dynamic
+# int8 quantisation of its weights, and swaps it in for the PyTorch forward pass. TweetNLP's own
+# preprocessing, tokenizers, label maps and NER decoding are kept, so the outputs have the same form and
+# differ only by the numerical precision of the network (see compare_tnlp_backends.py for the drift).
+
+TNLP_BACKENDS = ["torch", "onnx", "onnx_int8"]
+
+# Output of an ONNX forward pass, read as output.logits (classifiers) or output["logits"] (NER)
+class ONNXOutput(dict):
+
+    @property
+    def logits(self):
+        return self["logits"]
+
+# Stands in for a TweetNLP model's PyTorch network
+class ONNXForward:
+
+    def __init__(self, session, config):
+        self.session = session
+        self.config = config  # Read by TweetNLP's NER for its CRF layer
+        self.input_names = [model_input.name for model_input in session.get_inputs()]
+
+    @profiled("tnlp.onnx")
+    def __call__(self, **inputs):
+        import torch
+        logits = self.session.run(["logits"], {name: inputs[name].numpy() for name in self.input_names})[0]
+        return ONNXOutput(logits=torch.from_numpy(logits))
+
+    # Called by TweetNLP's constructors on the network
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+# Stands in for TweetNLP's loader (tweetnlp.util.load_model) while a model is built on an ONNX session:
+# only its config and tokenizer are read, and no PyTorch network is loaded
+def onnx_loader(session):
+    def load_model(model, task="sequence_classification", **kwargs):
+        from transformers import AutoConfig, AutoTokenizer
+        config = AutoConfig.from_pretrained(model)
+        return config, AutoTokenizer.from_pretrained(model), ONNXForward(session, config)
+    return load_model
+
+# Export a TweetNLP model's network to ONNX, with dynamic batch and sequence axes
+def export_onnx_model(tnlp_model, path):
+    import torch
+
+    network = tnlp_model.model
+    network.config.return_dict = False  # Trace a (logits,) tuple
+    sample = tnlp_model.tokenizer(["An example tweet to trace the model with"], return_tensors="pt")
+    input_names = [name for name in ["input_ids", "attention_mask", "token_type_ids"] if name in sample]
+    with torch.no_grad():
+        token_logits = network(**sample)[0].dim() == 3  # NER tags every token
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch", 1: "sequence"} if token_logits else {0: "batch"}
+    temp_path = f"{path}.tmp"
+    torch.onnx.export(network, tuple(sample[name] for name in input_names), temp_path, input_names=input_names,
+                      output_names=["logits"], dynamic_axes=dynamic_axes, opset_version=14)
+    os.replace(temp_path, path)
+
+# ONNX Runtime backend. Models are exported to model_dir on first use (in the main process, see export());
+# each process then opens its own sessions with intra-op threads set so that the workers share the cores.
+class ONNXBackend:
+
+    def __init__(self, model_dir, quantize=True, threads=1):
+        self.model_dir = model_dir
+        self.quantize = quantize
+        self.threads = threads
+
+    @property
+    def name(self):
+        return "onnx_int8" if self.quantize else "onnx"
+
+    def model_path(self, model_name, precision):
+        return os.path.join(self.model_dir, f"{model_name}.{precision}.onnx")
+
+    def session_path(self, model_name):
+        return self.model_path(model_name, "int8" if self.quantize else "fp32")
+
+    # Export (and quantise) any model not yet in model_dir
+    def export(self):
+        from get_tweet_text_features import TNLP_MODEL_NAMES
+        missing = [name for name in TNLP_MODEL_NAMES if not os.path.exists(self.session_path(name))]
+        if not missing:
+            return
+        import tweetnlp as tnlp
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        os.makedirs(self.model_dir, exist_ok=True)
+        for name in missing:
+            fp32_path = self.model_path(name, "fp32")
+            if not os.path.exists(fp32_path):
+                export_onnx_model(tnlp.load_model(name), fp32_path)
+            if self.quantize:
+                int8_path = self.model_path(name, "int8")
+                quantize_dynamic(fp32_path, f"{int8_path}.tmp", weight_type=QuantType.QInt8)
+                os.replace(f"{int8_path}.tmp", int8_path)
+
+    def session(self, model_name):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return ort.InferenceSession(self.session_path(model_name), options, providers=["CPUExecutionProvider"])
+
+    # The TweetNLP models (for their preprocessing, tokenizers and label maps) built with ONNX sessions in
+    # place of their networks, so the PyTorch weights are never loaded (tnlp.load_model is only used to export)
+    def load(self):
+        import tweetnlp as tnlp
+        import tweetnlp.text_classification.model as classifiers
+        import tweetnlp.ner.model as ner
+        from get_tweet_text_features import TNLP_MODEL_NAMES
+        self.export()
+        models = []
+        loaders = classifiers.load_model, ner.load_model
+        try:
+            for name in TNLP_MODEL_NAMES:
+                classifiers.load_model = ner.load_model = onnx_loader(self.session(name))
+                models.append(tnlp.load_model(name))
+        finally:
+            classifiers.load_model, ner.load_model = loaders
+        return models
+
+    # Package versions the outputs depend on, for feature cache keys
+    def version(self):
+        from importlib import metadata
+        return f"{self.name}(onnxruntime={metadata.version('onnxruntime')})"
+
+# Build the TweetNLP backend for a run (None for PyTorch; picklable, so it can be sent to pool workers)
+def make_tnlp_backend(backend="torch", model_dir="tnlp_onnx", threads=1):
+    if backend == "torch":
+        return None
+    return ONNXBackend(model_dir, quantize=backend == "onnx_int8", threads=threads)
\ No newline at end of file
@@ -0,0 +1,137 @@
+import os
+import queue
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+from instrumentation import profiled
+from get_tweet_text_features import load_tnlp_models, run_tnlp_models
+
+#### ---- TWEETNLP MODEL SERVER ---- ###
+
+# Serve the TweetNLP models from one process so that pool workers do not each hold their own copy.
+# Workers connect over a local socket and send lists of stripped texts; requests waiting in the
+# queue are coalesced into a single model call, so small batches from several workers share one pass.
+
+# Client used by pool workers in place of the list of loaded models
+class TNLPClient:
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+        self.conn = Client(address, authkey=authkey)
+
+    @profiled("tnlp.server")
+    def run(self, texts, batch_size=None):
+        self.conn.send((list(texts), batch_size))
+        status, result = self.conn.recv()
+        if status == "error":
+            raise RuntimeError(f"TweetNLP model server: {result}")
+        return result
+
+    # Re-connect after unpickling (connections cannot be sent between processes)
+    def __getstate__(self):
+        return {"address": self.address, "authkey": self.authkey}
+
+    def __setstate__(self, state):
+        self.__init__(state["address"], state["authkey"])
+
+# Server process entry point
+def serve_models(authkey, ready_queue, batch_size=None, tnlp_backend=None):
+
+    # Load models ONCE for all workers, reporting a failure back instead of leaving the parent waiting
+    try:
+        tnlp_models = load_tnlp_models(tnlp_backend)
+    except Exception as e:
+        ready_queue.put(("error", f"{type(e).__name__}: {str(e)}"))
+        return
+
+    requests = queue.Queue()
+    listener = Listener(("localhost", 0), authkey=authkey)
+
+    # Receive requests from one worker connection
+    def handle(conn):
+        try:
+            while True:
+                request = conn.recv()
+                if request is None:
+                    requests.put(None)  # Shutdown sentinel
+                    return
+                requests.put((conn, request))
+        except (EOFError, OSError):
+            conn.close()
+
+    # Accept worker connections
+    def accept():
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    ready_queue.put(("ok", listener.address))
+
+    # Inference loop
+    while True:
+        pending = [requests.get()]
+        while True:
+            try:
+                pending.append(requests.get_nowait())
+            except queue.Empty:
+                break
+
+        shutdown = None in pending
+        pending = [item for item in pending if item is not None]
+
+        if pending:
+            texts = [text for _, (request_texts, _) in pending for text in request_texts]
+            request_batch_size = pending[0][1][1] or batch_size
+            try:
+                outputs = run_tnlp_models(texts, tnlp_models, batch_size=request_batch_size)
+            except Exception as e:
+                for conn, _ in pending:
+                    conn.send(("error", f"{type(e).__name__}: {str(e)}"))
+            else:
+                # Split the coalesced outputs back per request
+                position = 0
+                for conn, (request_texts, _) in pending:
+                    conn.send(("ok", outputs[position:position + len(request_texts)]))
+                    position += len(request_texts)
+
+        if shutdown:
+            listener.close()
+            return
+
+# Start the server and wait until the models are loaded; raises if loading fails or the server dies
+def start_model_server(batch_size=None, tnlp_backend=None, poll_seconds=1.0):
+    authkey = os.urandom(16)
+    ready_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_models, args=(authkey, ready_queue, batch_size, tnlp_backend),
+                                      daemon=True)
+    process.start()
+    while True:
+        try:
+            status, result = ready_queue.get(timeout=poll_seconds)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                # The server may have reported just before exiting
+                try:
+                    status, result = ready_queue.get(timeout=poll_seconds)
+                    break
+                except queue.Empty:
+                    raise RuntimeError(f"TweetNLP model server exited with code {process.exitcode} before loading the models")
+    if status == "error":
+        process.join()
+        raise RuntimeError(f"TweetNLP model server failed to load the models: {result}")
+    return process, result, authkey
+
+# Ask the server to finish outstanding requests and exit
+def stop_model_server(process, address, authkey):
+    if process.is_alive():
+        conn = Client(address, authkey=authkey)
+        conn.send(None)
+        conn.close()
+        process.join()
\ No newline at end of file
@@ -1,39 +1,94 @@
+import os
 import tldextract as tlde
+import numpy as np
 import pandas as pd
+from functools import lru_cache
 
-# Load the MBFC dataset
-mbfc = pd.read_csv('media-bias-scrubbed-results.csv')
+from resources import cached_resource, file_identity
+from instrumentation import profiled
 
-# Convert credibility ratings to numerical values
-mbfc['factual_reporting_rating'] = mbfc['factual_reporting_rating'].map({'MIXED': -1, 'HIGH': 0, "VERY HIGH": 1})
+MBFC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media-bias-scrubbed-results.csv')
 
-# Extract domain level from URL
-mbfc['domain'] = mbfc['url'].apply(lambda x: tlde.extract(x).domain)
+# Version of what load_mbfc builds; bump it when that changes, so cached copies are rebuilt
+MBFC_INDEX_VERSION = 2
 
-# Caculate mean values where domains have been duplicated 
-mbfc['bias_mean'] = mbfc.groupby('domain')['bias_rating'].transform('mean')
-mbfc['factual_reporting_mean'] = mbfc.groupby('domain')['factual_reporting_rating'].transform('mean')
+# GLOBAL VARIABLE: MBFC table and indexes, loaded on first use
+_mbfc = None
 
-# Drop duplicates
-mbfc = mbfc.drop_duplicates(subset='domain', keep='first')
+# Load the MBFC dataset and build the domain indexes
+def load_mbfc():
 
-# Function
-def url_bias_check(urls):
+    mbfc = pd.read_csv(MBFC_PATH)
+
+    # Convert credibility ratings to numerical values
+    mbfc['factual_reporting_rating'] = mbfc['factual_reporting_rating'].map({'MIXED': -1, 'HIGH': 0, "VERY HIGH": 1})
 
     # Extract domain level from URL
-    domains = [tlde.extract(url).domain for url in urls]
+    mbfc['domain'] = mbfc['url'].apply(lambda x: tlde.extract(x).domain)
 
-    # Find matches in the MBFC dataframe
-    matches = mbfc[mbfc['domain'].isin(domains)]  # Filter for matches
+    # Caculate mean values where domains have been duplicated 
+    mbfc['bias_mean'] = mbfc.groupby('domain')['bias_rating'].transform('mean')
+    mbfc['factual_reporting_mean'] = mbfc.groupby('domain')['factual_reporting_rating'].transform('mean')
 
-    # Extract bias rating and factual credibility
-    bias = matches['bias_mean'].tolist()
-    credibility = matches['factual_reporting_mean'].tolist()
+    # Drop duplicates
+    mbfc = mbfc.drop_duplicates(subset='domain', keep='first')
 
-    # Create a dictionary to store the results
-    results = {
-        'bias': bias,
-        'credibility': credibility
+    return {
+        "table": mbfc,
+        # Precomputed index: domain -> (bias_mean, factual_reporting_mean), for one tweet's URLs
+        "index": dict(zip(mbfc['domain'], zip(mbfc['bias_mean'], mbfc['factual_reporting_mean']))),
+        # Array form of the same index, for the URLs of a whole batch at once
+        "domains": pd.Index(mbfc['domain']),
+        "bias": mbfc['bias_mean'].tolist(),
+        "credibility": mbfc['factual_reporting_mean'].tolist(),
     }
 
-    return results  # Return matched rows
\ No newline at end of file
+# Return the MBFC table and indexes (from the prebuilt pickle in the resource cache, if it was built from
+# the current CSV by the current load_mbfc)
+def get_mbfc():
+    global _mbfc
+    if _mbfc is None:
+        _mbfc = cached_resource("mbfc.pkl", load_mbfc, [file_identity(MBFC_PATH)], MBFC_INDEX_VERSION)
+    return _mbfc
+
+# Extract domain level from URL (cached, since the same links are shared many times)
+@lru_cache(maxsize=100000)
+def extract_domain(url):
+    return tlde.extract(url).domain
+
+# Function: matched scores of one tweet's URLs, in URL order
+@profiled("url_bias")
+def url_bias_check(urls):
+
+    mbfc_index = get_mbfc()["index"]
+
+    # Look up each URL's domain, keeping URL order and repeated URLs
+    matches = [mbfc_index[domain] for domain in map(extract_domain, urls) if domain in mbfc_index]
+
+    return {
+        'bias': [bias for bias, _ in matches],
+        'credibility': [credibility for _, credibility in matches]
+    }
+
+# Batch function: resolve the URL lists of a whole chunk in one pass (None entries give no matches)
+@profiled("url_bias")
+def url_bias_check_batch(url_lists):
+
+    mbfc = get_mbfc()
+
+    # Flatten, remembering which list each URL came from
+    url_lists = [urls or [] for urls in url_lists]
+    urls = [url for urls in url_lists for url in urls]
+    owners = np.repeat(np.arange(len(url_lists)), [len(urls) for urls in url_lists])
+
+    # Extract each URL's domain (cached), then find every domain's row in the index at once
+    positions = mbfc["domains"].get_indexer([extract_domain(url) for url in urls])
+    matched = positions >= 0
+
+    # Regroup matches per list, in URL order
+    results = [{'bias': [], 'credibility': []} for _ in url_lists]
+    for owner, position in zip(owners[matched].tolist(), positions[matched].tolist()):
+        results[owner]['bias'].append(mbfc["bias"][position])
+        results[owner]['credibility'].append(mbfc["credibility"][position])
+
+    return results
@@ -0,0 +1,156 @@
+import argparse
+import math
+import numbers
+import pickle
+from collections import Counter
+
+import pandas as pd
+
+#### ---- PER-USER AGGREGATES ---- ###
+
+# Running aggregates of the row-level variables for each ID: row counts, means and label distributions.
+# The accumulators merge in any order, so each worker aggregates its own batches and the main process
+# merges them as they complete; the accumulators of separate runs (e.g. shards) merge the same way.
+
+# Variables averaged per ID (booleans as shares; every element of a list, e.g. the MBFC bias of each URL)
+MEAN_VARIABLES = {
+    "profile": ["followers_count", "following_count", "tweet_count", "listed_count"],
+    "tweet": ["retweet_count", "reply_count", "like_count", "quote_count", "total_engagement", "contains_media",
+              "contains_geotag", "TEXT_url_mbfc_matches", "TEXT_url_mbfc_bias", "TEXT_url_mbfc_credibility",
+              "TEXT_word_count", "TEXT_grammar_score", "TEXT_reading_ease", "TEXT_sentiment_prob"],
+}
+
+# Variables whose labels are counted per ID (every label of a list, e.g. the topics of a tweet)
+LABEL_VARIABLES = {
+    "profile": ["DS_language"],
+    "tweet": ["post_type", "post_language", "TEXT_sentiment", "TEXT_emotion", "TEXT_irony", "TEXT_offensive",
+              "TEXT_hate", "TEXT_topics"],
+}
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+# Numbers in a value (none for missing values, or error messages in place of a number)
+def numeric_values(value):
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return [float(item) for item in values if isinstance(item, numbers.Real) and not is_missing(item)]
+
+# Labels in a value, or None if it is missing
+def label_values(value):
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    return None if is_missing(value) else [str(value)]
+
+class UserAggregates:
+
+    def __init__(self):
+        # ID -> {"rows": Counter of rows by type, "sums": {variable: [sum, count]},
+        #        "labels": {variable: [rows with a value, Counter of labels]}}
+        self.users = {}
+
+    def user(self, user_id):
+        return self.users.setdefault(str(user_id), {"rows": Counter(), "sums": {}, "labels": {}})
+
+    # Add one output row of a data type ("profile" or "tweet")
+    def add_row(self, function_type, row):
+        user = self.user(row["ID"])
+        user["rows"][function_type] += 1
+        for name in MEAN_VARIABLES[function_type]:
+            values = numeric_values(row.get(name))
+            if values:
+                total = user["sums"].setdefault(name, [0.0, 0])
+                total[0] += sum(values)
+                total[1] += len(values)
+        for name in LABEL_VARIABLES[function_type]:
+            labels = label_values(row.get(name))
+            if labels is not None:
+                counts = user["labels"].setdefault(name, [0, Counter()])
+                counts[0] += 1
+                counts[1].update(labels)
+
+    # Aggregates of a batch of output rows (None for skipped rows)
+    @classmethod
+    def from_rows(cls, function_type, rows):
+        aggregates = cls()
+        for row in rows:
+            if row:
+                aggregates.add_row(function_type, row)
+        return aggregates
+
+    def merge(self, other):
+        for user_id, other_user in other.users.items():
+            user = self.user(user_id)
+            user["rows"].update(other_user["rows"])
+            for name, (value_sum, count) in other_user["sums"].items():
+                total = user["sums"].setdefault(name, [0.0, 0])
+                total[0] += value_sum
+                total[1] += count
+            for name, (rows, labels) in other_user["labels"].items():
+                counts = user["labels"].setdefault(name, [0, Counter()])
+                counts[0] += rows
+                counts[1].update(labels)
+        return self
+
+    def __len__(self):
+        return len(self.users)
+
+    # One row per ID: rows of each type, mean_{variable} and share_{variable}_{label} (the share of the ID's
+    # rows with a value that have the label)
+    def summary(self):
+        all_labels = {}
+        for user in self.users.values():
+            for name, (_, labels) in user["labels"].items():
+                all_labels.setdefault(name, set()).update(labels)
+
+        records = []
+        for user_id, user in sorted(self.users.items()):
+            record = {"ID": user_id}
+            record.update({f"{function_type}_rows": user["rows"][function_type] for function_type in MEAN_VARIABLES})
+            for function_type in MEAN_VARIABLES:
+                for name in MEAN_VARIABLES[function_type]:
+                    value_sum, count = user["sums"].get(name, (0.0, 0))
+                    record[f"mean_{name}"] = value_sum / count if count else None
+            for name, (rows, labels) in user["labels"].items():
+                record.update({f"share_{name}_{label}": labels[label] / rows for label in all_labels[name]})
+            records.append(record)
+
+        df = pd.DataFrame(records)
+        if df.empty:
+            return df
+        # Label shares grouped by variable, in label order
+        fixed = [column for column in df.columns if not column.startswith("share_")]
+        return df[fixed + sorted(column for column in df.columns if column.startswith("share_"))]
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            pickle.dump(self.users, f)
+
+    @classmethod
+    def load(cls, path):
+        aggregates = cls()
+        with open(path, "rb") as f:
+            aggregates.users = pickle.load(f)
+        return aggregates
+
+# Write the summary table as CSV, or as Parquet for a .parquet path
+def write_summary(aggregates, path):
+    df = aggregates.summary()
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return df
+
+# MAIN ENTRY POINT: merge the saved aggregates of several runs (e.g. shards) into one summary table
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merge saved per-user aggregates and write the user-level summary.")
+    parser.add_argument('aggregates', nargs='+', help='Saved aggregates ({file_path}_users.pkl) of each run')
+    parser.add_argument('--output', type=str, required=True, help='Summary table (.csv or .parquet)')
+
+    args = parser.parse_args()
+
+    merged = UserAggregates()
+    for path in args.aggregates:
+        merged.merge(UserAggregates.load(path))
+    write_summary(merged, args.output)
+    print(f"[INFO] Wrote the summary of {len(merged)} IDs to {args.output}")
\ No newline at end of file